@@ -0,0 +1,65 @@
+"""
+Measures how long a fresh interpreter takes to import the headless core,
+i.e. what every evolution or self-play pool worker pays on start.
+Fails if the import pulls in Tk.
+
+    python benchmarks/import_time.py [--runs N] [--modules a,b]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ['reversi.game', 'reversi.ai_player',
+                   'reversi.ai_player.evolution']
+
+_PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+duration = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': duration,
+    'tk_loaded': any(m in sys.modules for m in ('tkinter', 'Tkinter')),
+}}))
+'''
+
+
+def measure(modules, runs):
+    samples = []
+    tk_loaded = False
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _PROBE.format(modules=modules)],
+            cwd=ROOT,
+        )
+        data = json.loads(output.decode())
+        samples.append(data['seconds'])
+        tk_loaded = tk_loaded or data['tk_loaded']
+    return samples, tk_loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--modules', default=','.join(DEFAULT_MODULES))
+    args = parser.parse_args(argv)
+
+    modules = args.modules.split(',')
+    samples, tk_loaded = measure(modules, args.runs)
+    samples.sort()
+    print('import {}: min {:.1f} ms, median {:.1f} ms over {} runs'.format(
+        ', '.join(modules), 1000 * samples[0],
+        1000 * samples[len(samples) // 2], len(samples)))
+    if tk_loaded:
+        print('ERROR: Tk was imported by the headless modules')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
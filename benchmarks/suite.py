@@ -0,0 +1,273 @@
+"""
+Component benchmarks of the engine and the AI.
+
+    python benchmarks/suite.py run [--save FILE] [--only a,b] [--repeat N]
+    python benchmarks/suite.py compare BASELINE [--threshold 0.1]
+
+`run` prints the results and optionally saves them as a JSON baseline.
+`compare` runs the suite again and reports every benchmark that became
+slower than the baseline by more than `threshold` (a ratio), as well
+as changed work counts, e.g. perft leaves or alpha-beta nodes,
+which mean the behaviour changed, not only the speed.
+It exits with 1 if anything was flagged.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reversi.game import Reversi, Player, load_from_text_file  # noqa: E402
+from reversi import ai_player  # noqa: E402
+
+
+POSITIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'positions')
+
+
+def load_positions():
+    """name -> game for the standard position set, plus the initial one"""
+    positions = {'new': Reversi.New()}
+    for filename in sorted(os.listdir(POSITIONS_DIR)):
+        if filename.endswith('.txt'):
+            positions[filename[:-len('.txt')]] = load_from_text_file(
+                os.path.join(POSITIONS_DIR, filename))
+    return positions
+
+
+def perft(game, depth):
+    """
+    Number of move sequences of the given length.
+    Passes are made by the engine itself, so they aren't counted as moves;
+    a finished game counts as a single leaf.
+    """
+    if depth == 0 or game.is_game_over:
+        return 1
+    leaves = 0
+    for move in game.get_possible_moves():
+        next_game = game.copy()
+        next_game.make_move(*move)
+        leaves += perft(next_game, depth - 1)
+    return leaves
+
+
+def bench_perft(positions):
+    depths = {'new': 4, 'opening': 3, 'midgame': 3, 'endgame': 3}
+    results = {}
+    for name, depth in depths.items():
+        game = positions[name]
+        results['perft/{}/{}'.format(name, depth)] = _timed(
+            lambda game=game, depth=depth: perft(game, depth))
+    return results
+
+
+def bench_make_move(positions, count=500):
+    results = {}
+    for name in ['new', 'midgame']:
+        game = positions[name]
+        moves = sorted(game.get_possible_moves())
+
+        def run(game=game, moves=moves):
+            for idx in range(count):
+                next_game = game.copy()
+                next_game.make_move(*moves[idx % len(moves)])
+            return count
+        results['make_move+copy/{}'.format(name)] = _timed(run)
+    return results
+
+
+def bench_heuristics(positions):
+    # name -> (function, calls), sized to run for about 0.1 s
+    heuristics = {
+        'material': (ai_player.material_advantage_estimation(1.5), 10000),
+        'positional': (
+            ai_player.positional_advantage_estimation(5, 2, 0.5), 1000),
+        'win_state': (ai_player.win_state_utility, 100000),
+    }
+    games = [positions[name] for name in ['opening', 'midgame', 'endgame']]
+    results = {}
+    for name, (estimate, count) in heuristics.items():
+        def run(estimate=estimate, count=count):
+            for idx in range(count):
+                estimate(games[idx % len(games)], Player.Black)
+            return count
+        results['heuristic/{}'.format(name)] = _timed(run)
+    return results
+
+
+def bench_alpha_beta(positions, depth=4):
+    results = {}
+    for name in ['new', 'opening', 'midgame', 'endgame']:
+        game = positions[name]
+        ai = ai_player.material_advantage_ai(game.current_player, depth, 1.5)
+
+        def run(ai=ai, game=game):
+            ai(game)
+            return ai.nodes_searched
+        results['alpha_beta/{}/{}'.format(name, depth)] = _timed(run)
+    return results
+
+
+def bench_self_play(positions, depth=2):
+    def run():
+        game = Reversi.New()
+        ais = {
+            Player.Black: ai_player.material_advantage_ai(
+                Player.Black, depth, 1.5),
+            Player.White: ai_player.positional_advantage_ai(
+                Player.White, depth, 5, 2, 0.5),
+        }
+        moves = 0
+        while not game.is_game_over:
+            game.make_move(*ais[game.current_player](game)[0])
+            moves += 1
+        return moves
+    return {'self_play/{}'.format(depth): _timed(run)}
+
+
+def bench_board_sizes(positions, sizes=(6, 8, 10, 12, 16), games=5):
+    results = {}
+    estimate = ai_player.positional_advantage_estimation(5, 2, 0.5)
+    for size in sizes:
+        def play(size=size):
+            # the same seeded games every run, so the move count is
+            # a work count
+            rng = random.Random(size)
+            moves = 0
+            for _ in range(games):
+                game = Reversi.New(size)
+                while not game.is_game_over:
+                    game.make_move(*rng.choice(
+                        sorted(game.get_possible_moves())))
+                    moves += 1
+            return moves
+        results['board_size/random_games/{}'.format(size)] = _timed(play)
+
+        rng = random.Random(size)
+        game = Reversi.New(size)
+        for _ in range(size * size // 2 - 2):
+            if game.is_game_over:
+                break
+            game.make_move(*rng.choice(sorted(game.get_possible_moves())))
+
+        def evaluate(game=game, count=200):
+            for _ in range(count):
+                estimate(game, Player.Black)
+            return count
+        results['board_size/positional/{}'.format(size)] = _timed(evaluate)
+    return results
+
+
+BENCHMARKS = {
+    'perft': bench_perft,
+    'make_move': bench_make_move,
+    'heuristics': bench_heuristics,
+    'alpha_beta': bench_alpha_beta,
+    'self_play': bench_self_play,
+    'board_sizes': bench_board_sizes,
+}
+
+# set by main()
+_repeat = 5
+
+
+def _timed(func):
+    """Best of `_repeat` runs; func returns its count of work items"""
+    best, count = None, None
+    for _ in range(_repeat):
+        start = time.perf_counter()
+        count = func()
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return {'seconds': best, 'count': count, 'rate': count / best}
+
+
+def run_suite(names=None):
+    positions = load_positions()
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results.update(bench(positions))
+    return results
+
+
+def compare(baseline, results, threshold):
+    """Returns a list of (name, message) for regressions and changes"""
+    flagged = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['count'] != base['count']:
+            flagged.append((name, 'work count changed: {} -> {}'.format(
+                base['count'], result['count'])))
+            # timings of different work aren't comparable
+            continue
+        ratio = result['seconds'] / base['seconds']
+        if ratio > 1 + threshold:
+            flagged.append((name, '{:.0%} slower'.format(ratio - 1)))
+    return flagged
+
+
+def print_results(results, baseline=None):
+    print('{:<30} {:>10} {:>10} {:>12} {:>8}'.format(
+        'benchmark', 'seconds', 'count', 'per second', 'change'))
+    for name, result in sorted(results.items()):
+        change = ''
+        if baseline and name in baseline:
+            change = '{:+.0%}'.format(
+                result['seconds'] / baseline[name]['seconds'] - 1)
+        print('{:<30} {:>10.4f} {:>10} {:>12.1f} {:>8}'.format(
+            name, result['seconds'], result['count'], result['rate'], change))
+
+
+def main(argv=None):
+    global _repeat
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--save', help='write results to this JSON file')
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='allowed slowdown ratio')
+    for sub in [run_parser, compare_parser]:
+        sub.add_argument('--only', help='comma separated benchmark groups: '
+                                        + ', '.join(BENCHMARKS))
+        sub.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    _repeat = args.repeat
+    names = args.only.split(',') if args.only else None
+    results = run_suite(names)
+
+    if args.command == 'run':
+        print_results(results)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'results': results,
+                }, f, indent=2, sort_keys=True)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    print_results(results, baseline)
+    flagged = compare(baseline, results, args.threshold)
+    for name, message in flagged:
+        print('REGRESSION {}: {}'.format(name, message))
+    if flagged:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
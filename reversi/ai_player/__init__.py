@@ -1,3 +1,3 @@
-from .alpha_beta import alpha_beta_ai
+from .alpha_beta import alpha_beta_ai, SearchProgress, AnalysisLine
 from .heuristics import *
 from .ready_to_go import *
@@ -1,30 +1,309 @@
+import math
+import time
+import collections
+from ..records import position_to_masks
+from .endgame import count_empty
+
+
+SearchProgress = collections.namedtuple(
+    'SearchProgress', 'depth best_move nodes nodes_per_second')
+
+# a root move of the analysis: its value and plan, which starts with it
+AnalysisLine = collections.namedtuple('AnalysisLine', 'move value plan')
+
+# the clock is looked at once per this many nodes (a power of two)
+PROGRESS_CHECK_NODES = 64
+PROGRESS_INTERVAL = 0.25
+
+
+class _SearchTimeout(Exception):
+    pass
 
 
 def alpha_beta_ai(player, max_depth, estimate_utility, utility,
-                  order_moves_traverse=None):
+                  order_moves_traverse=None, endgame_cache=None,
+                  time_manager=None, probcut=None):
+    """
+    endgame_cache, an EndgameCache, replaces the search of positions
+    with few empty cells by their exact results when the search would
+    reach the end of the game. These are values
+    of heuristics.win_state_utility, so use it with that utility.
+
+    With time_manager, a TimeManager, the search deepens iteratively
+    up to max_depth as long as the time manager allows, and the move
+    of the last finished iteration is made.
+
+    probcut, a probcut.ProbCut fitted for this estimate_utility, prunes
+    nodes whose deep search value a shallow search predicts to be
+    outside the window, see there. The search isn't exact any more,
+    so the analysis doesn't use it, nor do games of another board size
+    than the one it was fitted on.
+
+    The returned function also has analyze(game, k) and
+    search_value(game, max_depth), see there. After a move its
+    last_value is the value of the search; value_scale, the larger
+    of 1 and the `value_bound` attribute of estimate_utility, if any,
+    scales the values of different heuristics to about [-1, 1].
+    """
     if callable(max_depth):
         get_max_depth = max_depth
     else:
         get_max_depth = None
+    nodes_searched = 0
+    # progress reporting state of the current search
+    on_progress_ = None
+    root_best_move = None
+    search_depth = None
+    # nodes at this depth and deeper are covered by endgame_cache
+    cache_depth = None
+    # probcut applies to the board of the current search
+    use_probcut = False
+    # the search is stopped after this time.monotonic() value
+    deadline = None
+    # transposition table of the analysis, see probe()
+    table = None
+    start_time = last_report_time = 0
+    # utility is at most 1 as well
+    value_scale = max(1, getattr(estimate_utility, 'value_bound', 1))
 
-    def alpha_beta_decide(game):
+    def alpha_beta_decide(game, on_progress=None, time_left=None):
+        """
+        on_progress, if given, is called with SearchProgress
+        at most every PROGRESS_INTERVAL seconds during the search.
+        time_left is the player's clock as the harness sees it,
+        used with a time manager.
+        """
+        nonlocal nodes_searched, on_progress_, root_best_move, deadline
+        nonlocal start_time, last_report_time
+        nodes_searched = 0
         if get_max_depth:
             max_depth_ = get_max_depth(game, player)
         else:
             max_depth_ = max_depth
         assert max_depth_ > 0
-        _, plan = max_value(game, 0, float('-Inf'), float('Inf'), max_depth_)
+        on_progress_ = on_progress
+        root_best_move = None
+        start_time = last_report_time = time.monotonic()
+        try:
+            if time_manager is None:
+                value, plan = search(game, max_depth_)
+            else:
+                value, plan = search_iteratively(game, max_depth_, time_left)
+        finally:
+            on_progress_ = None
+            deadline = None
+        # the evolution harness uses these as a machine-independent cost
+        # and as the AI's own opinion about the game result
+        alpha_beta_decide.nodes_searched = nodes_searched
+        alpha_beta_decide.last_value = value
         return plan
 
+    def search(game, max_depth_):
+        start_search(game, max_depth_)
+        return max_value(game, 0, float('-Inf'), float('Inf'), max_depth_)
+
+    def start_search(game, max_depth_):
+        nonlocal search_depth, cache_depth, use_probcut
+        search_depth = max_depth_
+        cache_depth = None
+        use_probcut = probcut is not None and \
+            probcut.board_size == game.size
+        if endgame_cache is not None and \
+                endgame_cache.board_size == game.size:
+            empties = count_empty(game)
+            # only if the search reaches the end of the game anyway,
+            # the exact results are what it would find, just faster;
+            # every move fills a cell, the root itself is searched
+            # to get a move
+            if empties <= max_depth_:
+                cache_depth = max(1, empties - endgame_cache.max_empties)
+
+    def search_value(game, max_depth_):
+        """
+        Value of the game for the player, with either side to move,
+        searched to max_depth_; used to calibrate ProbCut
+        """
+        nonlocal nodes_searched
+        nodes_searched = 0
+        start_search(game, max_depth_)
+        func = max_value if game.current_player == player else min_value
+        value, _ = func(game, 0, float('-Inf'), float('Inf'), max_depth_)
+        search_value.nodes_searched = nodes_searched
+        return value
+
+    def search_iteratively(game, max_depth_, time_left):
+        nonlocal deadline
+        hard_deadline = time_manager.start_move(game, time_left)
+        empties = count_empty(game)
+        result = None
+        depth = 0
+        while True:
+            depth += 1
+            try:
+                result = search(game, depth)
+            except _SearchTimeout:
+                break
+            # the first iteration is always finished to have a move
+            deadline = hard_deadline
+            # deeper searches than to the end of the game are the same
+            if depth >= max_depth_ or depth >= empties or \
+                    not time_manager.should_deepen(result[1][0]):
+                break
+        time_manager.end_move()
+        return result
+
+    def analyze(game, k=3):
+        """
+        The k best moves of the current player with their values and
+        plans, as AnalysisLine, best first. The values are the same
+        as a search of every move to max depth would give, but it's
+        one search: it deepens iteratively, ordering the root moves
+        by the previous iteration, and searches every root move with
+        a window just below the k-th best value so far, so the worse
+        moves are refuted cheaply. A transposition table shares bounds
+        and best moves between the root moves and the iterations.
+        """
+        nonlocal nodes_searched, table
+        assert game.current_player == player
+        nodes_searched = 0
+        if get_max_depth:
+            max_depth_ = get_max_depth(game, player)
+        else:
+            max_depth_ = max_depth
+        assert max_depth_ > 0
+        moves = game.get_possible_moves()
+        if order_moves_traverse:
+            moves = order_moves_traverse(game, moves, player)
+        moves = list(moves)
+        table = {}
+        try:
+            depth = 0
+            while depth < max_depth_:
+                depth = min(depth + 1, max_depth_)
+                lines = analyze_root(game, moves, k, depth)
+                moves = [line.move for line in lines]
+        finally:
+            table = None
+        analyze.nodes_searched = nodes_searched
+        return lines[:k]
+
+    def analyze_root(game, moves, k, max_depth_):
+        start_search(game, max_depth_)
+        lines = []
+        values = []
+        for move in moves:
+            # values equal to the k-th best one are exact yet
+            alpha = float('-Inf')
+            if len(values) >= k:
+                alpha = math.nextafter(values[k-1], float('-Inf'))
+            next_game = game.copy()
+            next_game.make_move(*move)
+            if next_game.current_player == player:
+                func = max_value
+            else:
+                func = min_value
+            value, plan = func(next_game, 1, alpha, float('Inf'), max_depth_)
+            lines.append(AnalysisLine(move, value, [move] + plan))
+            values.append(value)
+            values.sort(reverse=True)
+        # the moves which failed low are below the final k-th value;
+        # ties keep the order of the search
+        lines.sort(key=lambda line: line.value, reverse=True)
+        return lines
+
+    def probe(game, depth, alpha, beta, max_depth_):
+        """
+        Looks the node up in the transposition table:
+        -> (key, (value, plan) if the entry decides the node, best move)
+        """
+        key = position_to_masks(game)
+        entry = table.get(key)
+        if entry is None:
+            return key, None, None
+        entry_max_depth, entry_depth, lower, upper, plan = entry
+        # only values of the same search to the same depth are the same,
+        # the best move of any search is good for the move ordering
+        if entry_max_depth == max_depth_ and entry_depth == depth:
+            if lower == upper or lower >= beta:
+                return key, (lower, plan), plan[0]
+            if upper <= alpha:
+                return key, (upper, plan), plan[0]
+        return key, None, plan[0]
+
+    def store(key, depth, alpha, beta, max_depth_, value, plan):
+        # fail-soft values outside the window are bounds
+        lower = value if value > alpha else float('-Inf')
+        upper = value if value < beta else float('Inf')
+        table[key] = (max_depth_, depth, lower, upper, plan)
+
+    def check_clock():
+        nonlocal last_report_time
+        now = time.monotonic()
+        if deadline is not None and now > deadline:
+            raise _SearchTimeout()
+        if not on_progress_ or now - last_report_time < PROGRESS_INTERVAL:
+            return
+        last_report_time = now
+        on_progress_(SearchProgress(
+            search_depth, root_best_move, nodes_searched,
+            nodes_searched / (now - start_time),
+        ))
+
+    def probcut_value(func, game, depth, alpha, beta, max_depth_):
+        """
+        (bound, plan) if a shallow search of the node shows that
+        its deep value is outside the window, otherwise None
+        """
+        for shallow, a, b, sigma in probcut.cuts(game, max_depth_ - depth):
+            margin = probcut.threshold * sigma
+            # deep >= beta is likely when a * shallow + b >= beta + margin
+            if beta != float('Inf'):
+                bound = (beta + margin - b) / a
+                value, plan = func(game, depth, math.nextafter(
+                    bound, float('-Inf')), bound, depth + shallow)
+                if value >= bound:
+                    return beta, plan
+            if alpha != float('-Inf'):
+                bound = (alpha - margin - b) / a
+                value, plan = func(game, depth, bound, math.nextafter(
+                    bound, float('Inf')), depth + shallow)
+                if value <= bound:
+                    return alpha, plan
+        return None
+
+    def endgame_value(game):
+        result = endgame_cache.solve(game)
+        return result if game.current_player == player else -result
+
     def max_value(game, depth, alpha, beta, max_depth_):
+        nonlocal nodes_searched, root_best_move
+        nodes_searched += 1
+        if (on_progress_ or deadline is not None) and \
+                not nodes_searched % PROGRESS_CHECK_NODES:
+            check_clock()
         if game.is_game_over:
             return utility(game, player), []
+        if cache_depth is not None and depth >= cache_depth:
+            return endgame_value(game), []
         if depth >= max_depth_:
             return estimate_utility(game, player), []
+        if use_probcut and depth > 0 and table is None:
+            cut = probcut_value(max_value, game, depth, alpha, beta,
+                                max_depth_)
+            if cut is not None:
+                return cut
+        key = best_move = None
+        if table is not None:
+            key, known, best_move = probe(game, depth, alpha, beta, max_depth_)
+            if known is not None:
+                return known
+            alpha_, beta_ = alpha, beta
         best_value, best_plan = float('-Inf'), None
         possible_moves = game.get_possible_moves()
         if order_moves_traverse:
             possible_moves = order_moves_traverse(game, possible_moves, player)
+        if best_move is not None:
+            possible_moves = _move_first(possible_moves, best_move)
         for move in possible_moves:
             next_game = game.copy()
             next_game.make_move(*move)
@@ -37,20 +316,44 @@ def alpha_beta_ai(player, max_depth, estimate_utility, utility,
             if value > best_value:
                 best_value = value
                 best_plan = [move] + plan
+                if depth == 0:
+                    root_best_move = move
             if best_value >= beta:
-                return best_value, best_plan
+                break
             alpha = max(alpha, best_value)
+        if key is not None:
+            store(key, depth, alpha_, beta_, max_depth_, best_value, best_plan)
         return best_value, best_plan
 
     def min_value(game, depth, alpha, beta, max_depth_):
+        nonlocal nodes_searched
+        nodes_searched += 1
+        if (on_progress_ or deadline is not None) and \
+                not nodes_searched % PROGRESS_CHECK_NODES:
+            check_clock()
         if game.is_game_over:
             return utility(game, player), []
+        if cache_depth is not None and depth >= cache_depth:
+            return endgame_value(game), []
         if depth >= max_depth_:
             return estimate_utility(game, player), []
+        if use_probcut and depth > 0 and table is None:
+            cut = probcut_value(min_value, game, depth, alpha, beta,
+                                max_depth_)
+            if cut is not None:
+                return cut
+        key = best_move = None
+        if table is not None:
+            key, known, best_move = probe(game, depth, alpha, beta, max_depth_)
+            if known is not None:
+                return known
+            alpha_, beta_ = alpha, beta
         worst_value, worst_plan = float('Inf'), None
         possible_moves = game.get_possible_moves()
         if order_moves_traverse:
             possible_moves = order_moves_traverse(game, possible_moves, player)
+        if best_move is not None:
+            possible_moves = _move_first(possible_moves, best_move)
         for move in possible_moves:
             next_game = game.copy()
             next_game.make_move(*move)
@@ -64,8 +367,18 @@ def alpha_beta_ai(player, max_depth, estimate_utility, utility,
                 worst_value = value
                 worst_plan = [move] + plan
             if worst_value <= alpha:
-                return worst_value, worst_plan
+                break
             beta = min(beta, worst_value)
+        if key is not None:
+            store(key, depth, alpha_, beta_, max_depth_,
+                  worst_value, worst_plan)
         return worst_value, worst_plan
 
+    alpha_beta_decide.analyze = analyze
+    alpha_beta_decide.search_value = search_value
+    alpha_beta_decide.value_scale = value_scale
     return alpha_beta_decide
+
+
+def _move_first(moves, move):
+    return [move] + [other for other in moves if other != move]
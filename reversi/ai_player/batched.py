@@ -0,0 +1,356 @@
+"""
+Many self-play games advanced in lockstep with batched leaf evaluation.
+
+Every game runs its alpha-beta search as a generator which yields
+a frontier node, whose children are all leaves, whenever it needs
+their values, and gets the values sent back. A search waits for one
+frontier at a time, the batch is made of the pending frontiers of
+all the games: the driver collects them, evaluates each evaluator's
+share in one call and resumes the searches.
+
+With NumPy the evaluators build the leaf boards from the parents'
+cells and the reverted cells of the moves, without playing the moves,
+and compute the heuristics of reversi.ai_player (including the game
+over check) on the stacked board array. Otherwise they fall back to
+playing the moves and calling the heuristic functions leaf by leaf,
+only for the leaves the search actually looks at.
+
+    python -m reversi.ai_player.batched --games 64 --depth 2 --compare
+"""
+import time
+import random
+import argparse
+from ..game import Reversi, Player
+from ..records import RecordWriter, KIND_LABELLED
+from . import heuristics, tuning
+from .alpha_beta import alpha_beta_ai
+
+numpy = tuning.numpy
+
+
+__all__ = ['search', 'play_lockstep', 'Searcher',
+           'material_batch_evaluation', 'positional_batch_evaluation',
+           'scalar_batch_evaluation']
+
+
+def search(game, player, max_depth, utility=heuristics.win_state_utility):
+    """
+    Generator version of alpha_beta_ai's search. Instead of single
+    leaves it yields frontier nodes: (game, moves) whose children are
+    all leaves, and expects the list of the children's values from
+    `player`'s point of view: `utility` for finished games,
+    the heuristic otherwise. Returns (value, plan) as alpha_beta_ai.
+
+    Values of children which alpha-beta would have pruned may be computed
+    but aren't used, so with the same values the result is the same
+    as alpha_beta_ai's. The NumPy evaluations sum the heuristics in
+    another order, so near-ties of moves may be resolved differently.
+    """
+    if callable(max_depth):
+        max_depth = max_depth(game, player)
+    assert max_depth > 0
+    return (yield from _search_node(game, 0, float('-Inf'), float('Inf'),
+                                    max_depth, player, utility))
+
+
+def _search_node(game, depth, alpha, beta, max_depth, player, utility):
+    # max_value and min_value of alpha_beta_ai in one function
+    if game.is_game_over:
+        return utility(game, player), []
+    is_max = game.current_player == player
+    best_value = float('-Inf') if is_max else float('Inf')
+    best_plan = None
+    # the same order as alpha_beta_ai's
+    moves = list(game.get_possible_moves())
+    leaf_values = None
+    if depth + 1 >= max_depth:
+        leaf_values = yield game, moves
+    for idx, move in enumerate(moves):
+        if leaf_values is not None:
+            value, plan = leaf_values[idx], []
+        else:
+            next_game = game.copy()
+            next_game.make_move(*move)
+            value, plan = yield from _search_node(
+                next_game, depth+1, alpha, beta, max_depth, player, utility)
+        if is_max:
+            if value > best_value:
+                best_value = value
+                best_plan = [move] + plan
+            if best_value >= beta:
+                return best_value, best_plan
+            alpha = max(alpha, best_value)
+        else:
+            if value < best_value:
+                best_value = value
+                best_plan = [move] + plan
+            if best_value <= alpha:
+                return best_value, best_plan
+            beta = min(beta, best_value)
+    return best_value, best_plan
+
+
+# batch evaluations: evaluate(frontiers, players) -> values,
+# the i-th item is the list of values of the children of frontiers[i],
+# a (game, moves) pair, for players[i]
+
+def scalar_batch_evaluation(estimate_utility,
+                            utility=heuristics.win_state_utility):
+    def evaluate(frontiers, players):
+        return [
+            _LazyChildValues(game, moves, player, estimate_utility, utility)
+            for (game, moves), player in zip(frontiers, players)
+        ]
+    return evaluate
+
+
+class _LazyChildValues(object):
+    """
+    Values of a frontier's children computed on access,
+    so the children pruned by the search are never played
+    """
+
+    def __init__(self, game, moves, player, estimate_utility, utility):
+        self._game = game
+        self._moves = moves
+        self._player = player
+        self._estimate_utility = estimate_utility
+        self._utility = utility
+
+    def __getitem__(self, idx):
+        child = self._game.copy()
+        child.make_move(*self._moves[idx])
+        if child.is_game_over:
+            return self._utility(child, self._player)
+        return self._estimate_utility(child, self._player)
+
+
+def _child_boards(frontiers, players):
+    """
+    Boolean arrays of own and opponent's discs of all children,
+    built from the parents' cells and the reverted cells of the moves
+    instead of playing the moves; all boards must have the same size
+    """
+    size = frontiers[0][0].size
+    codes = []
+    for (game, moves), player in zip(frontiers, players):
+        lookup = {player: 1, player.opponent: -1, None: 0}
+        parent = [lookup[cell] for _, cell in game.iter_cells()]
+        mover_code = lookup[game.current_player]
+        for move in moves:
+            child = parent[:]
+            child[move[0] * size + move[1]] = mover_code
+            for row_id, col_id in game.get_reverted_cells(*move):
+                child[row_id * size + col_id] = mover_code
+            codes.append(child)
+    boards = numpy.array(codes, dtype=numpy.int8).reshape(-1, size, size)
+    return boards == 1, boards == -1
+
+
+def _numpy_batch_evaluation(estimate, params):
+    def evaluate(frontiers, players):
+        features = tuning.board_features(*_child_boards(frontiers, players))
+        game_over = (features['own_moves'] == 0) & (features['opp_moves'] == 0)
+        # win_state_utility of finished games
+        values = numpy.where(game_over, numpy.sign(features['diff']),
+                             estimate(features, params)).tolist()
+        result = []
+        offset = 0
+        for _, moves in frontiers:
+            result.append(values[offset:offset + len(moves)])
+            offset += len(moves)
+        return result
+    return evaluate
+
+
+def material_batch_evaluation(weight_ratio):
+    if numpy is None:
+        return scalar_batch_evaluation(
+            heuristics.material_advantage_estimation(weight_ratio))
+    return _numpy_batch_evaluation(tuning.material_estimate,
+                                   {'weight_ratio': weight_ratio})
+
+
+def positional_batch_evaluation(corner_weight, side_weight, insider_ratio):
+    if numpy is None:
+        return scalar_batch_evaluation(
+            heuristics.positional_advantage_estimation(
+                corner_weight, side_weight, insider_ratio))
+    return _numpy_batch_evaluation(tuning.positional_estimate, {
+        'corner_weight': corner_weight, 'side_weight': side_weight,
+        'insider_ratio': insider_ratio,
+    })
+
+
+class Searcher(object):
+    """Search settings of one side: depth (or a depth function) and
+    a batch evaluation; searchers with the same evaluation share batches"""
+
+    def __init__(self, max_depth, evaluate):
+        self.max_depth = max_depth
+        self.evaluate = evaluate
+
+
+class _Slot(object):
+
+    def __init__(self, game, searchers):
+        self.game = game
+        self.searchers = searchers
+        self.positions = []
+        self.search = None
+        self.player = None
+        self.searcher = None
+        self.frontier = None
+
+    def start_search(self):
+        self.player = self.game.current_player
+        self.searcher = self.searchers[self.player]
+        self.search = search(self.game, self.player, self.searcher.max_depth)
+
+    def advance(self, value=None):
+        """
+        Resumes the search until it needs leaf values,
+        making the moves of finished searches. False when the game is over.
+        """
+        while True:
+            try:
+                self.frontier = self.search.send(value)
+                return True
+            except StopIteration as stop:
+                _, plan = stop.value
+            self.positions.append(
+                (self.game.copy(), self.game.current_player))
+            self.game.make_move(*plan[0])
+            if self.game.is_game_over:
+                return False
+            self.start_search()
+            value = None
+
+
+def play_lockstep(games, searchers, on_game_over=None):
+    """
+    Plays all `games` to the end, `searchers` maps players to Searcher.
+    on_game_over(game, positions) gets every finished game with the
+    (position, side to move) pairs before each of its moves.
+    Returns counts of evaluated leaves and of batches.
+    """
+    slots = []
+    for game in games:
+        if game.is_game_over:
+            continue
+        slot = _Slot(game, searchers)
+        slot.start_search()
+        slots.append(slot)
+    active = [slot for slot in slots if _advance_or_finish(slot, on_game_over)]
+
+    evaluations, batches = 0, 0
+    while active:
+        groups = {}
+        for slot in active:
+            groups.setdefault(slot.searcher.evaluate, []).append(slot)
+        still_active = []
+        for evaluate, group in groups.items():
+            values = evaluate([slot.frontier for slot in group],
+                              [slot.player for slot in group])
+            evaluations += sum(len(slot.frontier[1]) for slot in group)
+            batches += 1
+            for slot, value in zip(group, values):
+                if _advance_or_finish(slot, on_game_over, value):
+                    still_active.append(slot)
+        active = still_active
+    return evaluations, batches
+
+
+def _advance_or_finish(slot, on_game_over, value=None):
+    if slot.advance(value):
+        return True
+    if on_game_over:
+        on_game_over(slot.game, slot.positions)
+    return False
+
+
+def random_openings(count, plies, seed=0, size=None):
+    games = []
+    for game_id in range(count):
+        rng = random.Random('{}:{}'.format(seed, game_id))
+        game = Reversi.New(size)
+        for _ in range(plies):
+            if game.is_game_over:
+                break
+            game.make_move(*rng.choice(sorted(game.get_possible_moves())))
+        games.append(game)
+    return games
+
+
+def _play_sequential(games, depth, weight_ratio):
+    ais = {player: alpha_beta_ai(
+        player, depth,
+        heuristics.material_advantage_estimation(weight_ratio),
+        heuristics.win_state_utility)
+        for player in Player}
+    for game in games:
+        while not game.is_game_over:
+            game.make_move(*ais[game.current_player](game)[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Lockstep self-play with batched leaf evaluation')
+    parser.add_argument('--games', type=int, default=64)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--weight-ratio', type=float, default=1.5)
+    parser.add_argument('--opening-plies', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board-size', type=int, default=Reversi.FIELD_SIZE,
+                        help='an even number of at least 4')
+    parser.add_argument('--output',
+                        help='write labelled positions to this record file')
+    parser.add_argument('--compare', action='store_true',
+                        help='also play the games one by one with '
+                             'alpha_beta_ai and compare')
+    args = parser.parse_args(argv)
+    if args.board_size < 4 or args.board_size % 2:
+        parser.error('--board-size must be an even number of at least 4')
+
+    games = random_openings(args.games, args.opening_plies, args.seed,
+                            args.board_size)
+    originals = [game.copy() for game in games]
+    searcher = Searcher(args.depth,
+                        material_batch_evaluation(args.weight_ratio))
+    writer = None
+    on_game_over = None
+    if args.output:
+        writer = RecordWriter(args.output, KIND_LABELLED,
+                              board_size=args.board_size)
+
+        def on_game_over(game, positions):
+            black_cnt, white_cnt = game.get_scores()
+            for position, player in positions:
+                diff = black_cnt - white_cnt
+                writer.write_labelled(
+                    position, diff if player == Player.Black else -diff)
+
+    start_time = time.perf_counter()
+    evaluations, batches = play_lockstep(
+        games, {player: searcher for player in Player}, on_game_over)
+    duration = time.perf_counter() - start_time
+    if writer:
+        writer.close()
+    print('lockstep ({}): {} games in {:.2f} s, {} leaves in {} batches, '
+          '{:.0f} leaves/s'.format(
+              'NumPy' if numpy is not None else 'pure Python',
+              len(games), duration, evaluations, batches,
+              evaluations / duration))
+
+    if args.compare:
+        start_time = time.perf_counter()
+        _play_sequential(originals, args.depth, args.weight_ratio)
+        duration = time.perf_counter() - start_time
+        same = sum(str(a) == str(b) for a, b in zip(games, originals))
+        print('one by one: {} games in {:.2f} s; {} of {} final positions '
+              'are the same'.format(len(originals), duration, same,
+                                    len(originals)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+from ..game import Player
+
+
+__all__ = ['solve', 'solve_winner', 'solve_result', 'count_empty']
+
+
+def count_empty(game):
+    return sum(1 for _, cell in game.iter_cells() if cell is None)
+
+
+def solve(game):
+    """
+    Exact result of the game under perfect play of both sides,
+    as disc difference from the point of view of the current player.
+    Intended for positions with few empty cells only.
+    """
+    return _negamax(game, -_MAX_DIFF, _MAX_DIFF)
+
+
+def solve_winner(game, cache=None):
+    """Winner under perfect play, None for a draw"""
+    result = solve_result(game, cache)
+    if result > 0:
+        return game.current_player
+    elif result < 0:
+        return game.current_player.opponent
+    return None
+
+
+def solve_result(game, cache=None):
+    """
+    1, 0 or -1: win, draw or loss of the current player under perfect
+    play. With an EndgameCache of the board size the results
+    of positions in the search tree are looked up in it and added to it.
+    """
+    if cache is not None and cache.board_size != game.size:
+        cache = None
+    # the narrow window only tells win/draw/loss apart, which is much cheaper
+    empties = count_empty(game) if cache is not None else None
+    diff = _negamax(game, -1, 1, cache, empties)
+    return (diff > 0) - (diff < 0)
+
+
+def _negamax(game, alpha, beta, cache=None, empties=None):
+    if game.is_game_over:
+        black_cnt, white_cnt = game.get_scores()
+        diff = black_cnt - white_cnt
+        return diff if game.current_player == Player.Black else -diff
+    key = None
+    if cache is not None and \
+            cache.min_empties <= empties <= cache.max_empties:
+        key = cache.key(game)
+        result = cache.lookup(key)
+        if result is not None:
+            # as good as the disc difference against a window within [-1, 1]
+            return result
+    # only a full win/draw/loss window gives an exact result to store
+    exact = alpha == -1 and beta == 1
+    best_value = -_MAX_DIFF
+    for move in game.get_possible_moves():
+        next_game = game.copy()
+        next_game.make_move(*move)
+        if next_game.current_player == game.current_player:
+            # opponent has to pass
+            value = _negamax(next_game, alpha, beta, cache,
+                             empties and empties - 1)
+        else:
+            value = -_negamax(next_game, -beta, -alpha, cache,
+                              empties and empties - 1)
+        if value > best_value:
+            best_value = value
+        if best_value >= beta:
+            break
+        alpha = max(alpha, best_value)
+    if key is not None and exact:
+        cache.store(key, (best_value > 0) - (best_value < 0))
+    return best_value
+
+
+_MAX_DIFF = 1000
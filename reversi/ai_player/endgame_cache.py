@@ -0,0 +1,325 @@
+"""
+Persistent cache of exact endgame results, shared by processes.
+
+Positions with at most `max_empties` empty cells are keyed by their
+(mover's discs, opponent's discs) masks, reduced to the smallest of the
+8 symmetric variants of the board, and mapped to the result under
+perfect play from the mover's point of view: 1, 0 or -1.
+
+The file is a header followed by fixed-size records:
+
+    header  magic b'RVEC', version (uint16), board size (uint8),
+            reserved (uint8), sorted_count (uint64), little-endian
+    record  mover mask (uint64), opponent mask (uint64), result (int8)
+
+The first sorted_count records are sorted by key and are looked up
+by binary search right in the memory map. Newer records are appended
+to the end by any process (one write per record) and indexed in
+memory; a process rereads the tail of the file, if it grew, every
+REFRESH_MISSES misses and before it appends.
+`compact` merges the tail into the sorted part, dropping duplicates.
+
+    python -m reversi.ai_player.endgame_cache stats PATH
+    python -m reversi.ai_player.endgame_cache compact PATH [--max-entries N]
+"""
+import os
+import mmap
+import struct
+import argparse
+from ..game import Reversi
+from ..records import position_to_masks
+from . import endgame
+
+
+__all__ = ['EndgameCache', 'canonical_key', 'compact']
+
+
+MAGIC = b'RVEC'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHBBQ')
+_RECORD = struct.Struct('<QQb')
+
+# lookup misses between the checks for records of other processes
+REFRESH_MISSES = 256
+
+
+def _symmetries(size):
+    last = size - 1
+    return [
+        lambda r, c: (r, c),
+        lambda r, c: (c, last - r),
+        lambda r, c: (last - r, last - c),
+        lambda r, c: (last - c, r),
+        lambda r, c: (r, last - c),
+        lambda r, c: (last - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (last - c, last - r),
+    ]
+
+
+def _make_tables(size):
+    """
+    tables[symmetry][row][byte]: the transformed mask of the row's
+    cells given by the byte, so a mask is transformed by `size` lookups
+    """
+    tables = []
+    for transform in _symmetries(size):
+        rows = []
+        for row_id in range(size):
+            row_table = []
+            for byte in range(1 << size):
+                mask = 0
+                for col_id in range(size):
+                    if byte >> col_id & 1:
+                        r, c = transform(row_id, col_id)
+                        mask |= 1 << (r * size + c)
+                row_table.append(mask)
+            rows.append(row_table)
+        tables.append(rows)
+    return tables
+
+
+_SIZE = Reversi.FIELD_SIZE
+_ROW_MASK = (1 << _SIZE) - 1
+_TABLES = _make_tables(_SIZE)
+
+
+def _transform(tables, mask):
+    result = 0
+    for row_id, row_table in enumerate(tables):
+        result |= row_table[mask >> (row_id * _SIZE) & _ROW_MASK]
+    return result
+
+
+def canonical_key(game):
+    """(mover mask, opponent mask), the smallest of the symmetric ones"""
+    black, white, side = position_to_masks(game)
+    mover, opponent = (black, white) if side == 0 else (white, black)
+    return min(
+        (_transform(tables, mover), _transform(tables, opponent))
+        for tables in _TABLES
+    )
+
+
+class EndgameCache(object):
+    """
+    Exact results of positions with few empty cells of the default
+    board size. The file is opened lazily, in every process that uses
+    the cache, so a cache object may be created before forking workers.
+    """
+
+    board_size = _SIZE
+
+    def __init__(self, path, max_empties=10, min_empties=4,
+                 max_bytes=256 * 2**20):
+        self.path = path
+        # positions with fewer empty cells are solved faster
+        # than they are looked up
+        self.min_empties = min_empties
+        self.max_empties = max_empties
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pid = None
+        self._file = None
+        self._mmap = None
+        self._sorted_count = 0
+        self._tail = {}
+        self._indexed_size = 0
+        self._misses_since_refresh = 0
+
+    def covers(self, game):
+        return game.size == self.board_size and \
+            endgame.count_empty(game) <= self.max_empties
+
+    def get(self, game):
+        """Result for the player to move, None if unknown"""
+        return self.lookup(self.key(game))
+
+    def solve(self, game):
+        """Result for the player to move, solved and stored if unknown"""
+        return endgame.solve_result(game, cache=self)
+
+    key = staticmethod(canonical_key)
+
+    def lookup(self, key):
+        self._ensure_open()
+        result = self._tail.get(key)
+        if result is None:
+            result = self._search_sorted(key)
+        if result is None:
+            self._misses_since_refresh += 1
+            # maybe another process has solved it meanwhile; the check
+            # costs a system call, so it isn't made for every miss
+            if self._misses_since_refresh >= REFRESH_MISSES:
+                self._read_tail()
+                result = self._tail.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def store(self, key, result):
+        self._ensure_open()
+        self._tail[key] = result
+        # the size counts the records of other processes too
+        if self._read_tail() + _RECORD.size > self.max_bytes:
+            # the file is full, keep the result in memory only
+            return
+        # a single write in append mode doesn't interleave with
+        # the writes of other processes
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, _RECORD.pack(key[0], key[1], result))
+        finally:
+            os.close(fd)
+
+    def __len__(self):
+        self._ensure_open()
+        return self._sorted_count + len(self._tail)
+
+    def close(self):
+        if self._file is not None:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._file.close()
+        self._file = self._mmap = None
+        self._pid = None
+
+    def _ensure_open(self):
+        if self._pid == os.getpid():
+            return
+        # a forked worker mustn't share the parent's file position
+        # and tail index
+        self._file = self._mmap = None
+        self._tail = {}
+        _create_file(self.path)
+        self._file = open(self.path, 'r+b')
+        header = self._file.read(_HEADER.size)
+        magic, version, size, _, sorted_count = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or size != _SIZE:
+            raise ValueError('{} is not an endgame cache of {}x{} boards'
+                             .format(self.path, _SIZE, _SIZE))
+        self._sorted_count = sorted_count
+        self._indexed_size = _HEADER.size + sorted_count * _RECORD.size
+        if sorted_count:
+            self._mmap = mmap.mmap(self._file.fileno(), self._indexed_size,
+                                   access=mmap.ACCESS_READ)
+        self._pid = os.getpid()
+        self._read_tail()
+
+    def _read_tail(self):
+        """Indexes the records appended since, returns the file size"""
+        self._misses_since_refresh = 0
+        size = os.fstat(self._file.fileno()).st_size
+        # a record being appended by another process may be incomplete
+        end = size - (size - _HEADER.size) % _RECORD.size
+        if end <= self._indexed_size:
+            return size
+        self._file.seek(self._indexed_size)
+        data = self._file.read(end - self._indexed_size)
+        for mover, opponent, result in _RECORD.iter_unpack(data):
+            self._tail[mover, opponent] = result
+        self._indexed_size = end
+        return size
+
+    def _search_sorted(self, key):
+        low, high = 0, self._sorted_count
+        while low < high:
+            middle = (low + high) // 2
+            mover, opponent, result = _RECORD.unpack_from(
+                self._mmap, _HEADER.size + middle * _RECORD.size)
+            if (mover, opponent) < key:
+                low = middle + 1
+            elif (mover, opponent) > key:
+                high = middle
+            else:
+                return result
+        return None
+
+
+def _create_file(path):
+    """Creates an empty cache unless some process has already done it"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+    except FileExistsError:
+        return
+    try:
+        os.write(fd, _HEADER.pack(MAGIC, VERSION, _SIZE, 0, 0))
+    finally:
+        os.close(fd)
+
+
+def _write_file(path, records):
+    """Writes sorted unique (mover, opponent, result) records atomically"""
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, _SIZE, 0, len(records)))
+        for record in records:
+            f.write(_RECORD.pack(*record))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_records(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, size, _, _ = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{} is not an endgame cache'.format(path))
+    end = len(data) - (len(data) - _HEADER.size) % _RECORD.size
+    return _RECORD.iter_unpack(data[_HEADER.size:end])
+
+
+def compact(path, max_entries=None):
+    """
+    Sorts the cache file and drops duplicates. With `max_entries`,
+    keeps the positions with the most empty cells, which are the most
+    expensive to solve. Run it while no process writes to the cache.
+    """
+    results = {}
+    for mover, opponent, result in _read_records(path):
+        results[mover, opponent] = result
+    keys = list(results)
+    if max_entries is not None and len(keys) > max_entries:
+        keys.sort(key=lambda key: bin(key[0] | key[1]).count('1'))
+        keys = keys[:max_entries]
+    keys.sort()
+    _write_file(path, [key + (results[key],) for key in keys])
+    return len(keys)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Endgame cache maintenance')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    stats_parser = subparsers.add_parser('stats')
+    stats_parser.add_argument('path')
+    compact_parser = subparsers.add_parser('compact')
+    compact_parser.add_argument('path')
+    compact_parser.add_argument('--max-entries', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'stats':
+        with open(args.path, 'rb') as f:
+            sorted_count = _HEADER.unpack(f.read(_HEADER.size))[4]
+        records = list(_read_records(args.path))
+        unique = len({(mover, opponent) for mover, opponent, _ in records})
+        by_empties = {}
+        for mover, opponent, _ in records:
+            empties = _SIZE * _SIZE - bin(mover | opponent).count('1')
+            by_empties[empties] = by_empties.get(empties, 0) + 1
+        print('{} records ({} sorted, {} unique), {} bytes'.format(
+            len(records), sorted_count, unique, os.path.getsize(args.path)))
+        for empties in sorted(by_empties):
+            print('  {:>2} empty cells: {}'.format(empties, by_empties[empties]))
+    else:
+        count = compact(args.path, args.max_entries)
+        print('{} entries after compaction'.format(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,17 @@
+import os
+import json
+import math
 import random
 import time
 import itertools
+import multiprocessing
 from ..game import Reversi, Player
+from . import tournament, endgame
+from .ready_to_go import load_endgame_cache
+from .time_manager import GameClock
+
+
+MOVE_TIME_LIMIT = 10
 
 
 class Score(object):
@@ -16,9 +26,12 @@ class Score(object):
         # the one with less and more stable timings will be better.
         # Though, influence of good timings must be limited,
         # because it may make fast and stupid algorithm better than smart.
+        cost = self.avg_time + self.time_dev
+        if cost == 0:
+            return self.win_ratio * 1.01
         return self.win_ratio + 0.01 * min(
             self.win_ratio,
-            total_avg_time / (self.avg_time + self.time_dev)
+            total_avg_time / cost
         )
 
     def __str__(self):
@@ -26,11 +39,20 @@ class Score(object):
             self.win_ratio, self.avg_time, self.time_dev
         )
 
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
 
 class BasicIndividual(object):
 
     Attrs = ()
     TypeName = ''
+    # attr -> (min, max)
+    Bounds = {}
 
     def __init__(self, **attrs):
         self.__dict__.update({
@@ -45,11 +67,10 @@ class BasicIndividual(object):
         return self.TypeName
 
     def mutate(self, **sigmas):
-        new_attrs = {
-            attr: getattr(self, attr) + random.gauss(0, sigmas.get(attr, 0.2))
+        return self.with_values([
+            getattr(self, attr) + random.gauss(0, sigmas.get(attr, 0.2))
             for attr in self.attrs()
-        }
-        return self.__class__(**new_attrs)
+        ])
 
     def crossover(self, other):
         new_attrs = {}
@@ -58,6 +79,15 @@ class BasicIndividual(object):
             new_attrs[attr] = ratio*getattr(self, attr) + (1-ratio)*getattr(other, attr)
         return self.__class__(**new_attrs)
 
+    def values(self):
+        return [getattr(self, attr) for attr in self.attrs()]
+
+    def with_values(self, values):
+        new_attrs = dict(zip(self.attrs(), values))
+        for attr, (min_value, max_value) in self.Bounds.items():
+            new_attrs[attr] = min(max(new_attrs[attr], min_value), max_value)
+        return self.__class__(**new_attrs)
+
     def __str__(self):
         return _individual2str(self)
 
@@ -78,32 +108,14 @@ class ConstDepthIndividual(BasicIndividual):
 
     Attrs = ('max_depth',)
     TypeName = 'const depth'
-
-    def mutate(self, **sigmas):
-        result = super(ConstDepthIndividual, self).mutate(**sigmas)
-        if result.max_depth < 0.5:
-            result.max_depth = 0.5
-        elif result.max_depth > 11:
-            result.max_depth = 11
-        return result
+    Bounds = {'max_depth': (0.5, 11)}
 
 
 class VariableDepthIndividual(BasicIndividual):
 
     Attrs = ('mid_max_depth', 'end_max_depth')
     TypeName = 'variable depth'
-
-    def mutate(self, **sigmas):
-        result = super(VariableDepthIndividual, self).mutate(**sigmas)
-        if result.mid_max_depth < 0.5:
-            result.mid_max_depth = 0.5
-        elif result.mid_max_depth > 11:
-            result.mid_max_depth = 11
-        if result.end_max_depth < 0.5:
-            result.end_max_depth = 0.5
-        elif result.end_max_depth > 11:
-            result.end_max_depth = 11
-        return result
+    Bounds = {'mid_max_depth': (0.5, 11), 'end_max_depth': (0.5, 11)}
 
 
 class CombinedIndividual(object):
@@ -126,6 +138,14 @@ class CombinedIndividual(object):
         return self.__class__(self.ind1.crossover(other.ind1),
                               self.ind2.crossover(other.ind2))
 
+    def values(self):
+        return self.ind1.values() + self.ind2.values()
+
+    def with_values(self, values):
+        split = len(self.ind1.attrs())
+        return self.__class__(self.ind1.with_values(values[:split]),
+                              self.ind2.with_values(values[split:]))
+
     def __getattr__(self, item):
         if item in self.ind1.attrs():
             return getattr(self.ind1, item)
@@ -145,20 +165,39 @@ def _individual2str(individual):
 
 
 def run_evolution(population, ai_factories, selection_capacity=None,
-                  population_size=None, max_generations=None):
+                  population_size=None, max_generations=None,
+                  scheduler=None, match_cache=None,
+                  checkpoint_path=None, start_generation=0,
+                  time_limit=MOVE_TIME_LIMIT, isolated=True, timing='cpu',
+                  game_log=None, adjudication=None, optimizer=None,
+                  match_runner=None, clock=None,
+                  board_size=Reversi.FIELD_SIZE, ai_options=None):
     population_size = population_size or len(population)
-    gen_id = 0
+    scheduler = scheduler or tournament.RoundRobin()
+    optimizer = optimizer or CrossoverOptimizer()
+    gen_id = start_generation
     while population:
         gen_id += 1
-        population = next_generation(population)
+        population = optimizer.propose(population)
         if selection_capacity and len(population) > selection_capacity:
             population = random.sample(population, selection_capacity)
         total_time_acc = Accumulator()
-        total_games = len(population) * (len(population) - 1)
+        wasted_time_acc = Accumulator()
+        saved_time_acc = Accumulator()
+        total_games = scheduler.games_count(len(population))
         print(total_games, end=' ', flush=True)
+
+        def game_callback(black, white, result, cached, gen_id=gen_id):
+            if not cached:
+                wasted_time_acc.add(result.wasted_time)
+                saved_time_acc.add(result.saved_time)
+            if game_log:
+                game_log.log_game(gen_id, black, white, result, cached)
         scores, disqualified = calc_scores(
             population, ai_factories, total_time_acc,
-            progress_callback(total_games)
+            progress_callback(total_games), scheduler, match_cache,
+            time_limit, isolated, timing, game_callback, adjudication,
+            match_runner, clock, board_size, ai_options
         )
         pop_with_scores = [
             item for idx, item in enumerate(zip(population, scores))
@@ -166,13 +205,64 @@ def run_evolution(population, ai_factories, selection_capacity=None,
         ]
         avg_time = total_time_acc.avg
         pop_with_scores.sort(key=lambda item: item[1].get_score(avg_time), reverse=True)
-        pop_with_scores = pop_with_scores[:population_size]
+        pop_with_scores = optimizer.select(pop_with_scores, population_size)
         population, scores = zip(*pop_with_scores)
-        print_report(population, scores, gen_id)
+        stats = {
+            'disqualified': len(disqualified),
+            'time wasted on disqualifying moves, s':
+                round(wasted_time_acc.sum, 2),
+        }
+        if adjudication:
+            stats['time saved by adjudication, s'] = \
+                round(saved_time_acc.sum, 2)
+        print_report(population, scores, gen_id, stats)
+        if game_log:
+            game_log.log_generation(gen_id, population, scores, stats)
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, gen_id, population, scores,
+                            optimizer.get_state())
         if max_generations and gen_id > max_generations:
             break
 
 
+def save_checkpoint(path, generation_id, population, scores,
+                    optimizer_state=None):
+    """
+    Atomically stores everything needed to continue the run
+    after `generation_id`: survivors, their scores, the RNG state
+    and the optimizer state.
+    """
+    data = {
+        'generation_id': generation_id,
+        'population': [individual_to_genome(ind) for ind in population],
+        'scores': [score.to_dict() for score in scores],
+        'random_state': random.getstate(),
+        'optimizer_state': optimizer_state,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, optimizer=None):
+    """
+    Restores the RNG state and the `optimizer` state saved
+    by `save_checkpoint` and returns (generation_id, population, scores).
+    """
+    with open(path) as f:
+        data = json.load(f)
+    version, internal_state, gauss_next = data['random_state']
+    random.setstate((version, tuple(internal_state), gauss_next))
+    if optimizer is not None and data.get('optimizer_state') is not None:
+        optimizer.set_state(data['optimizer_state'])
+    population = [individual_from_genome(g) for g in data['population']]
+    scores = [Score.from_dict(score) for score in data['scores']]
+    return data['generation_id'], population, scores
+
+
 def progress_callback(total_games):
     printed = 0
 
@@ -184,8 +274,77 @@ def progress_callback(total_games):
     return callback
 
 
+def compare_schedulers(population, ai_factories, schedulers, top_k=None,
+                       ai_options=None):
+    """
+    Scores the same population with the full round-robin and then
+    with each of `schedulers`, and reports how many games each one took
+    and how well its ranking agrees with the round-robin ranking.
+    """
+    top_k = top_k or max(1, len(population) // 3)
+
+    def rank(scheduler):
+        games = {'cnt': 0}
+
+        def count_games(games_cnt):
+            games['cnt'] = games_cnt
+        total_time_acc = Accumulator()
+        scores, disqualified = calc_scores(
+            population, ai_factories, total_time_acc, count_games, scheduler,
+            ai_options=ai_options
+        )
+        avg_time = total_time_acc.avg
+        ranking = sorted(
+            range(len(population)),
+            key=lambda idx: (idx not in disqualified,
+                             scores[idx].get_score(avg_time)),
+            reverse=True
+        )
+        return ranking, games['cnt']
+
+    reference, reference_games = rank(tournament.RoundRobin())
+    report = [(tournament.RoundRobin.Name, reference_games, 1.0, 1.0)]
+    for scheduler in schedulers:
+        ranking, games_cnt = rank(scheduler)
+        report.append((
+            scheduler.Name, games_cnt,
+            tournament.kendall_tau(reference, ranking),
+            tournament.top_overlap(reference, ranking, top_k),
+        ))
+
+    print('{:<12} {:>8} {:>8} {:>8}'.format(
+        'scheduler', 'games', 'tau', 'top-{}'.format(top_k)))
+    for name, games_cnt, tau, overlap in report:
+        print('{:<12} {:>8} {:>8.2f} {:>8.2f}'.format(
+            name, games_cnt, tau, overlap))
+    return report
+
+
+class CrossoverOptimizer(object):
+    """
+    The classic scheme: every pair of the same type gives
+    a child and two its mutants, the best ones survive.
+    """
+
+    Name = 'crossover'
+
+    def propose(self, population):
+        return next_generation(population)
+
+    def select(self, pop_with_scores, population_size):
+        return pop_with_scores[:population_size]
+
+    def get_state(self):
+        return None
+
+    def set_state(self, state):
+        pass
+
+
 def next_generation(population):
-    type_names = {ind.type_name() for ind in population}
+    # in population order: a set's order depends on the hash seed,
+    # and a resumed run must draw its random numbers in the same order
+    type_names = dict.fromkeys(ind.type_name() for ind in population)
     result = []
     for type_ in type_names:
         subpopulation = [ind for ind in population if ind.type_name() == type_]
@@ -200,9 +359,11 @@ def next_generation(population):
     return result
 
 
-def print_report(population, scores, generation_id):
+def print_report(population, scores, generation_id, stats=None):
     print()
     print('Generation #{}'.format(generation_id))
+    for name, value in (stats or {}).items():
+        print('{}: {}'.format(name.capitalize(), value))
     pop_lines = [
         '{}, {}'.format(indiv.type_name(), indiv)
         for indiv in population
@@ -213,35 +374,81 @@ def print_report(population, scores, generation_id):
     print()
 
 
-def calc_scores(population, ai_factories, total_time_acc, progress_callback):
+def calc_scores(population, ai_factories, total_time_acc, progress_callback,
+                scheduler=None, match_cache=None,
+                time_limit=MOVE_TIME_LIMIT, isolated=True,
+                timing='cpu', game_callback=None, adjudication=None,
+                match_runner=None, clock=None,
+                board_size=Reversi.FIELD_SIZE, ai_options=None):
+    """
+    `match_runner`, if given, plays all new games of a round at once
+    with its run_matches(pairs, time_limit, isolated, adjudication, clock,
+    board_size, ai_options) method, see remote.MatchServer. Otherwise
+    games are played here one by one. `clock` is (total, increment)
+    of a game clock, see run_game. The AIs are made by make_ais
+    with `clock` and `ai_options`. Games with a clock and disqualifications depend
+    on the machine, they are neither taken from nor stored in
+    `match_cache`.
+    """
+    scheduler = scheduler or tournament.RoundRobin()
+    if clock is not None:
+        # the AIs play to their time, the results aren't repeatable
+        match_cache = None
     pop_size = len(population)
     win_accs = {idx: Accumulator() for idx in range(pop_size)}
     time_accs = {idx: Accumulator() for idx in range(pop_size)}
     disqualified = set()
     games_cnt = 0
-    for idx1, indiv1 in enumerate(population):
-        if idx1 in disqualified:
-            games_cnt += (pop_size - 1)
-            continue
-        for idx2, indiv2 in enumerate(population):
+    for round_pairs in scheduler.schedule(pop_size, win_accs, disqualified):
+        cached_results = {}
+        if match_cache is not None:
+            for idx1, idx2 in round_pairs:
+                result = match_cache.get(population[idx1], population[idx2])
+                if result is not None:
+                    cached_results[idx1, idx2] = result
+        new_results = {}
+        if match_runner is not None:
+            jobs = [
+                (idx1, idx2) for idx1, idx2 in round_pairs
+                if (idx1, idx2) not in cached_results
+                and idx1 not in disqualified and idx2 not in disqualified
+            ]
+            new_results = dict(zip(jobs, match_runner.run_matches(
+                [(population[idx1], population[idx2]) for idx1, idx2 in jobs],
+                time_limit, isolated, adjudication, clock, board_size,
+                ai_options
+            )))
+        for idx1, idx2 in round_pairs:
             games_cnt += 1
-            if idx2 in disqualified or idx1 == idx2:
+            if idx1 in disqualified or idx2 in disqualified:
+                progress_callback(games_cnt)
                 continue
+            indiv1, indiv2 = population[idx1], population[idx2]
+            result = cached_results.get((idx1, idx2))
+            cached = result is not None
+            if result is None:
+                result = new_results.get((idx1, idx2))
+            if result is None:
+                result = run_game(
+                    *make_ais(ai_factories, indiv1, indiv2, clock,
+                              ai_options),
+                    time_limit, isolated, adjudication, clock, board_size
+                )
+            # a disqualification depends on the load of the machine
+            if not cached and match_cache is not None \
+                    and result.disqualified is None:
+                match_cache.put(indiv1, indiv2, result)
+            if game_callback:
+                game_callback(indiv1, indiv2, result, cached)
             track_tuples = {
-                Player.Black: [
-                    ai_factories[indiv1.type_name()](Player.Black, indiv1),
-                    win_accs[idx1], time_accs[idx1]
-                ],
-                Player.White: [
-                    ai_factories[indiv2.type_name()](Player.White, indiv2),
-                    win_accs[idx2], time_accs[idx2]
-                ],
+                Player.Black: (win_accs[idx1], time_accs[idx1]),
+                Player.White: (win_accs[idx2], time_accs[idx2]),
             }
-            try:
-                run_game(track_tuples, total_time_acc)
-            except Disqualification as disq:
-                idx = idx1 if disq.player == Player.Black else idx2
-                disqualified.add(idx)
+            account_result(result, track_tuples, total_time_acc, timing)
+            if result.disqualified == Player.Black:
+                disqualified.add(idx1)
+            elif result.disqualified == Player.White:
+                disqualified.add(idx2)
             progress_callback(games_cnt)
     return [
         Score(win_accs[idx].avg, time_accs[idx].avg, time_accs[idx].std_dev)
@@ -249,20 +456,334 @@ def calc_scores(population, ai_factories, total_time_acc, progress_callback):
     ], disqualified
 
 
-def run_game(track_tuples, total_time_acc):
-    game = Reversi.New()
+def make_ais(ai_factories, black, white, clock=None, ai_options=None):
+    """
+    (black AI, white AI) of the individuals, made by the factories
+    of their types as factory(player, individual, **options). The options
+    are `ai_options`, settings of the AIs which must reach every process
+    playing the game, and `clock` if the game has one.
+    """
+    options = dict(ai_options or {})
+    if clock is not None:
+        options['clock'] = clock
+    return (
+        ai_factories[black.type_name()](Player.Black, black, **options),
+        ai_factories[white.type_name()](Player.White, white, **options),
+    )
+
+
+class MatchResult(object):
+
+    # per-move statistics, each one is {player: [value for every move]};
+    # clock_left, the clock after the move, only in games with a clock
+    MoveStats = ('times', 'cpu_times', 'nodes', 'clock_left')
+
+    def __init__(self, winner, times, disqualified=None, wasted_time=0,
+                 cpu_times=None, nodes=None, moves=None,
+                 adjudicated=None, saved_time=0, clock_left=None):
+        self.winner = winner
+        self.times = times
+        self.cpu_times = cpu_times or {player: [] for player in Player}
+        self.nodes = nodes or {player: [] for player in Player}
+        self.clock_left = clock_left or {player: [] for player in Player}
+        self.moves = moves or []
+        self.disqualified = disqualified
+        # time spent on the move which caused disqualification
+        self.wasted_time = wasted_time
+        # name of the Adjudication rule which stopped the game, if any,
+        # and the estimated time of the moves which were not played
+        self.adjudicated = adjudicated
+        self.saved_time = saved_time
+
+    def add_move(self, player, move_result):
+        self.times[player].append(move_result['time'])
+        self.cpu_times[player].append(move_result['cpu_time'])
+        self.nodes[player].append(move_result['nodes'])
+        if 'clock_left' in move_result:
+            self.clock_left[player].append(move_result['clock_left'])
+        self.moves.append((player, tuple(move_result['move'])))
+
+    def to_dict(self):
+        data = {
+            stat: {
+                player.value: values
+                for player, values in getattr(self, stat).items()
+            }
+            for stat in self.MoveStats
+        }
+        data.update({
+            'winner': self.winner and self.winner.value,
+            'disqualified': self.disqualified and self.disqualified.value,
+            'wasted_time': self.wasted_time,
+            'adjudicated': self.adjudicated,
+            'saved_time': self.saved_time,
+            'moves': [
+                [player.value, row_id, col_id]
+                for player, (row_id, col_id) in self.moves
+            ],
+        })
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            winner=data['winner'] and Player(data['winner']),
+            disqualified=data['disqualified'] and Player(data['disqualified']),
+            wasted_time=data.get('wasted_time', 0),
+            adjudicated=data.get('adjudicated'),
+            saved_time=data.get('saved_time', 0),
+            moves=[
+                (Player(player), (row_id, col_id))
+                for player, row_id, col_id in data.get('moves', [])
+            ],
+            **{
+                stat: {
+                    Player(player): values
+                    for player, values in data[stat].items()
+                }
+                for stat in cls.MoveStats if stat in data
+            }
+        )
+
+
+# how Score measures the cost of a move
+TIMING_METRICS = {
+    'wall': 'times',
+    'cpu': 'cpu_times',
+    'nodes': 'nodes',
+}
+
+
+def run_game(black_ai, white_ai, time_limit=MOVE_TIME_LIMIT, isolated=True,
+             adjudication=None, clock=None, board_size=Reversi.FIELD_SIZE):
+    """
+    Plays a game on a board of `board_size` and returns MatchResult.
+    A player whose move takes longer than `time_limit` seconds
+    is disqualified.
+    If `isolated`, the AIs run in a forked process which is killed
+    as soon as the limit is reached. Otherwise the move is checked
+    only after it returns.
+    With `clock`, (total, increment) in seconds, the players also have
+    a game clock, see time_manager.GameClock: the AIs are told their
+    time left, a player who runs out of it is disqualified, and
+    the clock after every move is recorded.
+    """
+    ais = {Player.Black: black_ai, Player.White: white_ai}
+    if isolated:
+        return _run_isolated_game(ais, time_limit, adjudication, clock,
+                                  board_size)
+    match = MatchResult(None, {player: [] for player in Player})
+    game = Reversi.New(board_size)
+    game_clock = clock and GameClock(*clock)
+    evaluations = []
+    try:
+        while not game.is_game_over:
+            player = game.current_player
+            result = {}
+            worker(ais[player], game, result,
+                   game_clock and game_clock.time_left(player))
+            if result['time'] > _move_time_limit(time_limit, game_clock,
+                                                 player):
+                raise Disqualification(player, result['time'])
+            _charge_clock(game_clock, player, result)
+            match.add_move(player, result)
+            evaluations.append((player, result['value']))
+            game.make_move(*result['move'])
+            if _adjudicate(adjudication, game, evaluations, match):
+                return match
+    except Disqualification as disq:
+        match.disqualified = disq.player
+        match.wasted_time = disq.wasted_time
+        return match
+    match.winner = game.get_winner()
+    return match
+
+
+def _move_time_limit(time_limit, game_clock, player):
+    if game_clock is None:
+        return time_limit
+    return min(time_limit, game_clock.time_left(player))
+
+
+def _charge_clock(game_clock, player, result):
+    if game_clock is None:
+        return
+    if not game_clock.charge(player, result['time']):
+        raise Disqualification(player, result['time'])
+    result['clock_left'] = game_clock.time_left(player)
+
+
+def _run_isolated_game(ais, time_limit, adjudication, clock=None,
+                       board_size=Reversi.FIELD_SIZE):
+    # fork lets the child use AI closures, which can't be pickled
+    context = multiprocessing.get_context('fork')
+    conn, child_conn = context.Pipe()
+    process = context.Process(target=_game_process,
+                              args=(ais, child_conn, clock, board_size),
+                              daemon=True)
+    process.start()
+    child_conn.close()
+    match = MatchResult(None, {player: [] for player in Player})
+    game = Reversi.New(board_size)
+    game_clock = clock and GameClock(*clock)
+    evaluations = []
+    try:
+        while not game.is_game_over:
+            player = game.current_player
+            limit = _move_time_limit(time_limit, game_clock, player)
+            # the child searches only on request, so the limit
+            # doesn't include the work done here between the moves
+            start = time.monotonic()
+            conn.send(True)
+            if not conn.poll(limit):
+                raise Disqualification(player, time.monotonic() - start)
+            try:
+                result = conn.recv()
+            except EOFError:
+                raise RuntimeError('game process exited with code {}'
+                                   .format(process.exitcode))
+            # the clock is charged with the time measured by the game
+            # process, which keeps the same clock for its AIs
+            _charge_clock(game_clock, player, result)
+            match.add_move(player, result)
+            evaluations.append((player, result['value']))
+            game.make_move(*result['move'])
+            if _adjudicate(adjudication, game, evaluations, match):
+                return match
+    except Disqualification as disq:
+        match.disqualified = disq.player
+        match.wasted_time = disq.wasted_time
+        return match
+    finally:
+        conn.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+    match.winner = game.get_winner()
+    return match
+
+
+def _game_process(ais, conn, clock=None, board_size=Reversi.FIELD_SIZE):
+    game = Reversi.New(board_size)
+    game_clock = clock and GameClock(*clock)
     while not game.is_game_over:
-        ai, _, time_acc = track_tuples[game.current_player]
+        # wait for the request of the next move
+        conn.recv()
+        player = game.current_player
         result = {}
-        worker(ai, game, result)
-        if result['time'] > 10:
-            raise Disqualification(game.current_player)
-        time_acc.add(result['time'])
-        total_time_acc.add(result['time'])
+        worker(ais[player], game, result,
+               game_clock and game_clock.time_left(player))
+        if game_clock is not None:
+            game_clock.charge(player, result['time'])
+        conn.send(result)
         game.make_move(*result['move'])
-    winner = game.get_winner()
-    for player, (_, win_acc, _) in track_tuples.items():
-        win_acc.add(int(player == winner))
+    conn.close()
+
+
+def _adjudicate(adjudication, game, evaluations, match):
+    if adjudication is None or game.is_game_over:
+        return False
+    start = time.time()
+    rule, winner = adjudication.decide(game, evaluations)
+    if rule is None:
+        return False
+    spent = time.time() - start
+    # every remaining move fills one cell
+    all_times = match.times[Player.Black] + match.times[Player.White]
+    avg_move_time = sum(all_times) / max(len(all_times), 1)
+    match.winner = winner
+    match.adjudicated = rule
+    match.saved_time = max(
+        0, endgame.count_empty(game) * avg_move_time - spent)
+    return True
+
+
+class Adjudication(object):
+    """
+    Rules to stop a game whose result is already settled:
+    - with at most `solve_empties` empty cells the game
+      is solved exactly and the perfect-play winner wins, with
+      the results of the endgame cache file `endgame_cache` if given;
+    - if during the last `plies` moves both players evaluated
+      the position as won for the same side by at least `margin`,
+      that side wins. The values are divided by the AI's value_scale
+      (see alpha_beta_ai) and clipped to [-1, 1], the heuristics
+      differ in scale.
+    Set a parameter to 0 to disable its rule.
+    """
+
+    def __init__(self, solve_empties=8, margin=0.9, plies=6,
+                 endgame_cache=None):
+        self.solve_empties = solve_empties
+        self.margin = margin
+        self.plies = plies
+        self.endgame_cache = endgame_cache
+
+    def decide(self, game, evaluations):
+        """
+        `evaluations` is a list of (player, value) for every played move,
+        value is the mover's own estimation or None if it is unknown.
+        Returns (rule name, winner) or (None, None) to play on.
+        """
+        if self.solve_empties and \
+                endgame.count_empty(game) <= self.solve_empties:
+            # only the given file, not one from the environment
+            cache = self.endgame_cache and \
+                load_endgame_cache(self.endgame_cache)
+            return 'solve', endgame.solve_winner(game, cache or None)
+        if not self.plies or len(evaluations) < self.plies:
+            return None, None
+        recent = evaluations[-self.plies:]
+        if len({player for player, _ in recent}) < 2 or \
+                any(value is None for _, value in recent):
+            return None, None
+        black_view = [
+            value if player == Player.Black else -value
+            for player, value in recent
+        ]
+        if all(value >= self.margin for value in black_view):
+            return 'evaluation', Player.Black
+        if all(value <= -self.margin for value in black_view):
+            return 'evaluation', Player.White
+        return None, None
+
+
+def account_result(result, track_tuples, total_time_acc, timing='cpu'):
+    move_costs = getattr(result, TIMING_METRICS[timing])
+    for player, (win_acc, time_acc) in track_tuples.items():
+        for move_cost in move_costs[player]:
+            time_acc.add(move_cost)
+            total_time_acc.add(move_cost)
+        if result.disqualified is None:
+            win_acc.add(int(player == result.winner))
+
+
+def individual_to_genome(individual):
+    if isinstance(individual, CombinedIndividual):
+        return {'combined': [individual_to_genome(individual.ind1),
+                             individual_to_genome(individual.ind2)]}
+    return {
+        'class': individual.__class__.__name__,
+        'attrs': {attr: getattr(individual, attr)
+                  for attr in individual.attrs()},
+    }
+
+
+def individual_from_genome(genome):
+    if 'combined' in genome:
+        ind1, ind2 = map(individual_from_genome, genome['combined'])
+        return CombinedIndividual(ind1, ind2)
+    return _individual_classes()[genome['class']](**genome['attrs'])
+
+
+def _individual_classes():
+    classes = {}
+    pending = [BasicIndividual]
+    while pending:
+        cls = pending.pop()
+        classes[cls.__name__] = cls
+        pending.extend(cls.__subclasses__())
+    return classes
 
 
 class Accumulator:
@@ -286,17 +807,32 @@ class Accumulator:
     def std_dev(self):
         if self.count == 0:
             return float('inf')
-        return (self.sqr_sum / self.count) - self.avg**2
+        variance = (self.sqr_sum / self.count) - self.avg**2
+        # rounding errors may make it slightly negative
+        return math.sqrt(max(variance, 0))
 
 
-def worker(ai, game, result):
+def worker(ai, game, result, time_left=None):
     start = time.time()
-    move = ai(game)
+    cpu_start = time.thread_time()
+    if time_left is None:
+        plan = ai(game)
+    else:
+        plan = ai(game, time_left=time_left)
+    cpu_duration = time.thread_time() - cpu_start
     duration = time.time() - start
-    result['move'] = move
+    result['move'] = plan[0]
     result['time'] = duration
+    result['cpu_time'] = cpu_duration
+    result['nodes'] = getattr(ai, 'nodes_searched', 0)
+    value = getattr(ai, 'last_value', None)
+    if value is not None:
+        # comparable between heuristics, see Adjudication
+        value = max(-1, min(1, value / getattr(ai, 'value_scale', 1)))
+    result['value'] = value
 
 
 class Disqualification(Exception):
-    def __init__(self, player):
+    def __init__(self, player, wasted_time=0):
         self.player = player
+        self.wasted_time = wasted_time
@@ -0,0 +1,151 @@
+import os
+import json
+import argparse
+from .evolution import individual_to_genome
+
+
+__all__ = ['EvolutionLog', 'iter_records', 'individual_stats']
+
+
+class EvolutionLog(object):
+    """
+    Streaming log of an evolution run: one JSON line per game
+    and one per generation. Lines are appended through a buffer,
+    and the file is rotated to path.1, path.2, ... when it grows
+    above `max_bytes`.
+    """
+
+    def __init__(self, path, max_bytes=64 * 2**20, backup_count=10,
+                 buffer_size=2**16):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer_size = buffer_size
+        self._file = None
+        self._size = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'a', buffering=self.buffer_size)
+        self._size = os.path.getsize(self.path)
+
+    def _rotate(self):
+        self._file.close()
+        for idx in range(self.backup_count - 1, 0, -1):
+            src = '{}.{}'.format(self.path, idx)
+            if os.path.exists(src):
+                os.replace(src, '{}.{}'.format(self.path, idx + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _write(self, record):
+        line = json.dumps(record) + '\n'
+        size = len(line.encode())
+        if self._size and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._size += size
+
+    def log_game(self, generation_id, black, white, result, cached=False):
+        record = {
+            'type': 'game',
+            'generation_id': generation_id,
+            'black': individual_to_genome(black),
+            'white': individual_to_genome(white),
+            'cached': cached,
+        }
+        record.update(result.to_dict())
+        self._write(record)
+
+    def log_generation(self, generation_id, population, scores, stats=None):
+        self._write({
+            'type': 'generation',
+            'generation_id': generation_id,
+            'population': [individual_to_genome(ind) for ind in population],
+            'scores': [score.to_dict() for score in scores],
+            'stats': stats or {},
+        })
+        # the generation is a natural checkpoint for the data on disk
+        self.flush()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def iter_records(path):
+    """Yields records of the log and its backups, oldest first"""
+    backups = []
+    idx = 1
+    while os.path.exists('{}.{}'.format(path, idx)):
+        backups.append('{}.{}'.format(path, idx))
+        idx += 1
+    for filename in reversed(backups + [path]):
+        if not os.path.exists(filename):
+            continue
+        with open(filename) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def individual_stats(path):
+    """
+    Aggregates game records into per-individual statistics,
+    keeping only the accumulated numbers in memory.
+    Keys are genomes serialized with json.dumps(genome, sort_keys=True).
+    """
+    stats = {}
+    for record in iter_records(path):
+        if record['type'] != 'game':
+            continue
+        for color, genome in [('b', record['black']), ('w', record['white'])]:
+            key = json.dumps(genome, sort_keys=True)
+            item = stats.setdefault(key, {
+                'games': 0, 'wins': 0, 'draws': 0, 'disqualified': 0,
+                'moves': 0, 'time': 0.0, 'cpu_time': 0.0, 'nodes': 0,
+            })
+            item['games'] += 1
+            if record['disqualified'] == color:
+                item['disqualified'] += 1
+            elif record['disqualified'] is None:
+                if record['winner'] == color:
+                    item['wins'] += 1
+                elif record['winner'] is None:
+                    item['draws'] += 1
+            times = record['times'][color]
+            item['moves'] += len(times)
+            item['time'] += sum(times)
+            item['cpu_time'] += sum(record['cpu_times'][color])
+            item['nodes'] += sum(record['nodes'][color])
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Per-individual statistics of an evolution log')
+    parser.add_argument('log')
+    args = parser.parse_args(argv)
+
+    stats = individual_stats(args.log)
+    rows = sorted(stats.items(),
+                  key=lambda item: item[1]['wins'] / item[1]['games'],
+                  reverse=True)
+    print('{:>6} {:>6} {:>6} {:>5} {:>10} {:>12}  {}'.format(
+        'games', 'wins', 'draws', 'disq', 'cpu/move', 'nodes/move',
+        'genome'))
+    for key, item in rows:
+        moves = item['moves'] or 1
+        print('{:>6} {:>6} {:>6} {:>5} {:>10.4f} {:>12.1f}  {}'.format(
+            item['games'], item['wins'], item['draws'], item['disqualified'],
+            item['cpu_time'] / moves, item['nodes'] / moves, key))
+
+
+if __name__ == '__main__':
+    main()
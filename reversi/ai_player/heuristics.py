@@ -8,10 +8,11 @@ __all__ = ['win_state_utility', 'material_advantage_estimation',
 
 def max_depth_decision(middle, end):
     def choose_max_depth(game, player):
+        num_cells = game.size * game.size
         num_empty = sum(1 for _, cell in game.iter_cells() if cell is None)
-        if num_empty > (NUM_CELLS - 10):
+        if num_empty > (num_cells - 10):
             return 2
-        elif num_empty < (NUM_CELLS / 5):
+        elif num_empty < (num_cells / 5):
             return end
         else:
             return middle
@@ -41,25 +42,31 @@ def material_advantage_estimation(weight_ratio):
 
         return weight_ratio * utility_by_count + (weight_ratio - 1) * utility_by_moves
 
+    # the largest absolute value, both utilities are in [-1, 1]
+    estimate_material_advantage.value_bound = \
+        abs(weight_ratio) + abs(weight_ratio - 1)
     return estimate_material_advantage
 
 
 def positional_advantage_estimation(corner_weight, side_weight, insider_ratio):
 
     def estimate_positional_advantage(game, player):
+        size = game.size
+        num_cells = size * size
         num_empty = sum(1 for _, cell in game.iter_cells() if cell is None)
         position_significance = (
-            0 if num_empty < NUM_CELLS / 4
-            else (4/3) * num_empty / NUM_CELLS - (1/3)
+            0 if num_empty < num_cells / 4
+            else (4/3) * num_empty / num_cells - (1/3)
         )
+        neighbours = _neighbours(size)
         value = 0
         all_cells_weight = 0
         for position, cell in game.iter_cells():
             if cell is None:
                 continue
             opponents_around, total_around = 0, 0
-            for pos in _iter_around(position):
-                cell_beside = game.get(pos)
+            for pos in neighbours[position]:
+                cell_beside = game[pos]
                 if cell_beside is None:
                     continue
                 total_around += 1
@@ -69,9 +76,9 @@ def positional_advantage_estimation(corner_weight, side_weight, insider_ratio):
             if position_significance == 0:
                 weight = 1
             else:
-                if _is_corner(position):
+                if _is_corner(position, size):
                     weight = corner_weight
-                elif _is_side(position):
+                elif _is_side(position, size):
                     weight = side_weight
                 else:
                     weight = 1
@@ -82,22 +89,24 @@ def positional_advantage_estimation(corner_weight, side_weight, insider_ratio):
                 incr = -incr
             value += incr
 
-        return value / (all_cells_weight + insider_ratio*(NUM_CELLS-num_empty))
+        return value / (all_cells_weight + insider_ratio*(num_cells-num_empty))
 
+    # a share of the weights, beyond 1 only with a negative insider_ratio
+    estimate_positional_advantage.value_bound = 1
     return estimate_positional_advantage
 
 
-def _is_corner(position):
+def _is_corner(position, size=Reversi.FIELD_SIZE):
     return (
-        position[0] in (0, Reversi.FIELD_SIZE-1)
-        and position[1] in (0, Reversi.FIELD_SIZE-1)
+        position[0] in (0, size-1)
+        and position[1] in (0, size-1)
     )
 
 
-def _is_side(position):
+def _is_side(position, size=Reversi.FIELD_SIZE):
     return (
-        position[0] in (0, Reversi.FIELD_SIZE - 1)
-        or position[1] in (0, Reversi.FIELD_SIZE - 1)
+        position[0] in (0, size - 1)
+        or position[1] in (0, size - 1)
     )
 
 
@@ -109,4 +118,23 @@ def _iter_around(position):
             yield (position[0]+d_row, position[1]+d_col)
 
 
+# of every board size: {position: the positions around it on the board}
+_NEIGHBOURS = {}
+
+
+def _neighbours(size):
+    neighbours = _NEIGHBOURS.get(size)
+    if neighbours is None:
+        neighbours = _NEIGHBOURS[size] = {
+            (row_id, col_id): [
+                (row, col) for row, col in _iter_around((row_id, col_id))
+                if 0 <= row < size and 0 <= col < size
+            ]
+            for row_id in range(size)
+            for col_id in range(size)
+        }
+    return neighbours
+
+
+# of the default board size
 NUM_CELLS = Reversi.FIELD_SIZE * Reversi.FIELD_SIZE
@@ -0,0 +1,82 @@
+import os
+import json
+import sqlite3
+import hashlib
+from .evolution import MatchResult, individual_to_genome
+
+
+__all__ = ['MatchCache', 'code_version']
+
+
+def code_version(extra_files=()):
+    """
+    Fingerprint of the code which decides game results.
+    The AIs are deterministic, so a cached result stays valid
+    until the game rules, the search or the heuristics change.
+    Pass the file with your ai_factories as `extra_files`.
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ai_player_dir = os.path.join(package_dir, 'ai_player')
+    files = [os.path.join(package_dir, 'game.py')]
+    files.extend(
+        os.path.join(ai_player_dir, name)
+        for name in sorted(os.listdir(ai_player_dir))
+        if name.endswith('.py')
+    )
+    files.extend(extra_files)
+    digest = hashlib.sha1()
+    for filename in files:
+        with open(filename, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class MatchCache(object):
+    """
+    On-disk store of match results keyed by
+    (black genome, white genome, code version).
+    """
+
+    def __init__(self, path, version=None):
+        self.version = version or code_version()
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS matches ('
+            '  black TEXT NOT NULL,'
+            '  white TEXT NOT NULL,'
+            '  version TEXT NOT NULL,'
+            '  result TEXT NOT NULL,'
+            '  PRIMARY KEY (black, white, version)'
+            ')'
+        )
+        self._db.commit()
+
+    def get(self, black, white):
+        row = self._db.execute(
+            'SELECT result FROM matches '
+            'WHERE black = ? AND white = ? AND version = ?',
+            (_genome_key(black), _genome_key(white), self.version)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return MatchResult.from_dict(json.loads(row[0]))
+
+    def put(self, black, white, result):
+        self._db.execute(
+            'INSERT OR REPLACE INTO matches (black, white, version, result) '
+            'VALUES (?, ?, ?, ?)',
+            (_genome_key(black), _genome_key(white), self.version,
+             json.dumps(result.to_dict()))
+        )
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def _genome_key(individual):
+    return json.dumps(individual_to_genome(individual), sort_keys=True)
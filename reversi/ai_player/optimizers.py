@@ -0,0 +1,206 @@
+import math
+import random
+from ..game import Player
+from .evolution import (CrossoverOptimizer, run_evolution, run_game,
+                        make_ais, individual_to_genome,
+                        individual_from_genome)
+
+
+__all__ = ['CrossoverOptimizer', 'EvolutionStrategy', 'OPTIMIZERS',
+           'compare_optimizers']
+
+
+class EvolutionStrategy(object):
+    """
+    Separable (mu/mu_w, lambda) evolution strategy, run independently
+    for every individual type over its attribute vector.
+
+    Each generation samples a fixed number of `offspring` around the
+    type's mean with per-attribute step sizes; the tournament then ranks
+    them together with the mean itself. The new mean is the weighted
+    recombination of the best `parents`, and the step sizes follow
+    the spread of those parents (rank-mu update of a diagonal
+    covariance, as in sep-CMA-ES but without evolution paths).
+    """
+
+    Name = 'es'
+
+    def __init__(self, offspring=4, parents=None, sigma=0.3,
+                 learning_rate=0.5, min_sigma=0.01):
+        self.offspring = offspring
+        self.parents = parents or max(1, offspring // 2)
+        self.sigma = sigma
+        self.learning_rate = learning_rate
+        self.min_sigma = min_sigma
+        # type name -> {'mean': individual, 'sigmas': [float]}
+        self._state = {}
+
+    def propose(self, population):
+        if not self._state:
+            self._init_state(population)
+        candidates = []
+        for type_state in self._state.values():
+            mean = type_state['mean']
+            candidates.append(mean)
+            for _ in range(self.offspring):
+                candidates.append(mean.with_values([
+                    value + random.gauss(0, sigma)
+                    for value, sigma in zip(mean.values(),
+                                            type_state['sigmas'])
+                ]))
+        return candidates
+
+    def _init_state(self, population):
+        by_type = {}
+        for individual in population:
+            by_type.setdefault(individual.type_name(), []).append(individual)
+        for type_name, individuals in by_type.items():
+            vectors = [ind.values() for ind in individuals]
+            mean_values = [sum(column) / len(column)
+                           for column in zip(*vectors)]
+            sigmas = [
+                max(self.sigma * max(abs(mean_value), 1),
+                    _std_dev(column, mean_value))
+                for column, mean_value in zip(zip(*vectors), mean_values)
+            ]
+            self._state[type_name] = {
+                'mean': individuals[0].with_values(mean_values),
+                'sigmas': sigmas,
+            }
+
+    def select(self, pop_with_scores, population_size):
+        weights = _recombination_weights(self.parents)
+        survivors = []
+        for type_name, type_state in self._state.items():
+            ranked = [
+                individual for individual, _ in pop_with_scores
+                if individual.type_name() == type_name
+            ][:self.parents]
+            if not ranked:
+                # the whole type was disqualified, keep its distribution
+                continue
+            type_weights = weights[:len(ranked)]
+            weights_sum = sum(type_weights)
+            old_mean = type_state['mean'].values()
+            vectors = [ind.values() for ind in ranked]
+            new_mean = [
+                sum(w * vector[idx] for w, vector in zip(type_weights, vectors))
+                / weights_sum
+                for idx in range(len(old_mean))
+            ]
+            new_sigmas = []
+            for idx, sigma in enumerate(type_state['sigmas']):
+                spread = sum(
+                    w * (vector[idx] - old_mean[idx]) ** 2
+                    for w, vector in zip(type_weights, vectors)
+                ) / weights_sum
+                variance = ((1 - self.learning_rate) * sigma ** 2
+                            + self.learning_rate * spread)
+                new_sigmas.append(max(math.sqrt(variance), self.min_sigma))
+            type_state['mean'] = type_state['mean'].with_values(new_mean)
+            type_state['sigmas'] = new_sigmas
+            survivors.extend(ranked)
+        selected = [item for item in pop_with_scores if item[0] in survivors]
+        return selected[:population_size]
+
+    def get_state(self):
+        return {
+            type_name: {
+                'mean': individual_to_genome(type_state['mean']),
+                'sigmas': type_state['sigmas'],
+            }
+            for type_name, type_state in self._state.items()
+        }
+
+    def set_state(self, state):
+        self._state = {
+            type_name: {
+                'mean': individual_from_genome(type_state['mean']),
+                'sigmas': type_state['sigmas'],
+            }
+            for type_name, type_state in state.items()
+        }
+
+
+def _recombination_weights(parents):
+    return [math.log(parents + 0.5) - math.log(rank)
+            for rank in range(1, parents + 1)]
+
+
+def _std_dev(values, mean):
+    return math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+
+
+OPTIMIZERS = {
+    cls.Name: cls
+    for cls in [CrossoverOptimizer, EvolutionStrategy]
+}
+
+
+def compare_optimizers(population, ai_factories, optimizers, reference,
+                       seed=0, **evolution_kwargs):
+    """
+    Runs the same evolution with each of `optimizers`, from the same
+    random seed, and reports how many games each run took and how
+    the best individual it ends with scores against the `reference`
+    individuals, playing every one of them with both colours.
+    `evolution_kwargs` go to run_evolution and run_game.
+    """
+    report = []
+    for optimizer in optimizers:
+        random.seed(seed)
+        counter = _GameCounter()
+        run_evolution(population, ai_factories, optimizer=optimizer,
+                      game_log=counter, **evolution_kwargs)
+        best = counter.population[0]
+        report.append((optimizer.Name, counter.games, best,
+                       _reference_score(best, reference, ai_factories,
+                                        evolution_kwargs)))
+
+    print('{:<12} {:>8} {:>10}  {}'.format(
+        'optimizer', 'games', 'vs ref', 'best'))
+    for name, games_cnt, best, score in report:
+        print('{:<12} {:>8} {:>10.3f}  {}, {}'.format(
+            name, games_cnt, score, best.type_name(), best))
+    return report
+
+
+class _GameCounter(object):
+    """game_log of run_evolution which keeps only what the report needs"""
+
+    def __init__(self):
+        self.games = 0
+        self.population = None
+
+    def log_game(self, gen_id, black, white, result, cached):
+        self.games += 1
+
+    def log_generation(self, gen_id, population, scores, stats):
+        self.population = population
+
+
+def _reference_score(individual, reference, ai_factories, evolution_kwargs):
+    # 1 for a win, 1/2 for a draw; a disqualification loses the game
+    game_kwargs = {
+        key: evolution_kwargs[key]
+        for key in ('time_limit', 'isolated', 'adjudication', 'clock',
+                    'board_size')
+        if key in evolution_kwargs
+    }
+    points = []
+    for opponent in reference:
+        for player, black, white in [(Player.Black, individual, opponent),
+                                     (Player.White, opponent, individual)]:
+            result = run_game(
+                *make_ais(ai_factories, black, white,
+                          evolution_kwargs.get('clock'),
+                          evolution_kwargs.get('ai_options')),
+                **game_kwargs
+            )
+            if result.disqualified is not None:
+                points.append(int(result.disqualified != player))
+            elif result.winner is None:
+                points.append(0.5)
+            else:
+                points.append(int(result.winner == player))
+    return sum(points) / len(points)
@@ -0,0 +1,375 @@
+"""
+Multi-ProbCut forward pruning.
+
+The value of a deep search of a position is predicted by a shallow
+search of it, `deep = a * shallow + b` with a normal error of
+deviation `sigma`. Before a node of height `deep` is searched, the
+shallow search checks whether the deep value is outside the window
+with a probability given by `threshold` (in sigmas); if so the node
+is cut off at once. There are regressions for several (shallow, deep)
+depth pairs and game stages, the shallow searches are tried from
+the cheapest one.
+
+The regressions are fitted to logged pairs of search values of sample
+positions: searches of every depth of the pairs are run for every
+position and appended to a JSON lines log, which later calibrations
+continue. The result is written to a JSON file mapping the AI name
+to the ProbCut parameters, which the AI factories take from
+the REVERSI_PROBCUT environment variable (see ready_to_go.load_probcut).
+Parameters are fitted for the estimation function of one AI spec,
+they fit other weights of the same heuristic only roughly, and for
+one board size, the AIs don't use them on other boards.
+
+    python -m reversi.ai_player.probcut calibrate \\
+        material:weight_ratio=1.5 --records DATA [DATA ...] \\
+        --log searches.jsonl --output probcut.json
+"""
+import os
+import json
+import math
+import time
+import random
+import argparse
+import collections
+from ..game import Reversi
+from ..records import (RecordReader, KIND_POSITIONS, KIND_LABELLED,
+                       game_from_masks)
+from .endgame import count_empty
+from .selfplay import parse_ai_spec, AI_FACTORIES
+
+
+__all__ = ['ProbCut', 'Cut', 'fit', 'log_searches', 'evaluate']
+
+
+# deep ~ a * shallow + b, with a normal error of deviation sigma
+Cut = collections.namedtuple('Cut', 'shallow a b sigma')
+
+DEFAULT_PAIRS = ((1, 3), (2, 4), (3, 5))
+
+
+class ProbCut(object):
+    """
+    cuts: {(stage, deep): [Cut, ...]}; a game of `stages` stages
+    is in stage filled_cells * stages // cells. The cuts are fitted
+    on boards of `board_size`.
+    """
+
+    def __init__(self, cuts, stages=4, threshold=1.5,
+                 board_size=Reversi.FIELD_SIZE):
+        self.cuts_by_height = {
+            key: sorted(cuts_, key=lambda cut: cut.shallow)
+            for key, cuts_ in cuts.items()
+        }
+        self.stages = stages
+        self.threshold = threshold
+        self.board_size = board_size
+
+    def stage(self, game, empties=None):
+        cells = game.size * game.size
+        if empties is None:
+            empties = count_empty(game)
+        return min(self.stages - 1, (cells - empties) * self.stages // cells)
+
+    def cuts(self, game, height):
+        """Cuts of a node searched `height` plies deeper, cheapest first"""
+        # a fractional depth is searched to the next whole ply
+        height = math.ceil(height)
+        empties = count_empty(game)
+        # the search reaches the end of the game, the regressions
+        # of the estimation don't apply
+        if empties <= height:
+            return []
+        return self.cuts_by_height.get((self.stage(game, empties), height), [])
+
+    def to_dict(self):
+        return {
+            'board_size': self.board_size,
+            'stages': self.stages,
+            'threshold': self.threshold,
+            'cuts': [
+                dict(cut._asdict(), stage=stage, deep=deep)
+                for (stage, deep), cuts_ in sorted(self.cuts_by_height.items())
+                for cut in cuts_
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        cuts = {}
+        for item in data['cuts']:
+            cuts.setdefault((item['stage'], item['deep']), []).append(
+                Cut(item['shallow'], item['a'], item['b'], item['sigma']))
+        # files without the size were calibrated on the default board
+        return cls(cuts, data['stages'], data['threshold'],
+                   data.get('board_size', Reversi.FIELD_SIZE))
+
+
+def _make_ai(spec, player, max_depth, **kwargs):
+    name, spec_kwargs = parse_ai_spec(spec)
+    spec_kwargs.update(kwargs, max_depth=max_depth)
+    return AI_FACTORIES[name](player, **spec_kwargs)
+
+
+def sample_positions(paths, count, seed=0):
+    """
+    `count` positions picked at random from the record files,
+    which may be of any kind; positions of games are replayed
+    """
+    rng = random.Random(seed)
+    positions = []
+    seen = 0
+    for path in paths:
+        for game in _iter_record_positions(path):
+            if game.is_game_over:
+                continue
+            # reservoir sampling
+            seen += 1
+            if len(positions) < count:
+                positions.append(game)
+            else:
+                index = rng.randrange(seen)
+                if index < count:
+                    positions[index] = game
+    return positions
+
+
+def _iter_record_positions(path):
+    with RecordReader(path) as reader:
+        if reader.kind == KIND_POSITIONS:
+            yield from reader.iter_positions()
+        elif reader.kind == KIND_LABELLED:
+            for record in reader.iter_labelled():
+                yield game_from_masks(*record[:3], reader.board_size)
+        else:
+            for game, moves in reader.iter_games():
+                yield game.copy()
+                for move in moves:
+                    game.make_move(*move)
+                    yield game.copy()
+
+
+def random_positions(count, seed=0, size=None):
+    """Positions of random games, of every stage"""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = Reversi.New(size)
+        plies = rng.randrange(game.size * game.size - 4)
+        for _ in range(plies):
+            if game.is_game_over:
+                break
+            game.make_move(*rng.choice(sorted(game.get_possible_moves())))
+        if not game.is_game_over:
+            positions.append(game)
+    return positions
+
+
+def log_searches(positions, spec, depths, log_file, report=print):
+    """
+    Appends to the open `log_file` a JSON line of every position:
+    its empty and all cells and {depth: value} of its searches.
+    Values are taken from the side to move in even positions
+    and from the other side in odd ones, as the search evaluates
+    nodes of both players.
+    """
+    start_time = time.time()
+    for index, game in enumerate(positions):
+        player = game.current_player
+        if index % 2:
+            player = player.opponent
+        values = {}
+        for depth in depths:
+            ai = _make_ai(spec, player, depth)
+            values[depth] = ai.search_value(game, depth)
+        log_file.write(json.dumps({
+            'empties': count_empty(game),
+            'cells': game.size * game.size,
+            'values': values,
+        }) + '\n')
+        log_file.flush()
+        if (index + 1) % 10 == 0:
+            report('{} positions searched, {:.1f} s'.format(
+                index + 1, time.time() - start_time))
+
+
+def read_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def fit(entries, pairs=DEFAULT_PAIRS, stages=4, threshold=1.5,
+        min_samples=20, board_size=Reversi.FIELD_SIZE):
+    """
+    ProbCut of linear regressions of the logged values of positions
+    of `board_size` for every stage and (shallow, deep) pair with
+    at least `min_samples` positions; pairs whose shallow values
+    don't predict the deep ones (a <= 0) are left out.
+    Returns (ProbCut, {(stage, shallow, deep): samples count})
+    """
+    samples = collections.defaultdict(list)
+    for entry in entries:
+        cells = entry['cells']
+        if cells != board_size * board_size:
+            continue
+        stage = min(stages - 1,
+                    (cells - entry['empties']) * stages // cells)
+        values = {int(depth): value
+                  for depth, value in entry['values'].items()}
+        for shallow, deep in pairs:
+            if shallow not in values or deep not in values:
+                continue
+            # the deep search reached the end of the game
+            if entry['empties'] <= deep:
+                continue
+            pair = values[shallow], values[deep]
+            if all(math.isfinite(value) for value in pair):
+                samples[stage, shallow, deep].append(pair)
+
+    cuts = {}
+    counts = {}
+    for (stage, shallow, deep), points in sorted(samples.items()):
+        counts[stage, shallow, deep] = len(points)
+        if len(points) < min_samples:
+            continue
+        a, b, sigma = _regression(points)
+        if a > 0:
+            cuts.setdefault((stage, deep), []).append(
+                Cut(shallow, a, b, sigma))
+    return ProbCut(cuts, stages, threshold, board_size), counts
+
+
+def _regression(points):
+    """Least squares y = a * x + b of (x, y), and the residual deviation"""
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    a = cov / var_x if var_x else 0
+    b = mean_y - a * mean_x
+    residuals = sum((y - a * x - b) ** 2 for x, y in points)
+    sigma = math.sqrt(residuals / max(1, count - 2))
+    return a, b, sigma
+
+
+def evaluate(positions, spec, probcut, depth):
+    """
+    Searches the positions to `depth` with and without ProbCut:
+    -> (nodes without, nodes with, share of the same moves)
+    """
+    full_nodes = pruned_nodes = agreed = 0
+    for game in positions:
+        player = game.current_player
+        full_ai = _make_ai(spec, player, depth)
+        pruned_ai = _make_ai(spec, player, depth, probcut=probcut)
+        full_move = full_ai(game)[0]
+        pruned_move = pruned_ai(game)[0]
+        full_nodes += full_ai.nodes_searched
+        pruned_nodes += pruned_ai.nodes_searched
+        agreed += full_move == pruned_move
+    return full_nodes, pruned_nodes, agreed / len(positions)
+
+
+def _parse_pairs(text):
+    return tuple(
+        tuple(int(depth) for depth in pair.split(':'))
+        for pair in text.split(',')
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ProbCut calibration')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    calibrate_parser = subparsers.add_parser(
+        'calibrate', help='log searches of sample positions, fit '
+                          'the regressions and test them')
+    calibrate_parser.add_argument(
+        'spec', help='AI spec whose estimation is calibrated, '
+                     'e.g. material:weight_ratio=1.5; max_depth is ignored')
+    calibrate_parser.add_argument(
+        '--records', nargs='*', default=[],
+        help='record files to take positions from, random games otherwise')
+    calibrate_parser.add_argument('--positions', type=int, default=200,
+                                  help='new positions to search and log')
+    calibrate_parser.add_argument('--log', required=True,
+                                  help='JSON lines log of searches, '
+                                       'appended to')
+    calibrate_parser.add_argument('--pairs', type=_parse_pairs,
+                                  default=DEFAULT_PAIRS,
+                                  metavar='SHALLOW:DEEP,...')
+    calibrate_parser.add_argument('--stages', type=int, default=4)
+    calibrate_parser.add_argument('--threshold', type=float, default=1.5,
+                                  help='safety margin of a cut in sigmas')
+    calibrate_parser.add_argument('--test-positions', type=int, default=20)
+    calibrate_parser.add_argument('--test-depth', type=int, default=None,
+                                  help='depth of the test searches, '
+                                       'the deepest of the pairs by default')
+    calibrate_parser.add_argument('--board-size', type=int,
+                                  default=Reversi.FIELD_SIZE,
+                                  help='board of the random positions, '
+                                       'without --records')
+    calibrate_parser.add_argument('--seed', type=int, default=0)
+    calibrate_parser.add_argument('--output',
+                                  help='JSON file of ProbCut parameters '
+                                       'by AI name, updated')
+    args = parser.parse_args(argv)
+
+    name, _ = parse_ai_spec(args.spec)
+    depths = sorted({depth for pair in args.pairs for depth in pair})
+    logged = read_log(args.log) if os.path.exists(args.log) else []
+    # a run continuing the log samples other positions
+    seed = '{}:{}'.format(args.seed, len(logged))
+    count = args.positions + args.test_positions
+    if args.records:
+        positions = sample_positions(args.records, count, seed)
+    else:
+        positions = random_positions(count, seed, args.board_size)
+    positions, test_positions = \
+        positions[:args.positions], positions[args.positions:]
+
+    if positions:
+        with open(args.log, 'a') as log_file:
+            log_searches(positions, args.spec, depths, log_file)
+    # sampled records may be of another size than --board-size
+    board_size = positions[0].size if positions else args.board_size
+    probcut, counts = fit(read_log(args.log), args.pairs, args.stages,
+                          args.threshold, board_size=board_size)
+    for (stage, shallow, deep), samples in sorted(counts.items()):
+        cut = next((cut for cut in probcut.cuts_by_height.get(
+            (stage, deep), []) if cut.shallow == shallow), None)
+        if cut is None:
+            print('stage {} {}:{}  {} samples, not used'.format(
+                stage, shallow, deep, samples))
+        else:
+            print('stage {} {}:{}  {} samples, a={:.3f} b={:.3f} '
+                  'sigma={:.3f}'.format(stage, shallow, deep, samples,
+                                        cut.a, cut.b, cut.sigma))
+
+    if not test_positions:
+        return _save(args.output, name, probcut)
+    test_depth = args.test_depth or max(deep for _, deep in args.pairs)
+    full_nodes, pruned_nodes, agreement = evaluate(
+        test_positions, args.spec, probcut, test_depth)
+    print('depth {}: {} nodes without ProbCut, {} with ({:.1%} fewer), '
+          '{:.1%} of the moves the same'.format(
+              test_depth, full_nodes, pruned_nodes,
+              1 - pruned_nodes / max(1, full_nodes), agreement))
+
+    _save(args.output, name, probcut)
+
+
+def _save(path, name, probcut):
+    if not path:
+        return
+    params = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            params = json.load(f)
+    params[name] = probcut.to_dict()
+    with open(path, 'w') as f:
+        json.dump(params, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
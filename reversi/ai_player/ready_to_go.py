@@ -1,32 +1,110 @@
+import os
+import json
 import random
 from . import heuristics, alpha_beta
+from .time_manager import TimeManager
 
 
-__all__ = ['random_ai', 'material_advantage_ai', 'positional_advantage_ai']
+__all__ = ['random_ai', 'material_advantage_ai', 'positional_advantage_ai',
+           'load_weights', 'load_endgame_cache', 'load_probcut']
 
 
 def random_ai():
-    def random_decide(game):
+    def random_decide(game, on_progress=None, time_left=None):
         moves = game.get_possible_moves()
         return random.choice(list(moves))
     return random_decide
 
 
-def material_advantage_ai(player, max_depth, weight_ratio):
+def material_advantage_ai(player, max_depth, weight_ratio,
+                          endgame_cache=None, game_time=None, increment=0,
+                          move_limit=None, probcut=None):
     return alpha_beta.alpha_beta_ai(
         player,
         max_depth,
         heuristics.material_advantage_estimation(weight_ratio),
         heuristics.win_state_utility,
+        endgame_cache=endgame_cache,
+        time_manager=_time_manager(game_time, increment, move_limit),
+        probcut=probcut,
     )
 
 
 def positional_advantage_ai(player, max_depth,
-                            corner_weight, side_weight, insider_ratio):
+                            corner_weight, side_weight, insider_ratio,
+                            endgame_cache=None, game_time=None, increment=0,
+                            move_limit=None, probcut=None):
     return alpha_beta.alpha_beta_ai(
         player, max_depth,
         heuristics.positional_advantage_estimation(
             corner_weight, side_weight, insider_ratio
         ),
         heuristics.win_state_utility,
+        endgame_cache=endgame_cache,
+        time_manager=_time_manager(game_time, increment, move_limit),
+        probcut=probcut,
     )
+
+
+def _time_manager(game_time, increment, move_limit):
+    # with a game clock of game_time seconds or a move_limit alone,
+    # max_depth is the deepest iteration of the search
+    if not game_time and not move_limit:
+        return None
+    return TimeManager(game_time or None, increment, move_limit)
+
+
+def load_weights(path=None):
+    """
+    Weights fitted by reversi.ai_player.tuning: {'material': kwargs,
+    'positional': kwargs} of the factories above. By default they are
+    read from the file in REVERSI_WEIGHTS; {} if it isn't set.
+    """
+    path = path or os.environ.get('REVERSI_WEIGHTS')
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+_endgame_caches = {}
+
+
+def load_endgame_cache(path=None):
+    """
+    EndgameCache of the file, by default the one in
+    REVERSI_ENDGAME_CACHE; None if it isn't set. All AIs of a process
+    share the cache object of the same file.
+    """
+    path = path or os.environ.get('REVERSI_ENDGAME_CACHE')
+    if not path:
+        return None
+    if path not in _endgame_caches:
+        # imported here to run `python -m reversi.ai_player.endgame_cache`
+        # without importing it twice
+        from .endgame_cache import EndgameCache
+        _endgame_caches[path] = EndgameCache(path)
+    return _endgame_caches[path]
+
+
+_probcuts = {}
+
+
+def load_probcut(path=None):
+    """
+    ProbCut parameters by AI name ('material', 'positional') of the file
+    written by `python -m reversi.ai_player.probcut calibrate`, by default
+    the one in REVERSI_PROBCUT; {} if it isn't set.
+    """
+    path = path or os.environ.get('REVERSI_PROBCUT')
+    if not path:
+        return {}
+    if path not in _probcuts:
+        # imported here for the same reason as EndgameCache
+        from .probcut import ProbCut
+        with open(path) as f:
+            _probcuts[path] = {
+                name: ProbCut.from_dict(data)
+                for name, data in json.load(f).items()
+            }
+    return _probcuts[path]
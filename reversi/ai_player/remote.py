@@ -0,0 +1,317 @@
+"""
+Tournament games played by remote worker processes.
+
+The coordinator (MatchServer) listens on a TCP ("host:port") or
+Unix socket (a path) address; workers connect to it and play the games
+it sends. Messages are JSON objects, one per line:
+
+    worker -> server  {"type": "hello", "worker": name}
+    server -> worker  {"type": "job", "id": n, "black": genome,
+                       "white": genome, "settings": {...}}
+    worker -> server  {"type": "heartbeat", "id": n}   while playing
+    worker -> server  {"type": "result", "id": n, "result": {...}}
+    worker -> server  {"type": "error", "id": n, "error": message}
+    server -> worker  {"type": "stop"}
+
+A job whose worker disconnects or stops sending heartbeats
+is given to another worker, at most MAX_REQUEUES times. A job
+which fails, or is lost too often, fails the whole run_matches call
+with MatchError, as does the lack of connected workers.
+
+Run a worker with:
+    python -m reversi.ai_player.remote ADDRESS MODULE:AI_FACTORIES
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import collections
+import importlib
+import threading
+import subprocess
+from ..game import Reversi, Player
+from .evolution import (MatchResult, Adjudication, run_game, make_ais,
+                        individual_to_genome, individual_from_genome)
+
+
+__all__ = ['MatchServer', 'MatchError', 'serve_worker',
+           'spawn_local_workers']
+
+
+HEARTBEAT_INTERVAL = 2
+MAX_REQUEUES = 3
+
+
+class MatchError(Exception):
+    pass
+
+
+class MatchServer(object):
+
+    def __init__(self, address, heartbeat_timeout=5 * HEARTBEAT_INTERVAL,
+                 no_workers_timeout=60):
+        self.address = address
+        self.heartbeat_timeout = heartbeat_timeout
+        # run_matches fails after this many seconds without workers
+        self.no_workers_timeout = no_workers_timeout
+        self._jobs = queue.Queue()
+        self._results = {}
+        self._errors = {}
+        self._requeues = collections.Counter()
+        self._workers = 0
+        self._last_worker_time = time.monotonic()
+        self._results_cond = threading.Condition()
+        self._next_job_id = 0
+        self._closed = False
+        self._listener = _listen(address)
+        self._accept_thread = threading.Thread(target=self._accept_loop,
+                                               daemon=True)
+        self._accept_thread.start()
+
+    def run_matches(self, pairs, time_limit, isolated, adjudication=None,
+                    clock=None, board_size=Reversi.FIELD_SIZE,
+                    ai_options=None):
+        """
+        Plays (black, white) individual pairs, returns MatchResults.
+        `ai_options` of the factories must be JSON serializable, paths
+        in them are paths on the worker hosts.
+        """
+        settings = {
+            'time_limit': time_limit,
+            'isolated': isolated,
+            'adjudication': adjudication and adjudication.__dict__,
+            'clock': clock,
+            'board_size': board_size,
+            'ai_options': ai_options,
+        }
+        job_ids = []
+        for black, white in pairs:
+            job_id = self._next_job_id
+            self._next_job_id += 1
+            job_ids.append(job_id)
+            self._jobs.put({
+                'type': 'job',
+                'id': job_id,
+                'black': individual_to_genome(black),
+                'white': individual_to_genome(white),
+                'settings': settings,
+            })
+        with self._results_cond:
+            while True:
+                failed = [job_id for job_id in job_ids
+                          if job_id in self._errors]
+                if failed:
+                    raise MatchError('job {} failed: {}'.format(
+                        failed[0], self._errors.pop(failed[0])))
+                if all(job_id in self._results for job_id in job_ids):
+                    break
+                now = time.monotonic()
+                if self._workers:
+                    self._last_worker_time = now
+                elif now - self._last_worker_time > self.no_workers_timeout:
+                    raise MatchError('no workers connected for {} s'.format(
+                        self.no_workers_timeout))
+                self._results_cond.wait(timeout=1)
+            return [
+                MatchResult.from_dict(self._results.pop(job_id))
+                for job_id in job_ids
+            ]
+
+    def close(self):
+        self._closed = True
+        self._listener.close()
+        if not _is_tcp(self.address) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_connection, args=(conn,),
+                             daemon=True).start()
+
+    def _serve_connection(self, conn):
+        conn.settimeout(self.heartbeat_timeout)
+        reader = conn.makefile('r')
+        job = None
+        with self._results_cond:
+            self._workers += 1
+        try:
+            _recv(reader)  # hello
+            while not self._closed:
+                try:
+                    job = self._jobs.get(timeout=1)
+                except queue.Empty:
+                    continue
+                _send(conn, job)
+                while True:
+                    # socket timeout here means a lost heartbeat
+                    message = _recv(reader)
+                    if message['type'] in ('result', 'error'):
+                        break
+                with self._results_cond:
+                    if message['type'] == 'result':
+                        self._results[job['id']] = message['result']
+                    else:
+                        self._errors[job['id']] = message['error']
+                    self._results_cond.notify_all()
+                job = None
+            _send(conn, {'type': 'stop'})
+        except (OSError, ValueError, EOFError):
+            pass
+        finally:
+            with self._results_cond:
+                self._workers -= 1
+                self._last_worker_time = time.monotonic()
+                if job is not None:
+                    self._requeue(job)
+                self._results_cond.notify_all()
+            conn.close()
+
+    def _requeue(self, job):
+        # the worker is lost, let somebody else play it,
+        # unless the job itself seems to kill the workers
+        self._requeues[job['id']] += 1
+        if self._requeues[job['id']] > MAX_REQUEUES:
+            self._errors[job['id']] = 'lost {} workers'.format(
+                self._requeues[job['id']])
+        else:
+            self._jobs.put(job)
+
+
+def serve_worker(address, ai_factories):
+    conn = _connect(address)
+    reader = conn.makefile('r')
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            _send(conn, message)
+
+    send({'type': 'hello', 'worker': '{}:{}'.format(socket.gethostname(),
+                                                    os.getpid())})
+    while True:
+        try:
+            job = _recv(reader)
+        except EOFError:
+            break
+        if job['type'] == 'stop':
+            break
+        done = threading.Event()
+
+        def heartbeat(job_id=job['id'], done=done):
+            while not done.wait(HEARTBEAT_INTERVAL):
+                send({'type': 'heartbeat', 'id': job_id})
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            result = _play_job(job, ai_factories)
+        except Exception as e:
+            # the job fails, the worker goes on
+            send({'type': 'error', 'id': job['id'], 'error': repr(e)})
+            continue
+        finally:
+            done.set()
+        send({'type': 'result', 'id': job['id'], 'result': result.to_dict()})
+    conn.close()
+
+
+def _play_job(job, ai_factories):
+    black = individual_from_genome(job['black'])
+    white = individual_from_genome(job['white'])
+    settings = job['settings']
+    adjudication = settings['adjudication']
+    clock = settings.get('clock')
+    return run_game(
+        *make_ais(ai_factories, black, white, clock,
+                  settings.get('ai_options')),
+        settings['time_limit'], settings['isolated'],
+        adjudication and Adjudication(**adjudication),
+        clock,
+        settings.get('board_size', Reversi.FIELD_SIZE),
+    )
+
+
+def spawn_local_workers(address, count, factories_spec):
+    """Starts `count` worker subprocesses on this host"""
+    return [
+        subprocess.Popen([sys.executable, '-m', __name__,
+                          address, factories_spec])
+        for _ in range(count)
+    ]
+
+
+def load_factories(spec):
+    """'module:attribute' -> the ai_factories dict"""
+    module_name, attr = spec.split(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _is_tcp(address):
+    return ':' in address and not address.startswith('/')
+
+
+def _listen(address):
+    if _is_tcp(address):
+        host, port = address.rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, int(port)))
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(address)
+    sock.listen()
+    return sock
+
+
+def _connect(address, retry_for=10):
+    deadline = time.time() + retry_for
+    while True:
+        if _is_tcp(address):
+            host, port = address.rsplit(':', 1)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            target = (host, int(port))
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            target = address
+        try:
+            sock.connect(target)
+            return sock
+        except OSError:
+            sock.close()
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def _send(conn, message):
+    conn.sendall((json.dumps(message) + '\n').encode())
+
+
+def _recv(reader):
+    line = reader.readline()
+    if not line:
+        raise EOFError
+    return json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Remote tournament worker')
+    parser.add_argument('address', help='host:port or Unix socket path')
+    parser.add_argument('factories',
+                        help='module:attribute of the ai_factories dict, '
+                             'e.g. run_evolution:ai_factories')
+    args = parser.parse_args(argv)
+    # the factories module usually lives in the current directory
+    sys.path.insert(0, os.getcwd())
+    serve_worker(args.address, load_factories(args.factories))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Self-play data generation.
+
+Games between two AIs are played by a pool of processes in chunks.
+Every chunk is written to its own file of labelled position records
+(see reversi.records) and listed in the manifest of the output
+directory once complete, so an interrupted run continues with
+the missing chunks only. Games are seeded by their number, thus
+a resumed run produces the same data as an uninterrupted one.
+"""
+import os
+import json
+import time
+import random
+import multiprocessing
+from ..game import Reversi, Player
+from ..records import RecordWriter, KIND_LABELLED
+from . import ready_to_go
+
+
+__all__ = ['SelfPlayConfig', 'run_selfplay', 'parse_ai_spec']
+
+
+MANIFEST = 'manifest.json'
+
+# short names of the `ready_to_go` factories usable in AI specs
+AI_FACTORIES = {
+    'material': ready_to_go.material_advantage_ai,
+    'positional': ready_to_go.positional_advantage_ai,
+}
+
+
+def parse_ai_spec(spec):
+    """
+    'material:max_depth=2,weight_ratio=1.5' -> (factory name, kwargs);
+    values are parsed as numbers
+    """
+    name, _, params = spec.partition(':')
+    if name not in AI_FACTORIES:
+        raise ValueError('unknown AI {!r}, expected one of: {}'.format(
+            name, ', '.join(AI_FACTORIES)))
+    kwargs = {}
+    for item in filter(None, params.split(',')):
+        key, value = item.split('=')
+        kwargs[key] = float(value) if '.' in value else int(value)
+    return name, kwargs
+
+
+def make_ai(spec, player, **overrides):
+    """The AI of the spec; `overrides` replace arguments of the spec"""
+    name, kwargs = parse_ai_spec(spec)
+    kwargs.update(overrides)
+    return AI_FACTORIES[name](player, **kwargs)
+
+
+class SelfPlayConfig(object):
+
+    def __init__(self, ai1, ai2, games, games_per_chunk=100,
+                 opening_plies=8, label_ai=None, seed=0,
+                 board_size=Reversi.FIELD_SIZE):
+        # AI specs, see parse_ai_spec; colours alternate between games
+        self.ai1 = ai1
+        self.ai2 = ai2
+        self.games = games
+        self.games_per_chunk = games_per_chunk
+        # random moves made before the AIs start playing
+        self.opening_plies = opening_plies
+        # spec of a (usually deeper) AI whose search value is stored
+        # as the score of every position
+        self.label_ai = label_ai
+        self.seed = seed
+        self.board_size = board_size
+
+    @property
+    def chunks_count(self):
+        return -(-self.games // self.games_per_chunk)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def play_game(config, game_id, ais, label_ais=None):
+    """
+    Plays a single game between the two `ais`, which are given
+    as dicts of AI functions by colour (an AI closure serves one player).
+    Returns [(position, disc_diff, score)],
+    where the disc difference is the final one and both it and
+    the score are from the point of view of the side to move
+    """
+    rng = random.Random('{}:{}'.format(config.seed, game_id))
+    game = Reversi.New(config.board_size)
+    for _ in range(config.opening_plies):
+        if game.is_game_over:
+            break
+        game.make_move(*rng.choice(sorted(game.get_possible_moves())))
+
+    # the first AI plays black in even games
+    if game_id % 2:
+        ais = {Player.Black: ais[1][Player.Black],
+               Player.White: ais[0][Player.White]}
+    else:
+        ais = {Player.Black: ais[0][Player.Black],
+               Player.White: ais[1][Player.White]}
+    positions = []
+    while not game.is_game_over:
+        player = game.current_player
+        score = float('nan')
+        if label_ais:
+            label_ais[player](game)
+            score = label_ais[player].last_value
+        positions.append((game.copy(), player, score))
+        game.make_move(*ais[player](game)[0])
+
+    black_cnt, white_cnt = game.get_scores()
+    return [
+        (position,
+         black_cnt - white_cnt if player == Player.Black
+         else white_cnt - black_cnt,
+         score)
+        for position, player, score in positions
+    ]
+
+
+def chunk_path(output_dir, chunk_id):
+    return os.path.join(output_dir, 'chunk-{:05d}.rec'.format(chunk_id))
+
+
+def _play_chunk(args):
+    config, output_dir, chunk_id = args
+    start_time = time.time()
+    ais = [
+        {player: make_ai(spec, player) for player in Player}
+        for spec in [config.ai1, config.ai2]
+    ]
+    label_ais = None
+    if config.label_ai:
+        label_ais = {player: make_ai(config.label_ai, player)
+                     for player in Player}
+    first_game = chunk_id * config.games_per_chunk
+    last_game = min(first_game + config.games_per_chunk, config.games)
+    path = chunk_path(output_dir, chunk_id)
+    tmp_path = path + '.tmp'
+    # positions go to disk game by game, only the writer's buffer
+    # is kept in memory
+    with RecordWriter(tmp_path, KIND_LABELLED,
+                      board_size=config.board_size) as writer:
+        for game_id in range(first_game, last_game):
+            for position, disc_diff, score in play_game(
+                    config, game_id, ais, label_ais):
+                writer.write_labelled(position, disc_diff, score)
+        positions_cnt = writer.count
+    os.replace(tmp_path, path)
+    return {
+        'chunk_id': chunk_id,
+        'games': last_game - first_game,
+        'positions': positions_cnt,
+        'seconds': time.time() - start_time,
+    }
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def run_selfplay(config, output_dir, processes=None, report=print):
+    """
+    Plays the games of `config` into `output_dir`,
+    skipping chunks already listed in its manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    if manifest is None:
+        manifest = {'config': config.to_dict(), 'chunks': {}}
+        save_manifest(output_dir, manifest)
+    # manifests written before an option was added get its default
+    elif SelfPlayConfig.from_dict(manifest['config']).to_dict() != \
+            config.to_dict():
+        raise ValueError('{} holds data of another configuration: {}'
+                         .format(output_dir, manifest['config']))
+
+    pending = [
+        chunk_id for chunk_id in range(config.chunks_count)
+        if str(chunk_id) not in manifest['chunks']
+    ]
+    if not pending:
+        report('all {} chunks are done'.format(config.chunks_count))
+        return manifest
+    report('{} of {} chunks to play'.format(len(pending),
+                                            config.chunks_count))
+
+    start_time = time.time()
+    games_cnt, positions_cnt = 0, 0
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes) as pool:
+        tasks = [(config, output_dir, chunk_id) for chunk_id in pending]
+        for stats in pool.imap_unordered(_play_chunk, tasks):
+            manifest['chunks'][str(stats['chunk_id'])] = stats
+            save_manifest(output_dir, manifest)
+            games_cnt += stats['games']
+            positions_cnt += stats['positions']
+            elapsed = time.time() - start_time
+            report('chunk {}: {} games, {} positions; '
+                   'total {:.2f} games/s, {:.1f} positions/s'.format(
+                       stats['chunk_id'], stats['games'], stats['positions'],
+                       games_cnt / elapsed, positions_cnt / elapsed))
+    return manifest
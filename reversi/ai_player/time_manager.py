@@ -0,0 +1,137 @@
+"""
+Playing with a game clock: the total time of a player for the whole
+game, plus an optional increment added after every move.
+
+TimeManager budgets the moves of an AI, which searches by iterative
+deepening: it asks start_move for the budget of the move, then
+should_deepen after every finished iteration, and stops the search
+at the hard deadline. GameClock is the clock of a game, kept by the
+harness.
+"""
+import time
+from ..game import Player
+from .endgame import count_empty
+
+
+__all__ = ['TimeManager', 'GameClock']
+
+
+class TimeManager(object):
+    """
+    The target time of a move is the available clock divided among
+    the player's moves left (half of the empty cells), plus most of
+    the increment, scaled by the mobility of the position against
+    a typical one. After an iteration whose best move changed
+    the target is extended, after several iterations with the same
+    best move it is cut. The next iteration isn't started after
+    the target or if its predicted time, from the growth of
+    the iteration times, would pass the hard deadline.
+    Without a clock, `total` None, only `move_limit` bounds the moves.
+    """
+
+    # the part of the clock kept as a reserve against overheads
+    RESERVE_SHARE = 0.02
+    RESERVE_MIN = 0.05
+    # no move gets more than this part of the available clock
+    MAX_SHARE = 0.25
+    # the hard deadline, in targets
+    HARD_TARGETS = 4
+    TYPICAL_MOBILITY = 8
+    UNSTABLE_FACTOR = 1.5
+    STABLE_FACTOR = 0.6
+    STABLE_ITERATIONS = 3
+
+    def __init__(self, total, increment=0, move_limit=None):
+        self.total = total
+        self.increment = increment
+        self.move_limit = move_limit
+        self.remaining = total
+        self.target = self.hard = None
+        self._start_time = None
+        self._mobility = None
+        self._iteration_times = []
+        self._best_moves = []
+
+    def start_move(self, game, time_left=None):
+        """
+        Budgets the move; `time_left` is the clock as the harness sees it,
+        otherwise the time manager's own account is used.
+        Returns the hard deadline, a time.monotonic() value.
+        """
+        self._start_time = time.monotonic()
+        self._iteration_times = []
+        self._best_moves = []
+        self._mobility = len(game.get_possible_moves())
+        if self.total is None:
+            self.target = self.hard = 0.9 * self.move_limit
+            return self._start_time + self.hard
+        if time_left is not None:
+            self.remaining = time_left
+        reserve = max(self.RESERVE_MIN, self.RESERVE_SHARE * self.total)
+        available = max(0, self.remaining - reserve)
+        moves_left = max(1, (count_empty(game) + 1) // 2)
+        mobility_factor = min(2, max(
+            0.5, self._mobility / self.TYPICAL_MOBILITY))
+        target = (available / moves_left + 0.9 * self.increment) \
+            * mobility_factor
+        hard = min(available * self.MAX_SHARE + self.increment,
+                   target * self.HARD_TARGETS)
+        if self.move_limit is not None:
+            hard = min(hard, 0.9 * self.move_limit)
+        self.target, self.hard = min(target, hard), hard
+        return self._start_time + hard
+
+    def should_deepen(self, best_move):
+        """Called after every iteration with its best move"""
+        elapsed = time.monotonic() - self._start_time
+        self._iteration_times.append(elapsed - sum(self._iteration_times))
+        self._best_moves.append(best_move)
+
+        target = self.target
+        recent = self._best_moves[-self.STABLE_ITERATIONS:]
+        if len(recent) > 1 and recent[-1] != recent[-2]:
+            target *= self.UNSTABLE_FACTOR
+        elif len(recent) == self.STABLE_ITERATIONS and \
+                len(set(recent)) == 1:
+            target *= self.STABLE_FACTOR
+        target = min(target, self.hard)
+
+        # alpha-beta's effective branching factor is about the square
+        # root of the mobility, the last iterations tell better
+        growth = max(2, self._mobility ** 0.5)
+        if len(self._iteration_times) > 1 and self._iteration_times[-2] > 0:
+            growth = min(max(
+                self._iteration_times[-1] / self._iteration_times[-2], 1.5),
+                max(2, self._mobility))
+        predicted = self._iteration_times[-1] * growth
+        return elapsed < target and elapsed + predicted < self.hard
+
+    def end_move(self):
+        """Charges the move's time to the own account of the clock"""
+        spent = time.monotonic() - self._start_time
+        if self.total is not None:
+            self.remaining = self.remaining - spent + self.increment
+        return spent
+
+
+class GameClock(object):
+    """
+    Clocks of both players. A move is charged after it's made,
+    the increment is added if the player is still in time.
+    """
+
+    def __init__(self, total, increment=0):
+        self.total = total
+        self.increment = increment
+        self.remaining = {player: total for player in Player}
+
+    def time_left(self, player):
+        return self.remaining[player]
+
+    def charge(self, player, spent):
+        """Returns False if the player has run out of time"""
+        self.remaining[player] -= spent
+        if self.remaining[player] < 0:
+            return False
+        self.remaining[player] += self.increment
+        return True
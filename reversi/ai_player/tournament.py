@@ -0,0 +1,192 @@
+import math
+import random
+
+
+__all__ = ['RoundRobin', 'SwissSystem', 'ReferencePanel',
+           'SuccessiveHalving', 'SCHEDULERS', 'kendall_tau', 'top_overlap']
+
+
+class RoundRobin(object):
+    """
+    Every individual plays every other one with both colours.
+    This is the reference schedule: n*(n-1) games.
+    """
+
+    Name = 'round-robin'
+
+    def games_count(self, pop_size):
+        return pop_size * (pop_size - 1)
+
+    def schedule(self, pop_size, win_accs, disqualified):
+        yield [
+            (idx1, idx2)
+            for idx1 in range(pop_size)
+            for idx2 in range(pop_size)
+            if idx1 != idx2
+        ]
+
+
+class SwissSystem(object):
+    """
+    Each round individuals are sorted by their current win ratio
+    and neighbours play each other (with both colours).
+    Pairs which have already met are avoided when possible.
+    """
+
+    Name = 'swiss'
+
+    def __init__(self, rounds=None):
+        self.rounds = rounds
+
+    def _rounds(self, pop_size):
+        if self.rounds:
+            return self.rounds
+        return int(math.ceil(math.log2(max(pop_size, 2)))) + 2
+
+    def games_count(self, pop_size):
+        return self._rounds(pop_size) * 2 * (pop_size // 2)
+
+    def schedule(self, pop_size, win_accs, disqualified):
+        played = set()
+        for _ in range(self._rounds(pop_size)):
+            standings = [
+                idx for idx in range(pop_size)
+                if idx not in disqualified
+            ]
+            # shuffle first, so equal scores are paired randomly
+            random.shuffle(standings)
+            standings.sort(key=lambda idx: win_accs[idx].avg, reverse=True)
+            round_pairs = []
+            while len(standings) > 1:
+                idx1 = standings.pop(0)
+                opponent_pos = next(
+                    (pos for pos, idx2 in enumerate(standings)
+                     if frozenset((idx1, idx2)) not in played),
+                    0
+                )
+                idx2 = standings.pop(opponent_pos)
+                played.add(frozenset((idx1, idx2)))
+                round_pairs.append((idx1, idx2))
+                round_pairs.append((idx2, idx1))
+            yield round_pairs
+
+
+class ReferencePanel(object):
+    """
+    A panel of `size` randomly chosen individuals is fixed for the
+    whole tournament. Everyone plays the panel with both colours,
+    so all win ratios are measured against the same opponents.
+    """
+
+    Name = 'panel'
+
+    def __init__(self, size=4):
+        self.size = size
+
+    def games_count(self, pop_size):
+        panel_size = min(self.size, pop_size)
+        return (2 * panel_size * (pop_size - panel_size)
+                + panel_size * (panel_size - 1))
+
+    def schedule(self, pop_size, win_accs, disqualified):
+        panel = random.sample(range(pop_size), min(self.size, pop_size))
+        round_pairs = []
+        for idx in range(pop_size):
+            for ref_idx in panel:
+                if idx == ref_idx:
+                    continue
+                round_pairs.append((idx, ref_idx))
+                if idx not in panel:
+                    # games inside the panel are added from both sides
+                    round_pairs.append((ref_idx, idx))
+        yield round_pairs
+
+
+class SuccessiveHalving(object):
+    """
+    Racing: each round every individual still in the race plays
+    at least `opponents` random rivals with both colours, every pair
+    once, then the worse half is dropped from the race. Dropped
+    individuals keep their results.
+    """
+
+    Name = 'halving'
+
+    def __init__(self, opponents=2, min_survivors=4):
+        self.opponents = opponents
+        self.min_survivors = min_survivors
+
+    def _alive_counts(self, pop_size):
+        alive = pop_size
+        while True:
+            yield alive
+            if alive <= self.min_survivors:
+                break
+            alive = max(self.min_survivors, alive // 2)
+
+    def games_count(self, pop_size):
+        # at most, an individual drawn as a rival counts it as its own
+        opponents = min(self.opponents, max(pop_size - 1, 0))
+        return sum(2 * alive * opponents
+                   for alive in self._alive_counts(pop_size))
+
+    def schedule(self, pop_size, win_accs, disqualified):
+        alive = list(range(pop_size))
+        for alive_cnt in self._alive_counts(pop_size):
+            alive = [idx for idx in alive if idx not in disqualified]
+            alive.sort(key=lambda idx: win_accs[idx].avg, reverse=True)
+            alive = alive[:alive_cnt]
+            if len(alive) < 2:
+                return
+            round_pairs = []
+            paired = {idx: set() for idx in alive}
+            opponents = min(self.opponents, len(alive) - 1)
+            for idx1 in alive:
+                candidates = [idx for idx in alive
+                              if idx != idx1 and idx not in paired[idx1]]
+                rivals = random.sample(
+                    candidates,
+                    min(max(opponents - len(paired[idx1]), 0),
+                        len(candidates))
+                )
+                for idx2 in rivals:
+                    paired[idx1].add(idx2)
+                    paired[idx2].add(idx1)
+                    round_pairs.append((idx1, idx2))
+                    round_pairs.append((idx2, idx1))
+            yield round_pairs
+
+
+SCHEDULERS = {
+    cls.Name: cls
+    for cls in [RoundRobin, SwissSystem, ReferencePanel, SuccessiveHalving]
+}
+
+
+def kendall_tau(ranking1, ranking2):
+    """
+    Rank correlation of two orderings of the same items:
+    1 means identical order, -1 means reversed order.
+    """
+    pos2 = {item: pos for pos, item in enumerate(ranking2)}
+    items = [item for item in ranking1 if item in pos2]
+    concordant, discordant = 0, 0
+    for i, item1 in enumerate(items):
+        for item2 in items[i+1:]:
+            if pos2[item1] < pos2[item2]:
+                concordant += 1
+            else:
+                discordant += 1
+    total = concordant + discordant
+    if total == 0:
+        return 1.0
+    return (concordant - discordant) / total
+
+
+def top_overlap(ranking1, ranking2, top_k):
+    """Share of the first top_k items of ranking1 present in top_k of ranking2"""
+    if top_k <= 0:
+        return 1.0
+    top1 = set(ranking1[:top_k])
+    top2 = set(ranking2[:top_k])
+    return len(top1 & top2) / len(top1)
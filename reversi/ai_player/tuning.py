@@ -0,0 +1,499 @@
+"""
+Offline tuning of the heuristic weights on labelled positions
+(see reversi.ai_player.selfplay).
+
+Both heuristics are simple functions of a few features per position:
+
+    material    w * (u_count + u_moves) - u_moves
+    positional  (a0 + a . theta) / (b0 + b . theta),
+                theta = (corner_weight, side_weight, insider_ratio)
+
+so the weights are fitted by ridge-regularised least squares
+(Gauss-Newton for the positional ratio) on the precomputed features,
+without replaying any game. The regularisation pulls the weights
+towards their current defaults.
+
+Features are extracted with NumPy when it is installed,
+otherwise with the engine itself, which is much slower.
+
+    python -m reversi.ai_player.tuning DATA [DATA ...] --output weights.json
+
+The output maps 'material' and 'positional' to keyword arguments of
+the ready_to_go factories; the GUI forms use it as defaults when
+the REVERSI_WEIGHTS environment variable points to it
+(see ready_to_go.load_weights).
+"""
+import json
+import math
+import argparse
+from ..records import (RecordReader, KIND_LABELLED, HEADER_SIZE,
+                       game_from_masks)
+from .heuristics import _is_corner, _is_side, _iter_around
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+__all__ = ['load_dataset', 'fit_material', 'fit_positional', 'fit_all',
+           'board_features', 'material_estimate', 'positional_estimate',
+           'DEFAULT_WEIGHTS']
+
+
+# defaults of the GUI forms
+DEFAULT_WEIGHTS = {
+    'material': {'weight_ratio': 1.0},
+    'positional': {'corner_weight': 4.0, 'side_weight': 2.0,
+                   'insider_ratio': 1.0},
+}
+
+TARGETS = ('discs', 'result', 'score')
+
+_DIRECTIONS = [delta for delta in _iter_around((0, 0))]
+
+
+class Dataset(object):
+    """
+    Heuristic features of positions, from the point of view
+    of the side to move, as a dict of columns: NumPy arrays if it's
+    installed, lists otherwise
+    """
+
+    def __init__(self, columns, targets):
+        self.columns = columns
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.targets)
+
+    @property
+    def vectorized(self):
+        return numpy is not None and isinstance(self.targets, numpy.ndarray)
+
+    def apply(self, func):
+        """
+        func(features, target) with the arithmetic of a single position;
+        with NumPy it is called once for all positions
+        """
+        if self.vectorized:
+            return func(self.columns, self.targets)
+        names = list(self.columns)
+        return [
+            func(dict(zip(names, values)), target)
+            for values, target in zip(zip(*self.columns.values()),
+                                      self.targets)
+        ]
+
+
+def load_dataset(paths, target='discs', limit=None):
+    if target not in TARGETS:
+        raise ValueError('target must be one of {}'.format(TARGETS))
+    if numpy is not None:
+        return _load_numpy(paths, target, limit)
+    return _load_python(paths, target, limit)
+
+
+def _target(disc_diff, score, target, num_cells):
+    if target == 'discs':
+        return disc_diff / num_cells
+    elif target == 'result':
+        return (disc_diff > 0) - (disc_diff < 0)
+    return score
+
+
+# NumPy backend
+
+def _record_dtype(reader):
+    """Labelled records of the reader's board size, see reversi.records"""
+    size = reader.board_size
+    mask_bytes = (size * size + 7) // 8
+    dtype = numpy.dtype([
+        ('black', 'u1', (mask_bytes,)), ('white', 'u1', (mask_bytes,)),
+        ('side', 'u1'), ('disc_diff', 'i1' if size * size < 128 else '<i2'),
+        ('score', '<f4'),
+    ])
+    assert dtype.itemsize == reader.record_size
+    return dtype
+
+
+def _load_numpy(paths, target, limit):
+    arrays = []
+    size = None
+    for path in paths:
+        with RecordReader(path) as reader:
+            if reader.kind != KIND_LABELLED:
+                raise ValueError('{} has no labelled positions'.format(path))
+            if size is not None and reader.board_size != size:
+                raise ValueError('{} has positions of another board size'
+                                 .format(path))
+            size = reader.board_size
+            count = len(reader)
+            dtype = _record_dtype(reader)
+        arrays.append(numpy.fromfile(path, dtype=dtype,
+                                     count=count, offset=HEADER_SIZE))
+    records = numpy.concatenate(arrays)
+    if target == 'score':
+        records = records[~numpy.isnan(records['score'])]
+    # the limit counts the usable records, as in _load_python
+    records = records[:limit]
+
+    num_cells = size * size
+    shape = (len(records), size, size)
+
+    def unpack(masks):
+        # masks are little-endian, so are the bits of their bytes
+        bits = numpy.unpackbits(masks, axis=1, bitorder='little')
+        return bits[:, :num_cells].astype(bool).reshape(shape)
+    black, white = unpack(records['black']), unpack(records['white'])
+    black_moves = (records['side'] == 0)[:, None, None]
+    own = numpy.where(black_moves, black, white)
+    opp = numpy.where(black_moves, white, black)
+
+    if target == 'discs':
+        targets = records['disc_diff'] / num_cells
+    elif target == 'result':
+        targets = numpy.sign(records['disc_diff']).astype(float)
+    else:
+        targets = records['score'].astype(float)
+    return Dataset(board_features(own, opp), targets)
+
+
+def _shift(cells, d_row, d_col):
+    """result[r][c] = cells[r - d_row][c - d_col], False outside"""
+    size = cells.shape[1]
+    result = numpy.zeros_like(cells)
+    result[:, max(d_row, 0):size + min(d_row, 0),
+           max(d_col, 0):size + min(d_col, 0)] = \
+        cells[:, max(-d_row, 0):size + min(-d_row, 0),
+              max(-d_col, 0):size + min(-d_col, 0)]
+    return result
+
+
+def _mobility_numpy(player, opponent, empty):
+    moves = numpy.zeros_like(player)
+    for d_row, d_col in _DIRECTIONS:
+        line = _shift(player, d_row, d_col) & opponent
+        for _ in range(player.shape[1] - 3):
+            line |= _shift(line, d_row, d_col) & opponent
+        moves |= _shift(line, d_row, d_col) & empty
+    return moves.sum(axis=(1, 2))
+
+
+def board_features(own, opp):
+    """
+    Features of a stack of boards given as boolean arrays
+    (boards x rows x columns) of the own and the opponent's discs
+    """
+    def count(cells, mask=None):
+        if mask is not None:
+            cells = cells & mask
+        return cells.sum(axis=(1, 2)).astype(float)
+
+    size = own.shape[1]
+    num_cells = size * size
+    cells = [(row_id, col_id) for row_id in range(size)
+             for col_id in range(size)]
+    corners = numpy.array([[_is_corner(cell, size) for cell in cells]]) \
+        .reshape(1, size, size)
+    sides = numpy.array([[_is_side(cell, size) and not _is_corner(cell, size)
+                          for cell in cells]]) \
+        .reshape(1, size, size)
+    insiders = ~(corners | sides)
+    occupied = own | opp
+    empty = ~occupied
+
+    own_cnt, opp_cnt = count(own), count(opp)
+    own_moves = _mobility_numpy(own, opp, empty).astype(float)
+    opp_moves = _mobility_numpy(opp, own, empty).astype(float)
+    total_moves = own_moves + opp_moves
+
+    own_around = sum(_shift(own, *delta).astype(float)
+                     for delta in _DIRECTIONS)
+    opp_around = sum(_shift(opp, *delta).astype(float)
+                     for delta in _DIRECTIONS)
+    total_around = numpy.maximum(own_around + opp_around, 1)
+    insider_diff = (own * opp_around / total_around
+                    - opp * own_around / total_around).sum(axis=(1, 2))
+
+    occupied_cnt = own_cnt + opp_cnt
+    num_empty = num_cells - occupied_cnt
+    return {
+        'u_count': 2 * own_cnt / occupied_cnt - 1,
+        'u_moves': numpy.where(
+            total_moves > 0,
+            2 * own_moves / numpy.maximum(total_moves, 1) - 1, 0),
+        'significance': numpy.where(
+            num_empty < num_cells / 4, 0,
+            (4/3) * num_empty / num_cells - (1/3)),
+        'occupied': occupied_cnt,
+        'diff': own_cnt - opp_cnt,
+        'corner_diff': count(own, corners) - count(opp, corners),
+        'side_diff': count(own, sides) - count(opp, sides),
+        'inner_diff': count(own, insiders) - count(opp, insiders),
+        'corner_cnt': count(occupied, corners),
+        'side_cnt': count(occupied, sides),
+        'inner_cnt': count(occupied, insiders),
+        'insider_diff': insider_diff,
+        'own_moves': own_moves,
+        'opp_moves': opp_moves,
+    }
+
+
+# pure Python backend, computes the same features with the engine
+
+def _load_python(paths, target, limit):
+    columns = {}
+    targets = []
+    for path in paths:
+        with RecordReader(path) as reader:
+            if reader.kind != KIND_LABELLED:
+                raise ValueError('{} has no labelled positions'.format(path))
+            for black, white, side, disc_diff, score in reader.iter_labelled():
+                if limit is not None and len(targets) >= limit:
+                    break
+                if target == 'score' and math.isnan(score):
+                    continue
+                game = game_from_masks(black, white, side, reader.board_size)
+                for name, value in _board_features_python(game).items():
+                    columns.setdefault(name, []).append(value)
+                targets.append(_target(disc_diff, score, target,
+                                       game.size * game.size))
+    return Dataset(columns, targets)
+
+
+def _board_features_python(game):
+    player = game.current_player
+    size = game.size
+    features = dict.fromkeys([
+        'diff', 'corner_diff', 'side_diff', 'inner_diff',
+        'corner_cnt', 'side_cnt', 'inner_cnt', 'insider_diff',
+    ], 0)
+    occupied_cnt = own_cnt = 0
+    for position, cell in game.iter_cells():
+        if cell is None:
+            continue
+        sign = 1 if cell == player else -1
+        if _is_corner(position, size):
+            kind = 'corner'
+        elif _is_side(position, size):
+            kind = 'side'
+        else:
+            kind = 'inner'
+        features[kind + '_diff'] += sign
+        features[kind + '_cnt'] += 1
+        occupied_cnt += 1
+        own_cnt += cell == player
+        opponents_around, total_around = 0, 0
+        for pos in _iter_around(position):
+            cell_beside = game.get(pos)
+            if cell_beside is None:
+                continue
+            total_around += 1
+            if cell_beside != cell:
+                opponents_around += 1
+        features['insider_diff'] += sign * opponents_around / max(
+            total_around, 1)
+
+    own_moves = len(game.get_possible_moves(player))
+    opp_moves = len(game.get_possible_moves(player.opponent))
+    num_cells = size * size
+    num_empty = num_cells - occupied_cnt
+    features.update({
+        'u_count': 2 * own_cnt / occupied_cnt - 1,
+        'u_moves': (2 * own_moves / (own_moves + opp_moves) - 1
+                    if own_moves + opp_moves else 0),
+        'significance': (0 if num_empty < num_cells / 4
+                         else (4/3) * num_empty / num_cells - (1/3)),
+        'occupied': occupied_cnt,
+        'diff': 2 * own_cnt - occupied_cnt,
+        'own_moves': own_moves,
+        'opp_moves': opp_moves,
+    })
+    return features
+
+
+# the models; these functions work for a single position
+# as well as for NumPy columns
+
+def material_estimate(f, params):
+    weight_ratio = params['weight_ratio']
+    return weight_ratio * f['u_count'] + (weight_ratio - 1) * f['u_moves']
+
+
+def _material_gradient(f, params):
+    return [f['u_count'] + f['u_moves']]
+
+
+def _positional_parts(f, params):
+    """numerator a0 + a . theta, denominator b0 + b . theta, a and b"""
+    s = f['significance']
+    theta = [params['corner_weight'], params['side_weight'],
+             params['insider_ratio']]
+    a = [s * f['corner_diff'], s * f['side_diff'], f['insider_diff']]
+    b = [s * f['corner_cnt'], s * f['side_cnt'], f['occupied']]
+    numerator = ((1 - s) * f['diff'] + s * f['inner_diff']
+                 + sum(x * w for x, w in zip(a, theta)))
+    denominator = ((1 - s) * f['occupied'] + s * f['inner_cnt']
+                   + sum(x * w for x, w in zip(b, theta)))
+    return numerator, denominator, a, b
+
+
+def positional_estimate(f, params):
+    numerator, denominator, _, _ = _positional_parts(f, params)
+    return numerator / denominator
+
+
+def _positional_gradient(f, params):
+    numerator, denominator, a, b = _positional_parts(f, params)
+    return [(x * denominator - numerator * y) / denominator ** 2
+            for x, y in zip(a, b)]
+
+
+_MODELS = {
+    'material': (material_estimate, _material_gradient),
+    'positional': (positional_estimate, _positional_gradient),
+}
+
+
+def _normal_equations(dataset, model, params):
+    """J^T J and J^T r for the residuals r = target - estimate"""
+    estimate, gradient = _MODELS[model]
+
+    def row(f, t):
+        return gradient(f, params), t - estimate(f, params)
+
+    if dataset.vectorized:
+        columns, residuals = dataset.apply(row)
+        jacobian = numpy.stack(
+            [numpy.broadcast_to(column, residuals.shape) for column in columns],
+            axis=1)
+        return ((jacobian.T @ jacobian).tolist(),
+                (jacobian.T @ residuals).tolist())
+    jtj, jtr = None, None
+    for columns, residual in dataset.apply(row):
+        if jtj is None:
+            jtj = [[0.0] * len(columns) for _ in columns]
+            jtr = [0.0] * len(columns)
+        for i, x_i in enumerate(columns):
+            jtr[i] += x_i * residual
+            for j, x_j in enumerate(columns):
+                jtj[i][j] += x_i * x_j
+    return jtj, jtr
+
+
+def _solve(matrix, vector):
+    """Gaussian elimination with partial pivoting"""
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda idx: abs(rows[idx][col]))
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for row in range(col + 1, size):
+            ratio = rows[row][col] / rows[col][col]
+            for idx in range(col, size + 1):
+                rows[row][idx] -= ratio * rows[col][idx]
+    solution = [0.0] * size
+    for row in range(size - 1, -1, -1):
+        solution[row] = (rows[row][size] - sum(
+            rows[row][idx] * solution[idx]
+            for idx in range(row + 1, size))) / rows[row][row]
+    return solution
+
+
+def _sum_squares(dataset, model, params):
+    estimate = _MODELS[model][0]
+    errors = dataset.apply(lambda f, t: (estimate(f, params) - t) ** 2)
+    if dataset.vectorized:
+        return float(errors.sum())
+    return sum(errors)
+
+
+def rmse(dataset, model, params):
+    return math.sqrt(_sum_squares(dataset, model, params) / len(dataset))
+
+
+def _fit(dataset, model, l2, prior, max_iterations=50, tolerance=1e-6):
+    """
+    Minimises |target - estimate|^2 + l2 * n * |theta - prior|^2
+    by Gauss-Newton steps, halved while they don't reduce the cost.
+    `l2` is scaled by the dataset size n, so it doesn't depend on it.
+    """
+    names = list(DEFAULT_WEIGHTS[model])
+    prior = prior or DEFAULT_WEIGHTS[model]
+    penalty = l2 * len(dataset)
+
+    def cost(params):
+        return _sum_squares(dataset, model, params) + penalty * sum(
+            (params[name] - prior[name]) ** 2 for name in names)
+
+    params = dict(prior)
+    current_cost = cost(params)
+    for _ in range(max_iterations):
+        jtj, jtr = _normal_equations(dataset, model, params)
+        for idx, name in enumerate(names):
+            jtj[idx][idx] += penalty
+            jtr[idx] -= penalty * (params[name] - prior[name])
+        step = _solve(jtj, jtr)
+        for _ in range(20):
+            candidate = {name: params[name] + delta
+                         for name, delta in zip(names, step)}
+            candidate_cost = cost(candidate)
+            if candidate_cost <= current_cost:
+                break
+            step = [delta / 2 for delta in step]
+        else:
+            break
+        params, current_cost = candidate, candidate_cost
+        if max(abs(delta) for delta in step) < tolerance:
+            break
+    return params
+
+
+def fit_material(dataset, l2=1e-3, prior=None):
+    return _fit(dataset, 'material', l2, prior)
+
+
+def fit_positional(dataset, l2=1e-3, prior=None):
+    return _fit(dataset, 'positional', l2, prior)
+
+
+def fit_all(dataset, l2=1e-3):
+    return {
+        'material': fit_material(dataset, l2),
+        'positional': fit_positional(dataset, l2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Fit heuristic weights to labelled positions')
+    parser.add_argument('data', nargs='+',
+                        help='labelled record files, e.g. self-play chunks')
+    parser.add_argument('--target', choices=TARGETS, default='discs',
+                        help='final disc difference, game result '
+                             'or search score of the positions')
+    parser.add_argument('--l2', type=float, default=1e-3,
+                        help='pull of the weights towards the defaults')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='use at most this many positions')
+    parser.add_argument('--output', help='write the weights to this JSON file')
+    args = parser.parse_args(argv)
+
+    dataset = load_dataset(args.data, args.target, args.limit)
+    print('{} positions, features computed with {}'.format(
+        len(dataset), 'NumPy' if dataset.vectorized else 'pure Python'))
+    weights = fit_all(dataset, args.l2)
+    for model, params in weights.items():
+        print('{}: {}  rmse {:.4f} -> {:.4f}'.format(
+            model,
+            ', '.join('{}={:.4f}'.format(*item) for item in params.items()),
+            rmse(dataset, model, DEFAULT_WEIGHTS[model]),
+            rmse(dataset, model, params)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(weights, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Client of reversi.engine_server, and a load test built on it:
+
+    python -m reversi.engine_client ADDRESS --games 50
+    python -m reversi.engine_client --local --games 50
+
+The load test plays games AI against AI, every game over its own
+connection, and reports throughput, client-side latencies of "go"
+and the server's own stats. With --local it starts a server in the
+same process on a temporary Unix socket.
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from .engine_server import EngineServer, parse_address
+
+
+__all__ = ['EngineClient', 'EngineError']
+
+
+class EngineError(Exception):
+    pass
+
+
+class EngineClient(object):
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def connect(cls, address):
+        host, port = parse_address(address)
+        if port is None:
+            reader, writer = await asyncio.open_unix_connection(host)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, *words):
+        """Sends a request, returns the words of the response"""
+        self._writer.write((' '.join(map(str, words)) + '\n').encode())
+        await self._writer.drain()
+        line = await self._reader.readline()
+        if not line:
+            raise EngineError('connection closed')
+        response = line.decode().split()
+        if response[0] == 'error':
+            raise EngineError(' '.join(response[1:]))
+        return response
+
+    async def new_session(self, spec, time_limit=None):
+        words = ['new', spec]
+        if time_limit is not None:
+            words.append(time_limit)
+        return (await self.request(*words))[1]
+
+    async def board(self, session):
+        """-> (player, cells), see the protocol"""
+        _, player, cells = await self.request('board', session)
+        return player, cells
+
+    async def move(self, session, row_id, col_id):
+        """-> next player: 'b', 'w' or 'over'"""
+        return (await self.request('move', session, row_id, col_id))[1]
+
+    async def go(self, session):
+        """-> ((row, col), next player)"""
+        _, row_id, col_id, next_player = await self.request('go', session)
+        return (int(row_id), int(col_id)), next_player
+
+    async def close_session(self, session):
+        await self.request('close', session)
+
+    async def stats(self):
+        response = await self.request('stats')
+        return json.loads(' '.join(response[1:]))
+
+    async def close(self):
+        try:
+            await self.request('quit')
+        except (EngineError, ConnectionError):
+            pass
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+async def play_game(address, spec, time_limit=None):
+    """Plays a game AI against AI, returns latencies of its moves"""
+    client = await EngineClient.connect(address)
+    latencies = []
+    try:
+        session = await client.new_session(spec, time_limit)
+        next_player = None
+        while next_player != 'over':
+            start_time = time.perf_counter()
+            _, next_player = await client.go(session)
+            latencies.append(time.perf_counter() - start_time)
+        await client.close_session(session)
+    finally:
+        await client.close()
+    return latencies
+
+
+async def load_test(address, games, spec, time_limit=None):
+    start_time = time.perf_counter()
+    results = await asyncio.gather(
+        *[play_game(address, spec, time_limit) for _ in range(games)],
+        return_exceptions=True)
+    duration = time.perf_counter() - start_time
+    latencies = sorted(latency for result in results
+                       if not isinstance(result, Exception)
+                       for latency in result)
+    errors = [result for result in results if isinstance(result, Exception)]
+    print('{} games in {:.1f} s: {:.2f} games/s, {:.1f} moves/s, {} failed'
+          .format(games, duration, (games - len(errors)) / duration,
+                  len(latencies) / duration, len(errors)))
+    for error in errors[:5]:
+        print('  error: {}'.format(error))
+    if latencies:
+        print('go latency: p50 {:.3f} s, p95 {:.3f} s, max {:.3f} s'.format(
+            latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.95)], latencies[-1]))
+    client = await EngineClient.connect(address)
+    try:
+        print('server: {}'.format(json.dumps(await client.stats(), indent=2)))
+    finally:
+        await client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Engine server load test')
+    parser.add_argument('address', nargs='?',
+                        help='host:port or Unix socket path of the server')
+    parser.add_argument('--local', action='store_true',
+                        help='start a server in this process')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes of the --local server')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--spec', default='material:max_depth=2,'
+                                          'weight_ratio=1.5')
+    parser.add_argument('--time-limit', type=float, default=None)
+    args = parser.parse_args(argv)
+    if not args.local and not args.address:
+        parser.error('an address or --local is required')
+
+    async def run():
+        if not args.local:
+            await load_test(args.address, args.games, args.spec,
+                            args.time_limit)
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            address = os.path.join(tmp_dir, 'engine.sock')
+            server = EngineServer(address, processes=args.processes)
+            await server.start()
+            try:
+                await load_test(address, args.games, args.spec,
+                                args.time_limit)
+            finally:
+                await server.close()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+"""
+Headless engine server: many concurrent games against the AI
+over TCP ("host:port") or a Unix socket (a path).
+
+The protocol is line based, in the spirit of NBoard: a request is
+a line of space separated words, and every request gets exactly one
+response line, in order. Errors are answered with "error <message>".
+
+    new SPEC [TIME_LIMIT]   -> ok SESSION
+        SPEC is an AI spec, e.g. material:max_depth=3,weight_ratio=1.5
+        (see reversi.ai_player.selfplay.parse_ai_spec)
+    board SESSION           -> board PLAYER CELLS
+        PLAYER is b or w, CELLS are 64 of b, w and * row by row
+    move SESSION ROW COL    -> ok NEXT
+        makes a human move; NEXT is b, w or "over"
+    go SESSION              -> move ROW COL NEXT
+        the AI makes a move for the side to move, searching
+        iteratively deeper up to the spec's max_depth for at most
+        90% of the session's time limit
+    close SESSION           -> ok
+    stats                   -> stats JSON
+    quit                    -> ok, and the connection is closed
+
+Sessions belong to their connection and are dropped with it.
+AI moves are computed by a shared process pool. At most `max_pending`
+decisions are queued or running at once, further "go" requests wait
+for a slot, and the connection isn't read meanwhile. A decision that
+still exceeds the session's time limit is answered with "error timeout"
+and keeps its pool slot until the worker finishes it.
+
+Run with:
+    python -m reversi.engine_server ADDRESS [--processes N]
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import collections
+import multiprocessing
+import concurrent.futures
+from .game import Reversi, Player, InvalidMove
+from .records import position_to_masks, game_from_masks
+from .ai_player.selfplay import make_ai
+
+
+__all__ = ['EngineServer', 'LatencyMetrics', 'parse_address']
+
+
+DEFAULT_TIME_LIMIT = 10
+
+
+class RequestError(Exception):
+    pass
+
+
+def parse_address(address):
+    """'host:port' -> (host, port), a path -> (path, None)"""
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address, None
+
+
+class LatencyMetrics(object):
+    """Latencies of the last `window` requests of every command"""
+
+    def __init__(self, window=1000):
+        self._latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=window))
+        self._counts = collections.Counter()
+
+    def add(self, command, latency):
+        self._latencies[command].append(latency)
+        self._counts[command] += 1
+
+    def summary(self):
+        result = {}
+        for command, latencies in self._latencies.items():
+            ordered = sorted(latencies)
+            result[command] = {
+                'count': self._counts[command],
+                'mean': sum(ordered) / len(ordered),
+                'p50': ordered[len(ordered) // 2],
+                'p95': ordered[int(len(ordered) * 0.95)],
+                'max': ordered[-1],
+            }
+        return result
+
+
+class _Session(object):
+
+    def __init__(self, spec, time_limit):
+        self.spec = spec
+        self.time_limit = time_limit
+        self.game = Reversi.New()
+
+
+class EngineServer(object):
+
+    def __init__(self, address, processes=None, max_pending=None,
+                 max_sessions=10000, time_limit=DEFAULT_TIME_LIMIT):
+        self.address = address
+        self.processes = processes or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.processes
+        self.max_sessions = max_sessions
+        self.time_limit = time_limit
+        self.metrics = LatencyMetrics()
+        self.timeouts = 0
+        self._pending = 0
+        self._slots = None
+        self._sessions_count = 0
+        self._session_ids = itertools.count(1)
+        self._pool = None
+        self._server = None
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('fork'))
+        host, port = parse_address(self.address)
+        if port is None:
+            if os.path.exists(host):
+                os.remove(host)
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, host)
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection, host, port)
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        host, port = parse_address(self.address)
+        if port is None and os.path.exists(host):
+            os.remove(host)
+
+    def stats(self):
+        return {
+            'sessions': self._sessions_count,
+            'pending_decisions': self._pending,
+            'max_pending': self.max_pending,
+            'processes': self.processes,
+            'timeouts': self.timeouts,
+            'latency': self.metrics.summary(),
+        }
+
+    async def _handle_connection(self, reader, writer):
+        sessions = {}
+
+        async def respond(response):
+            writer.write((response + '\n').encode())
+            await writer.drain()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # over the stream limit, readline has dropped it
+                    await respond('error line too long')
+                    continue
+                if not line:
+                    break
+                try:
+                    words = line.decode().split()
+                except UnicodeDecodeError:
+                    await respond('error invalid UTF-8')
+                    continue
+                if not words:
+                    continue
+                start_time = time.perf_counter()
+                command, args = words[0], words[1:]
+                try:
+                    response = await self._dispatch(sessions, command, args)
+                except RequestError as e:
+                    response = 'error {}'.format(e)
+                await respond(response)
+                self.metrics.add(command, time.perf_counter() - start_time)
+                if command == 'quit':
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._sessions_count -= len(sessions)
+            writer.close()
+
+    async def _dispatch(self, sessions, command, args):
+        if command == 'new':
+            _check_args(command, args, 1, 2)
+            return self._new_session(sessions, *args)
+        elif command == 'board':
+            _check_args(command, args, 1)
+            return self._board(self._get_session(sessions, args))
+        elif command == 'move':
+            _check_args(command, args, 3)
+            return self._move(self._get_session(sessions, args), *args[1:])
+        elif command == 'go':
+            _check_args(command, args, 1)
+            return await self._go(self._get_session(sessions, args))
+        elif command == 'close':
+            _check_args(command, args, 1)
+            self._get_session(sessions, args)
+            sessions.pop(args[0])
+            self._sessions_count -= 1
+            return 'ok'
+        elif command == 'stats':
+            _check_args(command, args, 0)
+            return 'stats ' + json.dumps(self.stats())
+        elif command == 'quit':
+            _check_args(command, args, 0)
+            return 'ok'
+        raise RequestError('unknown command {}'.format(command))
+
+    def _get_session(self, sessions, args):
+        if not args or args[0] not in sessions:
+            raise RequestError('no such session')
+        return sessions[args[0]]
+
+    def _new_session(self, sessions, spec=None, time_limit=None):
+        if spec is None:
+            raise RequestError('AI spec expected')
+        if self._sessions_count >= self.max_sessions:
+            raise RequestError('too many sessions')
+        try:
+            time_limit = min(float(time_limit or self.time_limit),
+                             self.time_limit)
+            if not time_limit > 0:
+                raise RequestError('time limit must be positive')
+            # making the AI checks the arguments of its factory too,
+            # the workers make their own
+            make_ai(spec, Player.Black, move_limit=time_limit)
+        except (TypeError, ValueError) as e:
+            raise RequestError(str(e))
+        session_id = str(next(self._session_ids))
+        sessions[session_id] = _Session(spec, time_limit)
+        self._sessions_count += 1
+        return 'ok ' + session_id
+
+    def _board(self, session):
+        game = session.game
+        cells = ''.join(cell.value if cell else '*'
+                        for _, cell in game.iter_cells())
+        return 'board {} {}'.format(game.current_player.value, cells)
+
+    def _move(self, session, row_id=None, col_id=None):
+        try:
+            session.game.make_move(int(row_id), int(col_id))
+        except (TypeError, ValueError, InvalidMove):
+            raise RequestError('invalid move')
+        return 'ok ' + _next_player(session.game)
+
+    async def _go(self, session):
+        game = session.game
+        if game.is_game_over:
+            raise RequestError('game over')
+        try:
+            move = await asyncio.wait_for(
+                self._decide(session, game), session.time_limit)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise RequestError('timeout')
+        except Exception as e:
+            raise RequestError('AI failed: {!r}'.format(e))
+        game.make_move(*move)
+        return 'move {} {} {}'.format(move[0], move[1], _next_player(game))
+
+    async def _decide(self, session, game):
+        # waiting for a slot here is the backpressure:
+        # the connection isn't read until the decision is queued
+        await self._slots.acquire()
+        self._pending += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._pool, _decide_in_worker, session.spec, session.time_limit,
+            *position_to_masks(game))
+
+        def release(_):
+            self._pending -= 1
+            self._slots.release()
+        future.add_done_callback(release)
+        # the search stops itself before the time limit, if it's late
+        # anyway the worker can't be interrupted and the slot is kept
+        # until it finishes
+        return await asyncio.shield(future)
+
+
+def _check_args(command, args, min_count, max_count=None):
+    if max_count is None:
+        max_count = min_count
+    if not min_count <= len(args) <= max_count:
+        if min_count == max_count:
+            expected = str(min_count)
+        else:
+            expected = '{} to {}'.format(min_count, max_count)
+        raise RequestError('{} takes {} arguments, got {}'.format(
+            command, expected, len(args)))
+
+
+def _next_player(game):
+    return 'over' if game.is_game_over else game.current_player.value
+
+
+# AIs made in this pool worker, by (spec, time limit, player)
+_worker_ais = {}
+
+
+def _decide_in_worker(spec, time_limit, black, white, side):
+    game = game_from_masks(black, white, side)
+    key = spec, time_limit, game.current_player
+    if key not in _worker_ais:
+        # the time manager stops the search at 90% of the limit
+        _worker_ais[key] = make_ai(spec, game.current_player,
+                                   move_limit=time_limit)
+    return _worker_ais[key](game)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reversi engine server')
+    parser.add_argument('address', help='host:port or Unix socket path')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='AI worker processes, all CPUs by default')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='AI decisions queued or running at once, '
+                             'twice the processes by default')
+    parser.add_argument('--max-sessions', type=int, default=10000)
+    parser.add_argument('--time-limit', type=float,
+                        default=DEFAULT_TIME_LIMIT,
+                        help='upper bound of session time limits, s')
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = EngineServer(args.address, args.processes, args.max_pending,
+                              args.max_sessions, args.time_limit)
+        await server.start()
+        print('serving on {}'.format(args.address))
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from .dependencies import enum
+import enum
 import copy
 from itertools import product
 
@@ -19,11 +19,20 @@ class GameEvent(str, enum.Enum):
     PlayerCannotMove = 'on_cant_move'
     NormalMove = 'on_normal_move'
     GameOver = 'on_game_over'
+    # (row_id, col_id, player, flipped): a move with the list of cells
+    # it reverted, sent once per move when the field is already updated,
+    # after the cells' changes; the list is shared with the game
+    # and must not be changed
+    MoveApplied = 'on_move_applied'
+    # (row_id, col_id, new_player, prev_player) of every changed cell,
+    # sent right after the cell is changed
     CellOwnerChange = 'on_cell_change'
 
 
 class Reversi(object):
 
+    # the default size of the board; a game can have any even size
+    # from 4 on, see the `size` property
     FIELD_SIZE = 8
 
     def __init__(self, player, field, **callbacks):
@@ -40,20 +49,22 @@ class Reversi(object):
                 for cell in row
             ] for row in field
         ]
-        assert len(field) == self.FIELD_SIZE
-        assert all(len(row) == self.FIELD_SIZE for row in field)
+        size = len(field)
+        assert size >= 4 and size % 2 == 0
+        assert all(len(row) == size for row in field)
 
         self._field = field
         self._possible_moves = self._calculate_possible_moves(player)
         self._opponent_moves = self._calculate_possible_moves(player.opponent)
 
     @classmethod
-    def New(cls, **callbacks):
+    def New(cls, size=None, **callbacks):
+        size = size or cls.FIELD_SIZE
         field = [
-            [None for _ in range(cls.FIELD_SIZE)]
-            for _ in range(cls.FIELD_SIZE)
+            [None for _ in range(size)]
+            for _ in range(size)
         ]
-        middle = cls.FIELD_SIZE // 2 - 1
+        middle = size // 2 - 1
         field[middle+1][middle] = field[middle][middle+1] = Player.Black
         field[middle][middle] = field[middle+1][middle+1] = Player.White
         return cls(Player.Black, field, **callbacks)
@@ -76,6 +87,26 @@ class Reversi(object):
             field.append(row)
         return cls(player, field, **callbacks)
 
+    @classmethod
+    def LoadTrusted(cls, player, field, **callbacks):
+        """
+        Same as the constructor, but without validation and copying:
+        `player` must be a Player and `field` a square
+        list of lists of Player or None, owned by the new game from now on.
+        Intended for bulk loading of positions known to be valid.
+        """
+        rev = _copy_helper()
+        rev.__class__ = cls
+        rev._player = player
+        rev.callbacks = {
+            GameEvent(key): val
+            for key, val in callbacks.items()
+        }
+        rev._field = field
+        rev._possible_moves = rev._calculate_possible_moves(player)
+        rev._opponent_moves = rev._calculate_possible_moves(player.opponent)
+        return rev
+
     @property
     def is_game_over(self):
         return not self._possible_moves
@@ -84,6 +115,10 @@ class Reversi(object):
     def current_player(self):
         return self._player
 
+    @property
+    def size(self):
+        return len(self._field)
+
     def iter_cells(self):
         for row_id, row in enumerate(self._field):
             for col_id, cell in enumerate(row):
@@ -103,7 +138,7 @@ class Reversi(object):
         if row_id < 0 or col_id < 0:
             # prevent indexing from end
             # because it gives ability to specify cell in two ways.
-            # our semantics: indices should be strictly within [0..8]
+            # our semantics: indices should be strictly within [0..size)
             raise IndexError
         return self._field[row_id][col_id]
 
@@ -123,46 +158,37 @@ class Reversi(object):
         elif white_cnt > black_cnt:
             return Player.White
 
-    def _set(self, position, player):
-        row_id, col_id = position
-        prev_player = self.get(position)
-        self._field[row_id][col_id] = player
-        self._send_event(GameEvent.CellOwnerChange,
-                         row_id, col_id, player, prev_player)
-
     def _calculate_possible_moves(self, player=None):
-        def _pos_add(pos1, delta, coeff=1):
-            return pos1[0] + coeff*delta[0], pos1[1] + coeff*delta[1]
-        increments = set(product([-1, 0, 1], [-1, 0, 1])) - {(0, 0)}
-
         player = player or self._player
+        opponent = player.opponent
+        field = self._field
+        rays = _rays(len(field))
         result = {}
 
-        for pos, cell in self.iter_cells():
-            if cell is not None:
-                continue
-            total_cells_to_revert = []
-            for inc in increments:
-                cells_to_revert = []
-                step = 0
-                while True:
-                    step += 1
-                    tested_pos = _pos_add(pos, inc, step)
-                    cell_state = self.get(tested_pos)
-                    if cell_state is None:
-                        # we go out from the game field or this cell is empty
-                        cells_to_revert[:] = []
-                        break
-                    elif cell_state == player.opponent:
-                        # we may revert this cell
-                        cells_to_revert.append(tested_pos)
-                    else:
-                        # this cell is ours,
-                        # so we can move from here
+        for row_id, row in enumerate(field):
+            row_rays = rays[row_id]
+            for col_id, cell in enumerate(row):
+                if cell is not None:
+                    continue
+                total_cells_to_revert = []
+                for ray in row_rays[col_id]:
+                    row_, col_ = ray[0]
+                    if field[row_][col_] is not opponent:
+                        continue
+                    for step in range(1, len(ray)):
+                        row_, col_ = ray[step]
+                        cell_state = field[row_][col_]
+                        if cell_state is opponent:
+                            # we may revert this cell
+                            continue
+                        if cell_state is player:
+                            # this cell is ours,
+                            # so we can move from here
+                            total_cells_to_revert.extend(ray[:step])
+                        # otherwise the cell is empty
                         break
-                total_cells_to_revert.extend(cells_to_revert)
-            if total_cells_to_revert:
-                result[pos] = total_cells_to_revert
+                if total_cells_to_revert:
+                    result[row_id, col_id] = total_cells_to_revert
 
         return result
 
@@ -173,13 +199,27 @@ class Reversi(object):
         else:
             return set(self._opponent_moves.keys())
 
+    def get_reverted_cells(self, row_id, col_id):
+        """
+        Cells which the current player's move would revert;
+        the list is shared with the game and must not be changed
+        """
+        return self._possible_moves[row_id, col_id]
+
     def make_move(self, row_id, col_id):
         move_position = row_id, col_id
         if move_position not in self._possible_moves:
             raise InvalidMove
-        self._set(move_position, self._player)
-        for position in self._possible_moves[move_position]:
-            self._set(position, self._player)
+        player = self._player
+        flipped = self._possible_moves[move_position]
+        # search copies have no callbacks and skip the dispatch entirely
+        if self.callbacks:
+            self._apply_move_with_events(row_id, col_id, player, flipped)
+        else:
+            field = self._field
+            field[row_id][col_id] = player
+            for flipped_row_id, flipped_col_id in flipped:
+                field[flipped_row_id][flipped_col_id] = player
 
         moves = self._calculate_possible_moves(self._player.opponent)
         opponent_moves = self._calculate_possible_moves(self._player)
@@ -224,7 +264,7 @@ class Reversi(object):
     def __str__(self):
         h_border = '{0}{1}{0}'.format(
             self.current_player,
-            '-' * (2 * self.FIELD_SIZE + 1)
+            '-' * (2 * self.size + 1)
         )
         lines = [
             '| ' + ' '.join(c or '*' for c in row) + ' |'
@@ -234,6 +274,21 @@ class Reversi(object):
         lines.append(h_border)
         return '\n'.join(lines)
 
+    def _apply_move_with_events(self, row_id, col_id, player, flipped):
+        field = self._field
+        on_cell_change = self.callbacks.get(GameEvent.CellOwnerChange)
+        field[row_id][col_id] = player
+        if on_cell_change is not None:
+            on_cell_change(row_id, col_id, player, None)
+        for flipped_row_id, flipped_col_id in flipped:
+            field[flipped_row_id][flipped_col_id] = player
+            if on_cell_change is not None:
+                # the listener sees the field as it is changed
+                on_cell_change(flipped_row_id, flipped_col_id,
+                               player, player.opponent)
+        self._send_event(GameEvent.MoveApplied,
+                         row_id, col_id, player, flipped)
+
     def _send_event(self, event, *args, **kwargs):
         if event in self.callbacks:
             self.callbacks[event](*args, **kwargs)
@@ -243,6 +298,37 @@ class InvalidMove(Exception):
     pass
 
 
+# rays of every board size: rays[row][col] lists, for every direction,
+# the cells from (row, col) to the edge, if there are at least two of them
+_RAYS = {}
+
+
+def _rays(size):
+    rays = _RAYS.get(size)
+    if rays is None:
+        directions = set(product([-1, 0, 1], [-1, 0, 1])) - {(0, 0)}
+        rays = _RAYS[size] = [
+            [
+                [ray for ray in (
+                    _ray(row_id, col_id, d_row, d_col, size)
+                    for d_row, d_col in sorted(directions)
+                ) if len(ray) >= 2]
+                for col_id in range(size)
+            ]
+            for row_id in range(size)
+        ]
+    return rays
+
+
+def _ray(row_id, col_id, d_row, d_col, size):
+    cells = []
+    row_id, col_id = row_id + d_row, col_id + d_col
+    while 0 <= row_id < size and 0 <= col_id < size:
+        cells.append((row_id, col_id))
+        row_id, col_id = row_id + d_row, col_id + d_col
+    return tuple(cells)
+
+
 def load_from_text_file(filename, **callbacks):
     with open(filename) as f:
         return Reversi.LoadFromText(f.read(), **callbacks)
@@ -1,4 +1,6 @@
-from ..dependencies import tk
+import os
+import queue
+from .dependencies import tk
 from ..game import Reversi, Player
 from .utils import Animator
 from .main_menu_ctl import MainMenuController
@@ -7,7 +9,8 @@ from .game_ctl import GameController
 
 class ReversiApp(object):
 
-    # common parameters
+    # common parameters; cells of other board sizes are scaled
+    # to fit the same field
     CELL_SIZE = 50
     GAME_FIELD_SIZE = CELL_SIZE * Reversi.FIELD_SIZE
     PADDING = 5
@@ -16,6 +19,11 @@ class ReversiApp(object):
 
     def __init__(self, tk_root):
         self._controller = None
+        self._score_items = None
+        self._cell_items = None
+        self._hint_item = None
+        self._board_size = None
+        self._cell_size = self.CELL_SIZE
 
         self._setup_window(tk_root)
         self._tk_root = tk_root
@@ -27,9 +35,12 @@ class ReversiApp(object):
 
         def on_close():
             self._was_closed = True
+            self._close_controller()
             self._tk_root.destroy()
         self._was_closed = False
         tk_root.protocol("WM_DELETE_WINDOW", on_close)
+        self._thread_calls = queue.Queue()
+        self._init_thread_wakeup(tk_root)
 
         root_frame = tk.Frame(tk_root, background=self.BACKGROUND)
         root_frame.pack(expand=1, fill=tk.BOTH)
@@ -98,14 +109,56 @@ class ReversiApp(object):
 
         def on_click(event):
             if hasattr(self._controller, 'on_field_click'):
-                row_id = event.x // self.CELL_SIZE
-                col_id = event.y // self.CELL_SIZE
+                row_id = event.x // self._cell_size
+                col_id = event.y // self._cell_size
+                if row_id >= self._board_size or col_id >= self._board_size:
+                    # the margin of a field not divisible by the size
+                    return
                 self._controller.on_field_click(row_id, col_id)
         field_canvas.bind('<Button-1>', on_click)
 
         return field_canvas
 
+    def _init_thread_wakeup(self, tk_root):
+        # Tk may only be touched from the main thread,
+        # other threads queue calls and wake the event loop through a pipe
+        if hasattr(tk_root.tk, 'createfilehandler'):
+            read_fd, self._wakeup_fd = os.pipe()
+            tk_root.tk.createfilehandler(
+                read_fd, tk.READABLE,
+                lambda fd, mask: self._run_thread_calls(fd))
+        else:
+            # no file handlers in Tk on Windows
+            self._wakeup_fd = None
+            self._poll_thread_calls()
+
+    def _poll_thread_calls(self):
+        self._run_thread_calls()
+        self.delay_apply(20, self._poll_thread_calls)
+
+    def _run_thread_calls(self, wakeup_fd=None):
+        if wakeup_fd is not None:
+            os.read(wakeup_fd, 4096)
+        while True:
+            try:
+                func, args = self._thread_calls.get_nowait()
+            except queue.Empty:
+                return
+            if not self._was_closed:
+                func(*args)
+
+    def call_from_thread(self, func, *args):
+        """Runs func(*args) in the Tk thread, may be called from any thread"""
+        self._thread_calls.put((func, args))
+        if self._wakeup_fd is not None:
+            os.write(self._wakeup_fd, b'x')
+
+    def _close_controller(self):
+        if hasattr(self._controller, 'close'):
+            self._controller.close()
+
     def _setup_controller(self, controller_cls, **kwargs):
+        self._close_controller()
         self._controller = controller_cls(self, **kwargs)
         if hasattr(self._controller, 'initialize'):
             self._controller.initialize()
@@ -120,101 +173,169 @@ class ReversiApp(object):
         self._status_label.configure(text=message)
 
     def display_play_prompt(self):
+        items = self._get_score_items()
         cnv = self._scores_canvas
         cnv_width = cnv.winfo_width()
         cnv_height = cnv.winfo_height()
-        cnv.create_rectangle(
-            0, 0, cnv_width, cnv_height,
-            outline='#000', fill='#FFF', width=5
-        )
-        cnv.create_text(
-            cnv_width//2, cnv_height//2,
-            text='Play', fill='#000'
-        )
+        cnv.coords(items['prompt_rect'], 0, 0, cnv_width, cnv_height)
+        cnv.coords(items['prompt_text'], cnv_width//2, cnv_height//2)
+        self._show_score_items(items, ('prompt_rect', 'prompt_text'))
 
     def update_game_scores(self, black_cnt, white_cnt):
+        items = self._get_score_items()
         cnv = self._scores_canvas
         cnv_width = cnv.winfo_width()
         cnv_height = cnv.winfo_height()
 
-        cnv.create_rectangle(
-            0, 0, cnv_width // 2, cnv_height, fill='#000')
-        cnv.create_text(
-            cnv_width // 4, cnv_height // 2,
-            text=str(black_cnt), fill='#FFF')
-
-        cnv.create_rectangle(
-            cnv_width//2, 0, cnv_width, cnv_height, fill='#FFF')
-        cnv.create_text(
-            3 * cnv_width // 4, cnv_height // 2,
-            text=str(white_cnt), fill='#000')
+        cnv.coords(items['black_rect'], 0, 0, cnv_width // 2, cnv_height)
+        cnv.coords(items['black_text'], cnv_width // 4, cnv_height // 2)
+        cnv.itemconfigure(items['black_text'], text=str(black_cnt))
+
+        cnv.coords(items['white_rect'],
+                   cnv_width//2, 0, cnv_width, cnv_height)
+        cnv.coords(items['white_text'], 3 * cnv_width // 4, cnv_height // 2)
+        cnv.itemconfigure(items['white_text'], text=str(white_cnt))
+        self._show_score_items(items, ('black_rect', 'black_text',
+                                       'white_rect', 'white_text'))
+
+    def _get_score_items(self):
+        # items are created once and then only moved, changed and hidden,
+        # so the canvas doesn't grow during a long session
+        if self._score_items is None:
+            cnv = self._scores_canvas
+            self._score_items = {
+                'prompt_rect': cnv.create_rectangle(
+                    0, 0, 0, 0, outline='#000', fill='#FFF', width=5),
+                'prompt_text': cnv.create_text(
+                    0, 0, text='Play', fill='#000'),
+                'black_rect': cnv.create_rectangle(0, 0, 0, 0, fill='#000'),
+                'black_text': cnv.create_text(0, 0, fill='#FFF'),
+                'white_rect': cnv.create_rectangle(0, 0, 0, 0, fill='#FFF'),
+                'white_text': cnv.create_text(0, 0, fill='#000'),
+            }
+        return self._score_items
+
+    def _show_score_items(self, items, visible_names):
+        for name, item in items.items():
+            self._scores_canvas.itemconfigure(
+                item,
+                state=tk.NORMAL if name in visible_names else tk.HIDDEN
+            )
 
-    def draw_field_background(self):
+    def draw_field_background(self, board_size=Reversi.FIELD_SIZE):
+        if board_size != self._board_size:
+            self._field_canvas.delete(tk.ALL)
+            self._board_size = board_size
+            self._cell_size = self.GAME_FIELD_SIZE // board_size
+            self._create_field_items()
+        # a new board: no discs on it
+        for disc, overlay in self._cell_items.values():
+            self._field_canvas.itemconfigure(disc, state=tk.HIDDEN)
+            self._field_canvas.itemconfigure(overlay, state=tk.HIDDEN)
+        self.hide_hint()
+
+    def _create_field_items(self):
         background = '#262'
         delim_color = '#880'
 
         cnv = self._field_canvas
-        width = cnv.winfo_width()
-        height = cnv.winfo_height()
+        # the canvas may be not laid out yet, but its size is fixed
         cnv.create_rectangle(
-            0, 0, width, height, fill=background,
+            0, 0, self.GAME_FIELD_SIZE, self.GAME_FIELD_SIZE, fill=background,
             outline=delim_color, width=6
         )
 
-        for step in range(1, Reversi.FIELD_SIZE):
-            offset = step * self.CELL_SIZE
+        size = self._board_size
+        for step in range(1, size):
+            offset = step * self._cell_size
             cnv.create_line(0, offset, self.GAME_FIELD_SIZE, offset,
                             fill=delim_color, width=1)
             cnv.create_line(offset, 0, offset, self.GAME_FIELD_SIZE,
                             fill=delim_color, width=1)
 
+        # outline of the cell the AI currently considers best
+        self._hint_item = cnv.create_rectangle(
+            0, 0, 0, 0, outline='#FF0', width=2, state=tk.HIDDEN)
+
+        # every cell has a disc and an overlay for the flip animation
+        self._cell_items = {
+            (row_id, col_id): (
+                cnv.create_oval(0, 0, 0, 0, state=tk.HIDDEN),
+                cnv.create_oval(0, 0, 0, 0, state=tk.HIDDEN),
+            )
+            for row_id in range(size)
+            for col_id in range(size)
+        }
+
+    def show_hint(self, row_id, col_id):
+        x = row_id * self._cell_size
+        y = col_id * self._cell_size
+        self._field_canvas.coords(
+            self._hint_item,
+            x + self.PADDING, y + self.PADDING,
+            x + self._cell_size - self.PADDING,
+            y + self._cell_size - self.PADDING,
+        )
+        self._field_canvas.itemconfigure(self._hint_item, state=tk.NORMAL)
+
+    def hide_hint(self):
+        self._field_canvas.itemconfigure(self._hint_item, state=tk.HIDDEN)
+
+    def _place_oval(self, item, center_x, center_y, size):
+        self._field_canvas.coords(
+            item,
+            center_x-size, center_y-size,
+            center_x+size, center_y+size,
+        )
+
     def show_appear(self, row_id, col_id, player, callback=None):
-        center_x = row_id * self.CELL_SIZE + self.CELL_SIZE // 2
-        center_y = col_id * self.CELL_SIZE + self.CELL_SIZE // 2
+        center_x = row_id * self._cell_size + self._cell_size // 2
+        center_y = col_id * self._cell_size + self._cell_size // 2
         color = '#FFF' if player == Player.White else '#000'
+        disc, overlay = self._cell_items[row_id, col_id]
+        self._field_canvas.itemconfigure(overlay, state=tk.HIDDEN)
+        self._place_oval(disc, center_x, center_y, 0)
+        self._field_canvas.itemconfigure(disc, fill=color, state=tk.NORMAL)
 
         def redraw_cell(cell_size):
-            cell_size = int(cell_size)
-            self._field_canvas.create_oval(
-                center_x-cell_size, center_y-cell_size,
-                center_x+cell_size, center_y+cell_size,
-                fill=color
-            )
+            self._place_oval(disc, center_x, center_y, int(cell_size))
         self._run_animation(
             redraw_cell,
-            0, self.CELL_SIZE//2 - self.PADDING,
+            0, self._cell_size//2 - self.PADDING,
             400, callback
         )
 
     def show_change_owner(self, row_id, col_id, player, callback=None):
-        center_x = row_id * self.CELL_SIZE + self.CELL_SIZE // 2
-        center_y = col_id * self.CELL_SIZE + self.CELL_SIZE // 2
+        center_x = row_id * self._cell_size + self._cell_size // 2
+        center_y = col_id * self._cell_size + self._cell_size // 2
         color = '#FFF' if player == Player.White else '#000'
         opponent_color = '#000' if player == Player.White else '#FFF'
-        full_cell_size = self.CELL_SIZE//2 - self.PADDING
+        full_cell_size = self._cell_size//2 - self.PADDING
+        disc, overlay = self._cell_items[row_id, col_id]
+        self._place_oval(disc, center_x, center_y, full_cell_size)
+        self._field_canvas.itemconfigure(disc, fill=color, state=tk.NORMAL)
+        # the overlay covers the disc until the animation shrinks it
+        self._place_oval(overlay, center_x, center_y, full_cell_size)
+        self._field_canvas.itemconfigure(overlay, fill=opponent_color,
+                                         state=tk.NORMAL)
 
         def redraw_cell(cell_size):
             cell_size = int(cell_size)
-            self._field_canvas.create_oval(
-                center_x-full_cell_size, center_y-full_cell_size,
-                center_x+full_cell_size, center_y+full_cell_size,
-                fill=color
-            )
             if cell_size > 0:
-                self._field_canvas.create_oval(
-                    center_x-cell_size, center_y-cell_size,
-                    center_x+cell_size, center_y+cell_size,
-                    fill=opponent_color
-                )
+                self._place_oval(overlay, center_x, center_y, cell_size)
+                self._field_canvas.itemconfigure(overlay, state=tk.NORMAL)
+            else:
+                self._field_canvas.itemconfigure(overlay, state=tk.HIDDEN)
         self._run_animation(
             redraw_cell,
             full_cell_size, 0,
             400, callback
         )
 
-    def start_game(self, black_ai, white_ai):
+    def start_game(self, black_ai, white_ai, board_size=Reversi.FIELD_SIZE):
         self._setup_controller(
             GameController,
             black_ai=black_ai,
             white_ai=white_ai,
+            board_size=board_size,
         )
@@ -5,7 +5,5 @@ except ImportError:
     import Tkinter as tk
     import tkSimpleDialog as simpledialog
 
-import enum
 
-
-__all__ = ['tk', 'simpledialog', 'enum']
+__all__ = ['tk', 'simpledialog']
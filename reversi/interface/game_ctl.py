@@ -1,19 +1,19 @@
-import time
-import threading
 from ..game import Reversi, Player
-from .utils import CallbackJoiner
+from .utils import CallbackJoiner, make_ai_executor
 
 
 class GameController(object):
 
-    def __init__(self, app, black_ai, white_ai):
+    def __init__(self, app, black_ai, white_ai,
+                 board_size=Reversi.FIELD_SIZE):
         self.app = app
         """@type: reversi.interface.ReversiApp"""
 
         self.game = Reversi.New(
+            board_size,
             on_cant_move=self._on_cant_move,
             on_game_over=self._on_game_over,
-            on_cell_change=self._on_cell_change,
+            on_move_applied=self._on_move_applied,
             on_normal_move=self._on_normal_move,
         )
         self._ai = {
@@ -22,12 +22,15 @@ class GameController(object):
         }
         self._react_on_click = False
         self._joiner = CallbackJoiner(self._on_animation_end)
-        self._ai_thread = None
-        self._ai_move = None
-        self._check_ai_done = lambda: self._check_ai_done_impl()
+        self._executor = None
+        if black_ai is not None or white_ai is not None:
+            self._executor = make_ai_executor(self._ai)
+        self._ai_future = None
+        # highlight the cell the AI currently considers best
+        self.show_best_move = True
 
     def initialize(self):
-        self.app.draw_field_background()
+        self.app.draw_field_background(self.game.size)
         for (row_id, col_id), cell in self.game.iter_cells():
             if cell is not None:
                 # we run animations
@@ -41,6 +44,12 @@ class GameController(object):
         self.app.set_status("{} player's move"
                             .format(self.game.current_player.name))
 
+    def close(self):
+        self._ai_future = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
     def on_field_click(self, row_id, col_id):
         if not self._react_on_click:
             return
@@ -59,14 +68,13 @@ class GameController(object):
             return
         self._begin_move(self.game.current_player)
 
-    def _on_cell_change(self, row_id, col_id, new_player, prev_player):
-        if prev_player is None:
-            method = self.app.show_appear
-        else:
-            method = self.app.show_change_owner
+    def _on_move_applied(self, row_id, col_id, player, flipped):
         self._react_on_click = False
-        method(row_id, col_id, new_player,
-               callback=self._joiner.make_callback())
+        self.app.show_appear(row_id, col_id, player,
+                             callback=self._joiner.make_callback())
+        for flipped_row_id, flipped_col_id in flipped:
+            self.app.show_change_owner(flipped_row_id, flipped_col_id, player,
+                                       callback=self._joiner.make_callback())
 
     def _on_cant_move(self, player):
         self.app.update_game_scores(*self.game.get_scores())
@@ -81,7 +89,7 @@ class GameController(object):
                             .format(next_player.name))
 
     def _on_game_over(self):
-        self._ai_thread = None
+        self._ai_future = None
         self._react_on_click = True
         winner = self.game.get_winner()
         self.app.update_game_scores(*self.game.get_scores())
@@ -96,26 +104,38 @@ class GameController(object):
             # enable clicking at game field and wait for user's decision
             self._react_on_click = True
         else:
-            # block user actions and run AI in background
+            # block user actions and run AI in the worker process
             self._react_on_click = False
-            self._ai_thread = threading.Thread(target=self._ai_worker, args=[ai])
-            self._ai_thread.start()
-            # We should call make_move only in main thread!
-            # This is due to Tkinter's poor thread-safety.
-            # In practice, tk_root.after() may take 20-30 seconds
-            # if called from non-main thread.
-            self.app.delay_apply(5, self._check_ai_done)
+            future = self._executor.submit(
+                player, self.game,
+                on_progress=lambda progress: self.app.call_from_thread(
+                    self._on_search_progress, player, progress),
+            )
+            self._ai_future = future
+            # The future completes in the executor's thread,
+            # but make_move may be called only in main thread
+            # due to Tkinter's poor thread-safety.
+            future.add_done_callback(
+                lambda f: self.app.call_from_thread(self._on_ai_done, f))
 
-    def _ai_worker(self, ai_func):
-        self._ai_move = None
-        time.sleep(0.5)
-        plan = ai_func(self.game)
-        self._ai_move = plan[0]
-
-    def _check_ai_done_impl(self):
-        if self._ai_thread is None:
+    def _on_search_progress(self, player, progress):
+        # thread calls run in order, so the events of a search
+        # always come before its result
+        if self._ai_future is None:
+            # the game was left while the AI was thinking
             return
-        if self._ai_thread.is_alive():
-            self.app.delay_apply(5, self._check_ai_done)
+        status = "{} player's move: depth {}, {} nodes, {:.0f} nodes/s".format(
+            player.name, progress.depth, progress.nodes,
+            progress.nodes_per_second)
+        self.app.set_status(status)
+        if self.show_best_move and progress.best_move is not None:
+            self.app.show_hint(*progress.best_move)
+
+    def _on_ai_done(self, future):
+        if future is not self._ai_future or future.cancelled():
+            # the game was left while the AI was thinking
             return
-        self.game.make_move(*self._ai_move)
+        self._ai_future = None
+        self.app.hide_hint()
+        plan = future.result()
+        self.game.make_move(*plan[0])
@@ -1,6 +1,10 @@
-from ..dependencies import tk, simpledialog, enum
+import enum
+from .dependencies import tk, simpledialog
 from .. import ai_player
-from ..game import Player
+from ..game import Reversi, Player
+
+
+BOARD_SIZES = (6, 8, 10, 12, 16)
 
 
 class MainMenuController(object):
@@ -16,18 +20,26 @@ class MainMenuController(object):
         dialog = PlayerSetupDialog(self.app.get_app_window())
         if not dialog.is_ok:
             return
-        self.app.start_game(dialog.black_ai, dialog.white_ai)
+        self.app.start_game(dialog.black_ai, dialog.white_ai,
+                            dialog.board_size)
 
 
 class PlayerSetupDialog(simpledialog.Dialog):
 
     def __init__(self, app_window):
         self.black_ai, self.white_ai, self.is_ok = None, None, False
+        self.board_size = Reversi.FIELD_SIZE
+        self._board_size = None
         self.black_form, self.white_form = None, None
+        weights = ai_player.load_weights()
+        self._tuned_defaults = {
+            AIType.MaterialAdv: weights.get('material', {}),
+            AIType.PositionAdv: weights.get('positional', {}),
+        }
         simpledialog.Dialog.__init__(self, app_window, 'Game Setup')
 
     def body(self, frame):
-        self.geometry('350x450')
+        self.geometry('350x480')
         self.resizable(width=False, height=False)
 
         tk.Label(frame, text='Black').grid(row=0, column=0, sticky='e')
@@ -50,6 +62,12 @@ class PlayerSetupDialog(simpledialog.Dialog):
         ).grid(row=2, column=1, columnspan=2, sticky='ew')
         self.fill_form(white_form_frame, Player.White, AIType.Player)
 
+        tk.Label(frame, text='Board').grid(row=4, column=0, sticky='e')
+        self._board_size = tk.IntVar(frame, Reversi.FIELD_SIZE)
+        tk.OptionMenu(
+            frame, self._board_size, *BOARD_SIZES
+        ).grid(row=4, column=1, columnspan=2, sticky='ew')
+
         return frame
 
     def fill_form(self, frame, player, ai_type=None, **defaults):
@@ -61,12 +79,14 @@ class PlayerSetupDialog(simpledialog.Dialog):
             widget.destroy()
 
         form_class = FORM_MAP[ai_type]
+        defaults = dict(self._tuned_defaults.get(ai_type, {}), **defaults)
         form = form_class(frame, **defaults)
         setattr(self, player.name.lower()+'_form', form)
 
     def apply(self):
         self.black_ai = self.black_form.get_ai(Player.Black)
         self.white_ai = self.white_form.get_ai(Player.White)
+        self.board_size = self._board_size.get()
         self.is_ok = True
 
 
@@ -96,6 +116,10 @@ class DepthSelectForm(object):
             frame, defaults.get('midgame_depth', 3))
         self._endgame_depth = tk.StringVar(
             frame, defaults.get('endgame_depth', 10))
+        self._game_time = tk.StringVar(
+            frame, defaults.get('game_time', ''))
+        self._increment = tk.StringVar(
+            frame, defaults.get('increment', ''))
 
         use_var_depth = self._use_variable_depth.get()
 
@@ -122,6 +146,12 @@ class DepthSelectForm(object):
             state=tk.NORMAL if use_var_depth else tk.DISABLED)
         self._endgame_depth_entry.grid(row=2, column=3)
 
+        # with a game clock the depth is the deepest iteration
+        tk.Label(frame, text='Game time, s:').grid(row=5, column=0)
+        ValidatedEntry(frame, self._game_time, float).grid(row=5, column=1)
+        tk.Label(frame, text='Increment, s:').grid(row=5, column=2)
+        ValidatedEntry(frame, self._increment, float).grid(row=5, column=3)
+
     def _on_use_var_depth_changed(self):
         # print(new_value)
         if self._use_variable_depth.get():
@@ -142,6 +172,16 @@ class DepthSelectForm(object):
         else:
             return int(self._const_depth.get() or 0)
 
+    def get_clock(self):
+        """Game clock arguments of the AI factories, none without a clock"""
+        game_time = float(self._game_time.get() or 0)
+        if not game_time:
+            return {}
+        return {
+            'game_time': game_time,
+            'increment': float(self._increment.get() or 0),
+        }
+
 
 class MaterialAdvForm(DepthSelectForm):
 
@@ -156,7 +196,9 @@ class MaterialAdvForm(DepthSelectForm):
         return ai_player.material_advantage_ai(
             player=player,
             max_depth=self.get_depth(),
-            weight_ratio=float(self._weight_ratio.get() or 0)
+            weight_ratio=float(self._weight_ratio.get() or 0),
+            probcut=ai_player.load_probcut().get('material'),
+            **self.get_clock()
         )
 
 
@@ -185,6 +227,8 @@ class PositionalAdvForm(DepthSelectForm):
             corner_weight=float(self._corner_weight.get() or 0),
             side_weight=float(self._side_weight.get() or 0),
             insider_ratio=float(self._insider_ratio.get() or 0),
+            probcut=ai_player.load_probcut().get('positional'),
+            **self.get_clock()
         )
 
 
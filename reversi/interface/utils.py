@@ -1,5 +1,10 @@
+import sys
 import time
 import weakref
+import threading
+import collections
+import multiprocessing
+import concurrent.futures
 
 
 class Animator(object):
@@ -112,3 +117,115 @@ class CallbackJoiner(object):
         cb = lambda: self._callback(counter)
         self._call_ids[counter] = cb
         return cb
+
+
+def make_ai_executor(ais):
+    """
+    AIProcessExecutor where processes can be forked safely,
+    AIThreadExecutor elsewhere: Windows has no fork, and forking
+    a process with Tk (Cocoa) initialised is unsafe on macOS
+    """
+    if sys.platform != 'darwin' and \
+            'fork' in multiprocessing.get_all_start_methods():
+        return AIProcessExecutor(ais)
+    return AIThreadExecutor(ais)
+
+
+class AIThreadExecutor(object):
+    """
+    Computes AI decisions in a background thread, with the interface
+    of AIProcessExecutor. The search holds the GIL, so animations
+    may stutter meanwhile.
+    """
+
+    def __init__(self, ais):
+        self._ais = ais
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    def submit(self, player, game, on_progress=None):
+        """on_progress is called from the worker thread"""
+        # the copy drops callbacks of the original game
+        return self._executor.submit(self._ais[player], game.copy(),
+                                     on_progress=on_progress)
+
+    def shutdown(self):
+        # a running search can't be stopped, its result is dropped
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AIProcessExecutor(object):
+    """
+    Computes AI decisions in a separate process, so a deep search
+    doesn't hold the GIL of the Tk thread and animations stay smooth.
+
+    The process is forked with the AI functions already in memory,
+    only games and plans are pickled. submit() returns
+    a concurrent.futures.Future completed from a reader thread.
+    """
+
+    def __init__(self, ais):
+        context = multiprocessing.get_context('fork')
+        # one-way pipes are (reader, writer) pairs
+        child_requests, self._requests = context.Pipe(duplex=False)
+        self._results, child_results = context.Pipe(duplex=False)
+        self._process = context.Process(
+            target=_ai_process, args=(ais, child_requests, child_results),
+            daemon=True,
+        )
+        self._process.start()
+        child_requests.close()
+        child_results.close()
+        self._futures = collections.deque()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def submit(self, player, game, on_progress=None):
+        """
+        on_progress is called from the reader thread
+        with the search progress events of this decision
+        """
+        future = concurrent.futures.Future()
+        self._futures.append((future, on_progress))
+        # the copy drops callbacks of the original game
+        self._requests.send((player, game.copy(), on_progress is not None))
+        return future
+
+    def shutdown(self):
+        # an unfinished search is abandoned, not awaited
+        self._process.terminate()
+        self._process.join()
+        self._requests.close()
+
+    def _read_results(self):
+        while True:
+            try:
+                kind, payload = self._results.recv()
+            except (EOFError, OSError):
+                break
+            future, on_progress = self._futures[0]
+            if kind == 'progress':
+                on_progress(payload)
+                continue
+            self._futures.popleft()
+            if kind == 'plan':
+                future.set_result(payload)
+            else:
+                future.set_exception(payload)
+        while self._futures:
+            self._futures.popleft()[0].cancel()
+
+
+def _ai_process(ais, requests, results):
+    while True:
+        try:
+            player, game, report_progress = requests.recv()
+        except EOFError:
+            return
+        on_progress = None
+        if report_progress:
+            def on_progress(progress):
+                results.send(('progress', progress))
+        try:
+            results.send(('plan', ais[player](game, on_progress=on_progress)))
+        except Exception as e:
+            results.send(('error', e))
@@ -0,0 +1,314 @@
+"""
+Compact binary files of positions and games.
+
+A file starts with a header: magic b'RVSR', format version (uint16),
+board size (uint8) and record kind (uint8), little-endian.
+Then go records of a single kind:
+
+    position  black mask, white mask, side to move (uint8, 0 for
+              black). A mask is a little-endian integer of
+              size * size bits rounded up to whole bytes (uint64 on
+              the 8x8 board, 17 bytes per record); its bit
+              row * size + col is set when the player owns that cell.
+    labelled  position (as above), final disc difference (int8, int16
+              on boards of more than 11x11) and search score (float32,
+              NaN if unknown), both from the point of view of the side
+              to move, 22 bytes on the 8x8 board.
+    game      start position (as above), number of moves (uint8),
+              then a byte row * size + col per move, so boards
+              up to 16x16 only.
+              Passes aren't stored, the engine makes them itself.
+
+Files are written with RecordWriter and read lazily through mmap
+with RecordReader.
+"""
+import mmap
+import struct
+import weakref
+from .game import Reversi, Player
+
+
+__all__ = ['RecordWriter', 'RecordReader',
+           'KIND_POSITIONS', 'KIND_GAMES', 'KIND_LABELLED', 'HEADER_SIZE',
+           'position_to_masks', 'game_from_masks']
+
+
+MAGIC = b'RVSR'
+VERSION = 1
+KIND_POSITIONS = 1
+KIND_GAMES = 2
+KIND_LABELLED = 3
+
+_HEADER = struct.Struct('<4sHBB')
+# the records of fixed size follow the header
+HEADER_SIZE = _HEADER.size
+
+_PLAYER_CODES = {Player.Black: 0, Player.White: 1}
+_CODE_PLAYERS = {0: Player.Black, 1: Player.White}
+
+
+class _Layout(object):
+    """Record structs of a board size"""
+
+    def __init__(self, size):
+        self.size = size
+        self.mask_bytes = (size * size + 7) // 8
+        if self.mask_bytes == 8:
+            mask = 'Q'
+        else:
+            mask = '{}s'.format(self.mask_bytes)
+        diff = 'b' if size * size < 128 else 'h'
+        self.position = struct.Struct('<{0}{0}B'.format(mask))
+        self.labelled = struct.Struct('<{0}{0}B{1}f'.format(mask, diff))
+        # masks other than uint64 are converted from and to bytes
+        self.convert = mask != 'Q'
+
+    def pack_position(self, black, white, side):
+        if self.convert:
+            black = black.to_bytes(self.mask_bytes, 'little')
+            white = white.to_bytes(self.mask_bytes, 'little')
+        return self.position.pack(black, white, side)
+
+    def pack_labelled(self, black, white, side, disc_diff, score):
+        if self.convert:
+            black = black.to_bytes(self.mask_bytes, 'little')
+            white = white.to_bytes(self.mask_bytes, 'little')
+        return self.labelled.pack(black, white, side, disc_diff, score)
+
+    def unpack_all(self, record_struct, data):
+        records = record_struct.iter_unpack(data)
+        if not self.convert:
+            return records
+        return (
+            (int.from_bytes(record[0], 'little'),
+             int.from_bytes(record[1], 'little')) + record[2:]
+            for record in records
+        )
+
+    def unpack_position(self, data, offset):
+        black, white, side = self.position.unpack_from(data, offset)
+        if self.convert:
+            black = int.from_bytes(black, 'little')
+            white = int.from_bytes(white, 'little')
+        return black, white, side
+
+
+_LAYOUTS = {}
+
+
+def _layout(size):
+    if size not in _LAYOUTS:
+        _LAYOUTS[size] = _Layout(size)
+    return _LAYOUTS[size]
+
+
+def position_to_masks(game):
+    black, white = 0, 0
+    size = game.size
+    for (row_id, col_id), cell in game.iter_cells():
+        if cell is Player.Black:
+            black |= 1 << (row_id * size + col_id)
+        elif cell is Player.White:
+            white |= 1 << (row_id * size + col_id)
+    return black, white, _PLAYER_CODES[game.current_player]
+
+
+def game_from_masks(black, white, side, size=Reversi.FIELD_SIZE,
+                    **callbacks):
+    field = []
+    for row_id in range(size):
+        shift = row_id * size
+        row_black = black >> shift
+        row_white = white >> shift
+        field.append([
+            Player.Black if row_black >> col_id & 1
+            else Player.White if row_white >> col_id & 1
+            else None
+            for col_id in range(size)
+        ])
+    return Reversi.LoadTrusted(_CODE_PLAYERS[side], field, **callbacks)
+
+
+class RecordWriter(object):
+    """
+    Appends records of one kind to a new file.
+    Records are packed into a buffer which is written out
+    every `buffer_records` records and on close.
+    All positions must have the same `board_size`.
+    """
+
+    def __init__(self, path, kind=KIND_POSITIONS, buffer_records=4096,
+                 board_size=Reversi.FIELD_SIZE):
+        if kind == KIND_GAMES and board_size > 16:
+            raise ValueError('game records of boards up to 16x16 only')
+        self.kind = kind
+        self.buffer_records = buffer_records
+        self.board_size = board_size
+        self.count = 0
+        self._layout = _layout(board_size)
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, board_size, kind))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write_position(self, game):
+        assert self.kind == KIND_POSITIONS
+        assert game.size == self.board_size
+        self._buffer += self._layout.pack_position(*position_to_masks(game))
+        self._added()
+
+    def write_positions(self, games):
+        for game in games:
+            self.write_position(game)
+
+    def write_labelled(self, game, disc_diff, score=float('nan')):
+        assert self.kind == KIND_LABELLED
+        assert game.size == self.board_size
+        self._buffer += self._layout.pack_labelled(*position_to_masks(game),
+                                                   disc_diff, score)
+        self._added()
+
+    def write_game(self, start_game, moves):
+        """moves: (row, col) of every move made from `start_game`"""
+        assert self.kind == KIND_GAMES
+        assert start_game.size == self.board_size
+        size = self.board_size
+        self._buffer += self._layout.pack_position(
+            *position_to_masks(start_game))
+        self._buffer.append(len(moves))
+        self._buffer += bytes(row_id * size + col_id
+                              for row_id, col_id in moves)
+        self._added()
+
+    def _added(self):
+        self.count += 1
+        self._buffered += 1
+        if self._buffered >= self.buffer_records:
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class RecordReader(object):
+    """
+    Memory-mapped reader of a file made by RecordWriter.
+    Records are decoded only when iterated over, fixed-size ones
+    straight from a view of the map. The reader may be closed with
+    iterators still alive: close releases their views, and they stop
+    (iterators of games raise ValueError).
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        magic, version, size, kind = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError('{} is not a record file'.format(path))
+        if version != VERSION:
+            raise ValueError('unsupported record format version {}'
+                             .format(version))
+        self.kind = kind
+        self.board_size = size
+        self._layout = _layout(size)
+        # iterators holding views of the map, closed by close()
+        self._iterators = weakref.WeakSet()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        if self.kind == KIND_GAMES:
+            return sum(1 for _ in self._iter_game_offsets())
+        return (len(self._mmap) - _HEADER.size) // self._record_struct().size
+
+    @property
+    def record_size(self):
+        """Size of a position or labelled record in bytes"""
+        return self._record_struct().size
+
+    def _record_struct(self):
+        if self.kind == KIND_LABELLED:
+            return self._layout.labelled
+        return self._layout.position
+
+    def _iter_fixed(self, record_struct):
+        iterator = self._iter_view(record_struct)
+        self._iterators.add(iterator)
+        return iterator
+
+    def _iter_view(self, record_struct):
+        end = len(self._mmap) - (len(self._mmap) - _HEADER.size) \
+            % record_struct.size
+        view = memoryview(self._mmap)[_HEADER.size:end]
+        records = self._layout.unpack_all(record_struct, view)
+        try:
+            yield from records
+        finally:
+            # the map can't be closed while the view is exported
+            del records
+            view.release()
+
+    def iter_masks(self):
+        """Yields (black, white, side) of position records"""
+        assert self.kind == KIND_POSITIONS
+        return self._iter_fixed(self._layout.position)
+
+    def iter_labelled(self):
+        """Yields (black, white, side, disc_diff, score) of labelled records"""
+        assert self.kind == KIND_LABELLED
+        return self._iter_fixed(self._layout.labelled)
+
+    def iter_positions(self, **callbacks):
+        for black, white, side in self.iter_masks():
+            yield game_from_masks(black, white, side, self.board_size,
+                                  **callbacks)
+
+    def iter_games(self, **callbacks):
+        """Yields (start game, [(row, col), ...]) of game records"""
+        size = self.board_size
+        position_size = self._layout.position.size
+        for offset, moves_cnt in self._iter_game_offsets():
+            start = game_from_masks(
+                *self._layout.unpack_position(self._mmap, offset), size,
+                **callbacks)
+            moves_offset = offset + position_size + 1
+            moves = [
+                divmod(cell, size)
+                for cell in self._mmap[moves_offset:moves_offset + moves_cnt]
+            ]
+            yield start, moves
+
+    def _iter_game_offsets(self):
+        assert self.kind == KIND_GAMES
+        position_size = self._layout.position.size
+        offset = _HEADER.size
+        end = len(self._mmap)
+        while offset + position_size < end:
+            moves_cnt = self._mmap[offset + position_size]
+            yield offset, moves_cnt
+            offset += position_size + 1 + moves_cnt
+
+    def close(self):
+        for iterator in list(self._iterators):
+            iterator.close()
+        self._mmap.close()
+        self._file.close()
@@ -1,14 +1,27 @@
-from reversi.ai_player import evolution
+from reversi.ai_player import evolution, tournament, match_cache, optimizers
+from reversi.ai_player.evolution_log import EvolutionLog
+from reversi.ai_player.remote import MatchServer, spawn_local_workers
 from reversi import ai_player
+import argparse
 import itertools
+import os
 
 
-def make_ai(player, individual):
+def make_ai(player, individual, clock=None, endgame_cache=None,
+            probcut=None):
+    # the options come with the game, see evolution.make_ais:
+    # a remote worker doesn't share the environment of the coordinator
+    endgame_cache = endgame_cache and \
+        ai_player.load_endgame_cache(endgame_cache)
+    probcuts = ai_player.load_probcut(probcut) if probcut else {}
     if hasattr(individual, 'weight_ratio'):
         return ai_player.material_advantage_ai(
             player,
             max_depth=make_depth(individual),
             weight_ratio=individual.weight_ratio,
+            endgame_cache=endgame_cache,
+            probcut=probcuts.get('material'),
+            **clock_kwargs(clock)
         )
     else:
         return ai_player.positional_advantage_ai(
@@ -16,10 +29,32 @@ def make_ai(player, individual):
             max_depth=make_depth(individual),
             corner_weight=individual.corner_weight,
             side_weight=individual.side_weight,
-            insider_ratio=individual.insider_ratio
+            insider_ratio=individual.insider_ratio,
+            endgame_cache=endgame_cache,
+            probcut=probcuts.get('positional'),
+            **clock_kwargs(clock)
         )
 
 
+def parse_clock(spec):
+    """
+    (total, increment) of the game clock 'TOTAL[+INCREMENT]'
+    in seconds; None if `spec` is empty
+    """
+    if not spec:
+        return None
+    total, _, increment = spec.partition('+')
+    return float(total), float(increment or 0)
+
+
+def clock_kwargs(clock):
+    # with a clock the depth genes are the deepest iterations
+    if clock is None:
+        return {}
+    return {'game_time': clock[0], 'increment': clock[1],
+            'move_limit': evolution.MOVE_TIME_LIMIT}
+
+
 def make_depth(individual):
     if hasattr(individual, 'max_depth'):
         return individual.max_depth
@@ -65,9 +100,179 @@ ai_factories = {
     ind.type_name(): make_ai
     for ind in initial_population
 }
-evolution.run_evolution(
-    population=initial_population,
-    population_size=10,
-    ai_factories=ai_factories,
-    max_generations=10,
-)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scheduler', default=tournament.RoundRobin.Name,
+                        choices=sorted(tournament.SCHEDULERS))
+    parser.add_argument('--compare-schedulers', action='store_true',
+                        help='compare tournament schedulers on the initial '
+                             'population against the full round-robin')
+    parser.add_argument('--compare-optimizers', action='store_true',
+                        help='evolve the initial population with every '
+                             'optimizer from the same seed and score '
+                             'their best individuals against it')
+    parser.add_argument('--generations', type=int, default=10)
+    parser.add_argument('--match-cache', metavar='PATH',
+                        help='SQLite file with results of games '
+                             'already played, shared between runs')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='file to store the population after '
+                             'every generation')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the run saved in --checkpoint')
+    parser.add_argument('--timing', default='cpu',
+                        choices=sorted(evolution.TIMING_METRICS),
+                        help='move cost used in the fitness: wall-clock '
+                             'time, thread CPU time or searched nodes')
+    parser.add_argument('--log', metavar='PATH',
+                        help='JSON lines log of every game and generation')
+    parser.add_argument('--adjudicate', action='store_true',
+                        help='stop games whose result is already settled')
+    parser.add_argument('--solve-empties', type=int, default=8,
+                        help='solve the game exactly with this many '
+                             'empty cells left (0 disables)')
+    parser.add_argument('--adjudication-margin', type=float, default=0.9)
+    parser.add_argument('--adjudication-plies', type=int, default=6,
+                        help='for how many moves both players must agree '
+                             'on the margin (0 disables)')
+    parser.add_argument('--endgame-cache', metavar='PATH',
+                        help='exact endgame results file shared by the AIs '
+                             'and the adjudication, also taken from '
+                             'REVERSI_ENDGAME_CACHE')
+    parser.add_argument('--probcut', metavar='PATH',
+                        help='ProbCut parameters of the AIs, see '
+                             'reversi.ai_player.probcut, also taken from '
+                             'REVERSI_PROBCUT')
+    parser.add_argument('--game-clock', metavar='TOTAL[+INCREMENT]',
+                        help='play with a game clock, in seconds, also '
+                             'taken from REVERSI_GAME_CLOCK')
+    parser.add_argument('--board-size', type=int, default=8,
+                        help='an even number of at least 4')
+    parser.add_argument('--optimizer', default=optimizers.CrossoverOptimizer.Name,
+                        choices=sorted(optimizers.OPTIMIZERS))
+    parser.add_argument('--offspring', type=int, default=4,
+                        help='offspring per individual type for --optimizer=es')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='send games to remote workers connected to '
+                             'host:port or a Unix socket path')
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help='start this many workers on this host '
+                             '(requires --serve)')
+    args = parser.parse_args()
+    if args.local_workers and not args.serve:
+        parser.error('--local-workers requires --serve')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requires --checkpoint')
+    if args.board_size < 4 or args.board_size % 2:
+        parser.error('--board-size must be an even number of at least 4')
+
+    # read here and sent with every game, to the remote workers too
+    endgame_cache = args.endgame_cache or \
+        os.environ.get('REVERSI_ENDGAME_CACHE')
+    probcut = args.probcut or os.environ.get('REVERSI_PROBCUT')
+    game_clock = args.game_clock or os.environ.get('REVERSI_GAME_CLOCK')
+    try:
+        clock = parse_clock(game_clock)
+    except ValueError:
+        parser.error('invalid --game-clock {!r}'.format(game_clock))
+    ai_options = {'endgame_cache': endgame_cache, 'probcut': probcut}
+
+    cache = None
+    if args.match_cache:
+        version = match_cache.code_version(extra_files=[__file__])
+        if endgame_cache:
+            # the AIs play exact endgames with the cache
+            version += '+endgame-cache'
+        if probcut:
+            # the AIs prune by the parameters of the file
+            version += '+probcut'
+        if args.board_size != 8:
+            version += '+board{}'.format(args.board_size)
+        # the games are isolated with the default move time limit
+        version += '+limit{}+timing-{}'.format(evolution.MOVE_TIME_LIMIT,
+                                                args.timing)
+        if args.adjudicate:
+            version += '+adjudicate{}/{}/{}'.format(
+                args.solve_empties, args.adjudication_margin,
+                args.adjudication_plies)
+        # games with a clock aren't cached at all, see calc_scores
+        cache = match_cache.MatchCache(args.match_cache, version)
+
+    if args.compare_schedulers:
+        evolution.compare_schedulers(
+            initial_population, ai_factories,
+            [cls() for name, cls in sorted(tournament.SCHEDULERS.items())
+             if name != tournament.RoundRobin.Name],
+            ai_options=ai_options,
+        )
+        return
+
+    if args.compare_optimizers:
+        optimizers.compare_optimizers(
+            initial_population, ai_factories,
+            [optimizers.EvolutionStrategy(offspring=args.offspring)
+             if name == optimizers.EvolutionStrategy.Name else cls()
+             for name, cls in sorted(optimizers.OPTIMIZERS.items())],
+            reference=initial_population,
+            population_size=10,
+            max_generations=args.generations,
+            scheduler=tournament.SCHEDULERS[args.scheduler](),
+            timing=args.timing,
+            clock=clock,
+            board_size=args.board_size,
+            ai_options=ai_options,
+        )
+        return
+
+    if args.optimizer == optimizers.EvolutionStrategy.Name:
+        optimizer = optimizers.EvolutionStrategy(offspring=args.offspring)
+    else:
+        optimizer = optimizers.OPTIMIZERS[args.optimizer]()
+
+    population, start_generation = initial_population, 0
+    if args.resume:
+        start_generation, population, _ = \
+            evolution.load_checkpoint(args.checkpoint, optimizer)
+
+    match_server = None
+    workers = []
+    if args.serve:
+        match_server = MatchServer(args.serve)
+        workers = spawn_local_workers(args.serve, args.local_workers,
+                                      'run_evolution:ai_factories')
+    try:
+        evolution.run_evolution(
+            population=population,
+            population_size=10,
+            ai_factories=ai_factories,
+            max_generations=args.generations,
+            scheduler=tournament.SCHEDULERS[args.scheduler](),
+            match_cache=cache,
+            checkpoint_path=args.checkpoint,
+            start_generation=start_generation,
+            timing=args.timing,
+            game_log=EvolutionLog(args.log) if args.log else None,
+            adjudication=evolution.Adjudication(
+                solve_empties=args.solve_empties,
+                margin=args.adjudication_margin,
+                plies=args.adjudication_plies,
+                endgame_cache=endgame_cache,
+            ) if args.adjudicate else None,
+            optimizer=optimizer,
+            match_runner=match_server,
+            clock=clock,
+            board_size=args.board_size,
+            ai_options=ai_options,
+        )
+    finally:
+        if match_server is not None:
+            match_server.close()
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+from reversi.ai_player.selfplay import SelfPlayConfig, run_selfplay
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate labelled positions by self-play')
+    parser.add_argument('output_dir',
+                        help='directory of chunks; an interrupted run '
+                             'continues when started with the same options')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--ai1', default='material:max_depth=2,weight_ratio=1.5',
+                        help='AI spec: material|positional:key=value,...')
+    parser.add_argument('--ai2', default='positional:max_depth=2,'
+                                         'corner_weight=5,side_weight=2,'
+                                         'insider_ratio=0.5')
+    parser.add_argument('--label-ai', default=None,
+                        help='spec of an AI whose search value labels '
+                             'positions in addition to the game result')
+    parser.add_argument('--opening-plies', type=int, default=8,
+                        help='random moves at the start of every game')
+    parser.add_argument('--games-per-chunk', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--board-size', type=int, default=8,
+                        help='an even number of at least 4')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='pool size, all CPUs by default')
+    args = parser.parse_args()
+    if args.board_size < 4 or args.board_size % 2:
+        parser.error('--board-size must be an even number of at least 4')
+
+    config = SelfPlayConfig(
+        ai1=args.ai1, ai2=args.ai2, games=args.games,
+        games_per_chunk=args.games_per_chunk,
+        opening_plies=args.opening_plies,
+        label_ai=args.label_ai, seed=args.seed,
+        board_size=args.board_size,
+    )
+    run_selfplay(config, args.output_dir, processes=args.processes)
+
+
+if __name__ == '__main__':
+    main()